@@ -0,0 +1,1342 @@
+#!/usr/bin/env python3
+"""
+Micro benchmarks for the batched kernels used by the push wrappers.
+Every benchmark compares the kernel against the implementation it replaced and prints the max deviation.
+Isaac Gym is not required, all inputs are synthetic.
+
+Usage (from the repository root):
+    python helpers/benchmark.py --list
+    python helpers/benchmark.py egocentric_obs --device cuda:0
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from copy import deepcopy
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BENCHMARKS = {}
+
+
+def register(name):
+    def decorator(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return decorator
+
+
+def timeit(fn, device, iters=100, warmup=10):
+    """Return the average wall time of fn() in seconds"""
+    for _ in range(warmup):
+        fn()
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize(device)
+    t0 = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - t0) / iters
+
+
+def report(name, legacy_s, new_s, max_err=None):
+    line = f"{name:<36} legacy {1.0 / legacy_s:>10.1f} it/s | new {1.0 / new_s:>10.1f} it/s | speedup {legacy_s / new_s:>6.2f}x"
+    if max_err is not None:
+        line += f" | max err {max_err:.2e}"
+    print(line)
+
+
+# ---------------------------------------------------------------------------
+# egocentric observation (Go1PushMidWrapper.reset / step)
+# ---------------------------------------------------------------------------
+
+def legacy_egocentric_obs(num_envs, num_agents, base_pos, base_rpy, box_pos, box_rpy, target_pos, target_rpy, general_dist):
+    """ The per-agent loop previously inlined in Go1PushMidWrapper.reset() and .step() """
+    def normalize_rpy(rpy):
+        return rpy % (2 * torch.pi)
+
+    base_pos = deepcopy(base_pos)
+    base_rpy = deepcopy(base_rpy)
+    box_pos = box_pos.repeat_interleave(num_agents, dim=0)
+    target_pos = target_pos.repeat_interleave(num_agents, dim=0)
+    box_rpy = box_rpy.repeat_interleave(num_agents, dim=0)
+    target_rpy = target_rpy.repeat_interleave(num_agents, dim=0)
+    rotated_box_pos = torch.stack([(box_pos[:, 0] - base_pos[:, 0]) * torch.cos(-base_rpy[:, 2]) - (box_pos[:, 1] - base_pos[:, 1]) * torch.sin(-base_rpy[:, 2]),
+                                   (box_pos[:, 0] - base_pos[:, 0]) * torch.sin(-base_rpy[:, 2]) + (box_pos[:, 1] - base_pos[:, 1]) * torch.cos(-base_rpy[:, 2]),
+                                   box_pos[:, 2]], dim=1)
+    rotated_target_pos = torch.stack([(target_pos[:, 0] - base_pos[:, 0]) * torch.cos(-base_rpy[:, 2]) - (target_pos[:, 1] - base_pos[:, 1]) * torch.sin(-base_rpy[:, 2]),
+                                      (target_pos[:, 0] - base_pos[:, 0]) * torch.sin(-base_rpy[:, 2]) + (target_pos[:, 1] - base_pos[:, 1]) * torch.cos(-base_rpy[:, 2]),
+                                      target_pos[:, 2]], dim=1)
+    rotated_box_rpy = deepcopy(box_rpy)
+    rotated_box_rpy[:, 2] = box_rpy[:, 2] - base_rpy[:, 2]
+    rotated_box_rpy = normalize_rpy(rotated_box_rpy)
+    rotated_target_rpy = deepcopy(target_rpy)
+    rotated_target_rpy[:, 2] = target_rpy[:, 2] - base_rpy[:, 2]
+    rotated_target_rpy = normalize_rpy(rotated_target_rpy)
+    rotated_box_pos = rotated_box_pos.reshape([num_envs, num_agents, -1])
+    rotated_box_rpy = rotated_box_rpy.reshape([num_envs, num_agents, -1])
+    rotated_target_pos = rotated_target_pos.reshape([num_envs, num_agents, -1])
+    rotated_target_rpy = rotated_target_rpy.reshape([num_envs, num_agents, -1])
+
+    base_pos = base_pos.reshape([num_envs, num_agents, -1])
+    base_rpy = base_rpy.reshape([num_envs, num_agents, -1])
+    base_info = torch.cat([base_pos, base_rpy], dim=2)
+    all_base_info = []
+    for i in range(1, num_agents):
+        other_base_info = deepcopy(torch.roll(base_info, i, dims=1))
+        other_base_pos = torch.stack([(other_base_info[:, :, 0] - base_pos[:, :, 0]) * torch.cos(-base_rpy[:, :, 2]) - (other_base_info[:, :, 1] - base_pos[:, :, 1]) * torch.sin(-base_rpy[:, :, 2]),
+                                      (other_base_info[:, :, 0] - base_pos[:, :, 0]) * torch.sin(-base_rpy[:, :, 2]) + (other_base_info[:, :, 1] - base_pos[:, :, 1]) * torch.cos(-base_rpy[:, :, 2]),
+                                      other_base_info[:, :, 2]], dim=2)
+        other_base_rpy = deepcopy(other_base_info[:, :, 3:6])
+        other_base_rpy[:, :, 2] = other_base_info[:, :, 5] - base_rpy[:, :, 2]
+        other_base_rpy = normalize_rpy(other_base_rpy)
+        all_base_info.append(torch.cat([other_base_pos[:, :, :2], other_base_rpy[:, :, 2].unsqueeze(2)], dim=2))
+    target = [rotated_target_pos[:, :, :2]]
+    if general_dist:
+        target.append(rotated_target_rpy[:, :, 2].unsqueeze(2))
+    return torch.cat(target + [rotated_box_pos[:, :, :2], rotated_box_rpy[:, :, 2].unsqueeze(2)] + all_base_info, dim=2)
+
+
+@register("egocentric_obs")
+def bench_egocentric_obs(args):
+    from mqe.envs.wrappers.utils.egocentric_obs import EgocentricObservation
+
+    for general_dist in (False, True):
+        for num_envs in args.num_envs:
+            num_agents = args.num_agents
+            base_pos = torch.randn(num_envs * num_agents, 3, device=args.device)
+            base_rpy = torch.rand(num_envs * num_agents, 3, device=args.device) * 2 * torch.pi
+            box_pos = torch.randn(num_envs, 3, device=args.device)
+            box_rpy = torch.rand(num_envs, 3, device=args.device) * 2 * torch.pi
+            target_pos = torch.randn(num_envs, 3, device=args.device)
+            target_rpy = torch.rand(num_envs, 3, device=args.device) * 2 * torch.pi
+
+            builder = EgocentricObservation(num_envs, num_agents, include_target_yaw=general_dist, device=args.device)
+
+            def legacy():
+                return legacy_egocentric_obs(num_envs, num_agents, base_pos, base_rpy, box_pos, box_rpy, target_pos, target_rpy, general_dist)
+
+            def new():
+                return builder.compute(base_pos.view(num_envs, num_agents, 3), base_rpy.view(num_envs, num_agents, 3)[:, :, 2],
+                                       box_pos, box_rpy[:, 2], target_pos, target_rpy[:, 2])
+
+            # yaw differences live on a circle, compare them modulo 2*pi
+            diff = (legacy() - new()).abs()
+            diff = torch.minimum(diff, (2 * torch.pi - diff).abs())
+            report(f"envs={num_envs} agents={num_agents} general={general_dist}",
+                   timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), diff.max().item())
+
+
+# ---------------------------------------------------------------------------
+# mid-level reward terms (Go1PushMidWrapper.step)
+# ---------------------------------------------------------------------------
+
+class PlanarDist:
+    """ Stand-in for dist_calculator with general_dist disabled (avoids importing isaacgym) """
+    def cal_dist(self, current_box_state, target_box_state):
+        return torch.norm((current_box_state[:, 0:2] - target_box_state[:, 0:2]).float(), dim=1)
+
+
+def legacy_calc_normal_vector_for_obc_reward(vertex_list, pos_tensor):
+    """ The normal lookup previously used by the OCB reward, rebuilt the polygon on every call """
+    device = pos_tensor.device
+    vertices = torch.tensor(vertex_list, device=device).float()
+
+    edges = torch.roll(vertices, -1, dims=0) - vertices
+    vp = pos_tensor[:, None, :] - vertices[None, :, :]
+
+    edges_expanded = edges[None, :, :].repeat(pos_tensor.shape[0], 1, 1)
+    edge_lengths = torch.norm(edges_expanded, dim=2, keepdim=True)
+    edge_unit = edges_expanded / edge_lengths
+    edge_normals = torch.stack([-edge_unit[:,:,1], edge_unit[:,:,0]], dim=2)
+
+    cross_prod = torch.abs(vp[:,:,0] * edge_unit[:,:,1] - vp[:,:,1] * edge_unit[:,:,0])
+    dot_product1 = (vp * edges_expanded).sum(dim=2)
+    dot_product2 = (torch.roll(vp, -1, dims=1) * edges_expanded).sum(dim=2)
+
+    on_segment = (dot_product1 >= 0) & (dot_product2 <= 0)
+    dist_to_line = torch.where(on_segment, cross_prod, torch.tensor(float('inf'), device=device))
+
+    dist_to_vertex1 = torch.norm(vp, dim=2)
+    dist_to_vertex2 = torch.norm(pos_tensor[:, None, :] - torch.roll(vertices, -1, dims=0)[None, :, :], dim=2)
+
+    min_dist_each_edge, indices = torch.min(torch.stack([dist_to_line, dist_to_vertex1, dist_to_vertex2], dim=-1), dim=2)
+    min_dist, indices = torch.min(min_dist_each_edge,dim=1)
+    selected_normals = edge_normals[0][indices]
+
+    return selected_normals
+
+
+def legacy_mid_rewards(scales, num_envs, num_agents, vertex_list, state):
+    """ The per-agent / per-pair loops previously inlined in Go1PushMidWrapper.step() """
+    import numpy as np
+
+    def rotation_matrix_2D(theta):
+        theta = theta.float()
+        return torch.stack([torch.stack([torch.cos(theta), -torch.sin(theta)], dim=1),
+                            torch.stack([torch.sin(theta), torch.cos(theta)], dim=1)], dim=1)
+
+    base_pos, box_pos, target_pos = state["base_pos"], state["box_pos"], state["target_pos"]
+    box_yaw = state["box_yaw"]
+    reward = torch.zeros([num_envs, num_agents], device=base_pos.device)
+    logs = {}
+    if scales["reach_target_reward_scale"] != 0:
+        reward[state["finished_buf"], :] += scales["reach_target_reward_scale"]
+        logs["reach_target_reward"] = scales["reach_target_reward_scale"] * state["finished_buf"].sum().item()
+    if scales["exception_punishment_scale"] != 0:
+        reward[state["exception_buf"], :] += scales["exception_punishment_scale"]
+        reward[state["value_exception_buf"], :] += scales["exception_punishment_scale"]
+        logs["exception_punishment"] = scales["exception_punishment_scale"] * (state["exception_buf"].sum().item() + state["value_exception_buf"].sum().item())
+    if scales["target_reward_scale"] != 0:
+        past_distance = PlanarDist().cal_dist(state["last_box_state"], state["target_state"])
+        distance = PlanarDist().cal_dist(state["box_state"], state["target_state"])
+        distance_reward = scales["target_reward_scale"] * 100 * (2 * (past_distance - distance) - 0.01 * distance)
+        reward[:, :] += distance_reward.unsqueeze(1).repeat(1, num_agents)
+        logs["distance_to_target_reward"] = torch.sum(distance_reward).cpu()
+    if scales["approach_reward_scale"] != 0:
+        reward_logger = []
+        for i in range(num_agents):
+            distance = torch.norm(box_pos - base_pos[:, i, :], dim=1, keepdim=True)
+            distance_reward = (-(distance + 0.5)**2) * scales["approach_reward_scale"]
+            reward_logger.append(torch.sum(distance_reward).cpu())
+            reward[:, i] += distance_reward.squeeze(-1)
+        logs["approach_to_box_reward"] = np.sum(np.array(reward_logger))
+    if scales["collision_punishment_scale"] != 0:
+        punishment_logger = []
+        for i in range(num_agents):
+            for j in range(i + 1, num_agents):
+                distance = torch.norm(base_pos[:, i, :] - base_pos[:, j, :], dim=1, keepdim=True)
+                collsion_punishment = (1 / (0.02 + distance / 3)) * scales["collision_punishment_scale"]
+                punishment_logger.append(torch.sum(collsion_punishment).cpu())
+                reward[:, i] += collsion_punishment.squeeze(-1)
+                reward[:, j] += collsion_punishment.squeeze(-1)
+        logs["collision_punishment"] = np.sum(np.array(punishment_logger))
+    if scales["push_reward_scale"] != 0:
+        push_reward = torch.zeros((num_envs,), device=base_pos.device)
+        push_reward[torch.norm(state["box_state"][:, 7:9], dim=1) > 0.1] = scales["push_reward_scale"]
+        reward[:, :] += push_reward.unsqueeze(1).repeat(1, num_agents)
+        logs["push_reward"] = torch.sum(push_reward).cpu()
+    if scales["ocb_reward_scale"] != 0:
+        target_direction = (target_pos[:, :2] - box_pos[:, :2]) / (torch.norm((target_pos[:, :2] - box_pos[:, :2]), dim=1, keepdim=True))
+        reward_logger = []
+        for i in range(num_agents):
+            gf_pos = base_pos[:, i, :2] - box_pos[:, :2]
+            rotation_matrix = rotation_matrix_2D(-box_yaw)
+            box_relative_pos = torch.bmm(rotation_matrix, gf_pos.unsqueeze(2)).squeeze(2)
+            normal_vector = legacy_calc_normal_vector_for_obc_reward(vertex_list, box_relative_pos)
+            rotation_matrix = rotation_matrix_2D(box_yaw)
+            normal_vector = torch.bmm(rotation_matrix, normal_vector.unsqueeze(2)).squeeze(2)
+            ocb_reward = torch.sum(target_direction * normal_vector, dim=1) * scales["ocb_reward_scale"]
+            reward[:, i] += ocb_reward
+            reward_logger.append(torch.sum(ocb_reward).cpu())
+        logs["ocb_reward"] = np.sum(np.array(reward_logger))
+    return reward, logs
+
+
+@register("mid_rewards")
+def bench_mid_rewards(args):
+    from mqe.envs.wrappers.utils.mid_rewards import MidRewardEngine
+
+    # default scales of go1_push_mid_config.py
+    scales = dict(target_reward_scale=0.00325, approach_reward_scale=0.00075, collision_punishment_scale=-0.0025,
+                  push_reward_scale=0.0015, ocb_reward_scale=0.004, reach_target_reward_scale=10, exception_punishment_scale=-5)
+    vertex_list = [[-0.60, -0.60], [0.60, -0.60], [0.60, 0.60], [-0.60, 0.60]]
+    num_envs = args.num_envs[-1]
+    for num_agents in (2, 4, 8):
+        box_state = torch.randn(num_envs, 13, device=args.device)
+        state = dict(
+            base_pos=torch.randn(num_envs, num_agents, 3, device=args.device) * 2,
+            box_pos=box_state[:, :3],
+            box_yaw=torch.rand(num_envs, device=args.device) * 2 * torch.pi,
+            target_pos=torch.randn(num_envs, 3, device=args.device) * 3,
+            box_state=box_state,
+            last_box_state=box_state + 0.01 * torch.randn_like(box_state),
+            target_state=torch.randn(num_envs, 13, device=args.device),
+            finished_buf=torch.rand(num_envs, device=args.device) < 0.1,
+            exception_buf=torch.rand(num_envs, device=args.device) < 0.1,
+            value_exception_buf=torch.rand(num_envs, device=args.device) < 0.1,
+        )
+        state["target_yaw"] = torch.zeros(num_envs, device=args.device)
+        engine = MidRewardEngine(scales, num_envs, num_agents, vertex_list, dist_calculator=PlanarDist(), device=args.device)
+
+        def legacy():
+            return legacy_mid_rewards(scales, num_envs, num_agents, vertex_list, state)
+
+        def new():
+            return engine.compute(**state)
+
+        legacy_reward, legacy_logs = legacy()
+        new_reward, new_logs = new()
+        max_err = (legacy_reward - new_reward).abs().max().item()
+        for name, value in new_logs.items():
+            max_err = max(max_err, abs(float(legacy_logs[name]) - value.item()) / num_envs)
+        report(f"envs={num_envs} agents={num_agents}",
+               timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), max_err)
+
+
+# ---------------------------------------------------------------------------
+# nearest edge normal of the pushed object (OCB reward)
+# ---------------------------------------------------------------------------
+
+# vertex lists of task/cuboid, task/Tblock and task/cylinder config.py
+VERTEX_LISTS = {
+    "cuboid": [[-0.60, -0.60], [0.60, -0.60], [0.60, 0.60], [-0.60, 0.60]],
+    "Tblock": [[-0.50, -0.25], [0.50, -0.25], [0.25, 0.75], [-0.25, 0.75]],
+    "cylinder": [[-0.75, -1.30], [0.75, -1.30], [1.50, 0.00], [0.75, 1.30], [-0.75, 1.30], [-1.50, 0.00]],
+}
+
+
+@register("polygon_normal")
+def bench_polygon_normal(args):
+    from mqe.envs.wrappers.utils.polygon import PolygonGeometry
+
+    for shape, vertex_list in VERTEX_LISTS.items():
+        polygon = PolygonGeometry(vertex_list, device=args.device)
+        for num_envs in args.num_envs:
+            points = torch.randn(num_envs * args.num_agents, 2, device=args.device) * 2
+
+            def legacy():
+                return legacy_calc_normal_vector_for_obc_reward(vertex_list, points)
+
+            def new():
+                return polygon.nearest_normal(points)
+
+            report(f"{shape} points={points.shape[0]}",
+                   timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), (legacy() - new()).abs().max().item())
+
+
+def check_polygon_sdf(polygon, sdf, points, max_normal_outliers=0.05):
+    """ Assert the grid lookup against the exact PolygonGeometry: the signed distance of the points inside the grid
+    within one cell (bilinear interpolation of a 1-Lipschitz field), a normal error > 0.1 for at most
+    max_normal_outliers of the points (normals are discontinuous across the medial axis, the blend there is expected).
+    Returns (max distance error, mean normal error, normal outlier fraction)
+    """
+    exact_dist, exact_normal = polygon.signed_distance(points), polygon.nearest_normal(points)
+    grid_dist, grid_normal = sdf.signed_distance(points), sdf.nearest_normal(points)
+    cell = (points - sdf.origin) / sdf.resolution
+    inside = ((cell >= 0) & (cell <= sdf._upper)).all(dim=1)
+    dist_err = (exact_dist - grid_dist).abs()[inside].max().item()
+    normal_err = (exact_normal - grid_normal).norm(dim=1)
+    outliers = (normal_err > 0.1).float().mean().item()
+    assert dist_err <= sdf.resolution, f"signed distance error {dist_err:.2e} > resolution {sdf.resolution}"
+    assert outliers <= max_normal_outliers, f"normal error > 0.1 for {outliers:.2%} of the points (> {max_normal_outliers:.0%})"
+    return dist_err, normal_err.mean().item(), outliers
+
+@register("polygon_sdf_check")
+def check_polygon_sdf_entry(args):
+    """ Accuracy of PolygonSDF only (asserts, no timing) """
+    import tempfile
+    from mqe.envs.wrappers.utils.polygon import PolygonGeometry, PolygonSDF
+
+    cache_dir = tempfile.mkdtemp()
+    for shape, vertex_list in VERTEX_LISTS.items():
+        polygon = PolygonGeometry(vertex_list, device=args.device)
+        sdf = PolygonSDF(vertex_list, resolution=0.01, cache_dir=cache_dir, device=args.device)
+        dist_err, normal_err, outliers = check_polygon_sdf(polygon, sdf, torch.randn(100000, 2, device=args.device) * 2)
+        print(f"{shape:<36} ok | max dist err {dist_err:.2e} | normal err mean {normal_err:.2e} | > 0.1 for {outliers:.2%}")
+
+@register("polygon_sdf")
+def bench_polygon_sdf(args):
+    """ Grid lookup against the exact PolygonGeometry: speed, signed distance error and normal error """
+    import tempfile
+    from mqe.envs.wrappers.utils.polygon import PolygonGeometry, PolygonSDF
+
+    cache_dir = tempfile.mkdtemp()
+    for shape, vertex_list in VERTEX_LISTS.items():
+        polygon = PolygonGeometry(vertex_list, device=args.device)
+        t0 = time.perf_counter()
+        sdf = PolygonSDF(vertex_list, resolution=0.01, cache_dir=cache_dir, device=args.device)
+        build_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        PolygonSDF(vertex_list, resolution=0.01, cache_dir=cache_dir, device=args.device)
+        print(f"{shape}: grid {sdf.grid_shape} built in {build_s:.2f}s, loaded from cache in {time.perf_counter() - t0:.2f}s")
+        for num_envs in args.num_envs:
+            points = torch.randn(num_envs * args.num_agents, 2, device=args.device) * 2
+
+            def legacy():
+                return polygon.signed_distance(points), polygon.nearest_normal(points)
+
+            def new():
+                return sdf.signed_distance(points), sdf.nearest_normal(points)
+
+            dist_err, normal_err, outliers = check_polygon_sdf(polygon, sdf, points)
+            report(f"{shape} points={points.shape[0]}",
+                   timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), dist_err)
+            print(f"{'':<36} normal err mean {normal_err:.2e} | > 0.1 for {outliers * 100:.2f}% of the points")
+
+
+# ---------------------------------------------------------------------------
+# mid-level command policy (Go1PushUpperWrapper.step)
+# ---------------------------------------------------------------------------
+
+class SyntheticActor(torch.nn.Module):
+    """ Stand-in for the OpenRL actor (same signature as OpenRLActor and same size), avoids loading a checkpoint """
+    def __init__(self, obs_dim, hidden_size=64, action_dim=3):
+        super().__init__()
+        self.net = torch.nn.Sequential(torch.nn.Linear(obs_dim, hidden_size), torch.nn.ReLU(),
+                                       torch.nn.Linear(hidden_size, hidden_size), torch.nn.ReLU(),
+                                       torch.nn.Linear(hidden_size, action_dim))
+        self.device = None
+
+    def forward(self, obs, rnn_states, masks):
+        # OpenRL converts numpy inputs with check(x).to(**tpdv)
+        obs = torch.as_tensor(obs, dtype=torch.float, device=self.device)
+        rnn_states = torch.as_tensor(rnn_states, dtype=torch.float, device=self.device)
+        return self.net(obs), rnn_states
+
+
+@register("command_policy")
+def bench_command_policy(args):
+    import numpy as np
+    from mqe.envs.wrappers.utils.command_policy import CommandPolicy
+
+    num_agents = args.num_agents
+    for num_envs in args.num_envs:
+        actor = SyntheticActor(3 + 3 * num_agents).to(args.device)
+        actor.device = args.device
+        policy = CommandPolicy(actor, num_envs, num_agents, device=args.device)
+        rnn_states_command = np.zeros((num_envs * num_agents, 1, 64))
+        mask_command = np.ones((num_envs * num_agents, 1))
+        command_obs = torch.randn(num_envs, num_agents, 3 + 3 * num_agents, device=args.device)
+
+        @torch.no_grad()
+        def legacy():
+            obs = np.concatenate(command_obs.cpu().numpy(), axis=0)
+            command_action, _ = actor(obs, rnn_states_command, mask_command)
+            command_action = np.array(np.split(command_action.detach().cpu().numpy(), num_envs))
+            return torch.from_numpy(0.5 * command_action).to(args.device).clip(-1, 1)
+
+        def new():
+            return policy.act(command_obs)
+
+        report(f"envs={num_envs} agents={num_agents}",
+               timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), (legacy() - new()).abs().max().item())
+
+
+# ---------------------------------------------------------------------------
+# trajectory resampling (Go1PushUpperWrapper.reset, RRT traces)
+# ---------------------------------------------------------------------------
+
+def legacy_interpolate_trajectory(trajectory, target_points=13):
+    """ The per-env np.interp loop previously in go1_push_upper_wrapper.py (was hard coded to cuda:0) """
+    import numpy as np
+    num_envs, current_points = trajectory.shape[0], trajectory.shape[1] // 2
+    new_trajectory = torch.zeros((num_envs, target_points * 2), device=trajectory.device)
+
+    for i in range(num_envs):
+        x = trajectory[i, 0::2].cpu().numpy()
+        y = trajectory[i, 1::2].cpu().numpy()
+
+        if current_points < target_points:
+            interp_x = np.interp(
+                np.linspace(0, current_points - 1, target_points),
+                np.arange(current_points), x
+            )
+            interp_y = np.interp(
+                np.linspace(0, current_points - 1, target_points),
+                np.arange(current_points), y
+            )
+        else:
+            arc_length = np.cumsum(np.sqrt(np.diff(x)**2 + np.diff(y)**2))
+            arc_length = np.insert(arc_length, 0, 0)
+            interp_arc = np.linspace(0, arc_length[-1], target_points)
+            interp_x = np.interp(interp_arc, arc_length, x)
+            interp_y = np.interp(interp_arc, arc_length, y)
+
+        new_trajectory[i, 0::2] = torch.tensor(interp_x)
+        new_trajectory[i, 1::2] = torch.tensor(interp_y)
+
+    return new_trajectory
+
+
+@register("interpolate_trajectory")
+def bench_interpolate_trajectory(args):
+    from mqe.envs.wrappers.utils.trajectory import interpolate_trajectory
+
+    for num_trajectories in (1000, 10000):
+        # fixed length, by index (< 13 points) and by arc length
+        for num_points in (7, 40):
+            trajectory = torch.cumsum(torch.rand(num_trajectories, num_points, 2, device=args.device), dim=1).reshape(num_trajectories, -1)
+            report(f"trajectories={num_trajectories} points={num_points}",
+                   timeit(lambda: legacy_interpolate_trajectory(trajectory), args.device, 1, 1),
+                   timeit(lambda: interpolate_trajectory(trajectory), args.device, args.iters),
+                   (legacy_interpolate_trajectory(trajectory) - interpolate_trajectory(trajectory)).abs().max().item())
+
+        # variable length, padded, compared per trajectory against its unpadded legacy result
+        lengths = torch.randint(2, 40, (num_trajectories,), device=args.device)
+        padded = torch.cumsum(torch.rand(num_trajectories, 40, 2, device=args.device), dim=1)
+        new = interpolate_trajectory(padded.reshape(num_trajectories, -1), lengths=lengths)
+        max_err = 0.
+        for i in range(0, num_trajectories, max(num_trajectories // 100, 1)):
+            legacy = legacy_interpolate_trajectory(padded[i, :lengths[i]].reshape(1, -1))
+            max_err = max(max_err, (legacy - new[i]).abs().max().item())
+        print(f"trajectories={num_trajectories} variable length (2-39 points) max err {max_err:.2e}")
+
+
+# ---------------------------------------------------------------------------
+# spline trajectories (TrajectoryPlanner.__init__ / reset_trajectory)
+# ---------------------------------------------------------------------------
+
+def scipy_spline_trajectory(control_points, trajectory_length, device):
+    """ Per-env scipy splines as in the previous TrajectoryPlanner.generate_trajectory """
+    import numpy as np
+    from scipy.interpolate import CubicSpline
+
+    num_envs = control_points.shape[0]
+    trajectory = torch.zeros((num_envs, trajectory_length, 2), device=device)
+    t = np.array([0, 0.25, 0.5, 0.75, 1])
+    t_new = np.linspace(0, 1, num=trajectory_length)
+    points = control_points.cpu().numpy().astype(np.float64)
+    for env_id in range(num_envs):
+        cs_x = CubicSpline(t, points[env_id, :, 0], bc_type='natural')
+        cs_y = CubicSpline(t, points[env_id, :, 1], bc_type='natural')
+        trajectory[env_id, :, :] = torch.tensor(np.vstack((cs_x(t_new), cs_y(t_new))).T, device=device)
+    return trajectory
+
+def check_spline_trajectory(planner, control_points, device, atol=1e-4, rtol=1e-5):
+    """ Assert natural_cubic_spline against scipy's CubicSpline(bc_type='natural'), returns the max abs error """
+    from mqe.envs.wrappers.utils.trajectory import natural_cubic_spline
+
+    expected = scipy_spline_trajectory(control_points, planner.trajectory_length, device)
+    actual = natural_cubic_spline(planner.t_knots, control_points, planner.t_new)
+    torch.testing.assert_close(actual, expected, atol=atol, rtol=rtol)
+    return (actual - expected).abs().max().item()
+
+@register("spline_trajectory_check")
+def check_spline_trajectory_entry(args):
+    """ Numerical equivalence of the batched spline with scipy only (asserts, no timing) """
+    from mqe.envs.wrappers.utils.trajectory import TrajectoryPlanner
+
+    num_envs = 1000
+    start = torch.rand(num_envs, 3, device=args.device) * 14
+    end = torch.rand(num_envs, 3, device=args.device) * 14
+    planner = TrajectoryPlanner(num_envs, start, end, device=args.device)
+    max_err = check_spline_trajectory(planner, planner.sample_control_points(start, end), args.device)
+    print(f"{'natural_cubic_spline vs scipy':<36} ok | max err {max_err:.2e}")
+
+@register("spline_trajectory")
+def bench_spline_trajectory(args):
+    from mqe.envs.wrappers.utils.trajectory import TrajectoryPlanner, natural_cubic_spline
+
+    for num_envs in args.num_envs:
+        start = torch.rand(num_envs, 3, device=args.device) * 14
+        end = torch.rand(num_envs, 3, device=args.device) * 14
+        planner = TrajectoryPlanner(num_envs, start, end, device=args.device)
+        control_points = planner.sample_control_points(start, end)
+
+        def legacy():
+            return scipy_spline_trajectory(control_points, planner.trajectory_length, args.device)
+
+        def new():
+            return natural_cubic_spline(planner.t_knots, control_points, planner.t_new)
+
+        max_err = check_spline_trajectory(planner, control_points, args.device)
+        report(f"envs={num_envs}", timeit(legacy, args.device, 1, 1), timeit(new, args.device, args.iters), max_err)
+
+
+# ---------------------------------------------------------------------------
+# obstacle-aware RRT planning (Go1PushUpperWrapper.reset)
+# ---------------------------------------------------------------------------
+
+# planner settings of Go1PushUpperCfg.planner
+RRT_KWARGS = dict(action_scale=0.75, goal_sample_prob=0.75, REACH_THERESHOLD=1.5, COLLISION_THERESHOLD=0.3)
+X_LIM, Y_LIM = (0, 14), (-7, 7)
+
+
+def random_planning_problems(num_envs, num_obstacles, device):
+    """ Box start near the spawn area, final target on the far side, obstacles anywhere in between """
+    start = torch.stack([torch.rand(num_envs, device=device) * 0.2 + 1.4, torch.rand(num_envs, device=device) * 0.2 - 0.1], dim=1)
+    goal = torch.stack([torch.rand(num_envs, device=device) * 4.5 + 9.5, torch.rand(num_envs, device=device) * 12 - 6], dim=1)
+    obstacles = torch.stack([torch.rand(num_envs, num_obstacles, device=device) * 9 + 3.5,
+                             torch.rand(num_envs, num_obstacles, device=device) * 14 - 7], dim=2)
+    return start, goal, obstacles
+
+
+@register("batched_rrt")
+def bench_batched_rrt(args):
+    import contextlib
+    import io
+    from mqe.envs.wrappers.utils.rrt import BatchedRRT, KinodynamicRRT
+
+    for num_obstacles in (2, 8):
+        # current planner, one env at a time (prints a banner per plan)
+        num_legacy = 20
+        start, goal, obstacles = random_planning_problems(num_legacy, num_obstacles, args.device)
+        rrt = KinodynamicRRT(x_lim=X_LIM, y_lim=Y_LIM)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy_success = sum(rrt.plan(start[i], goal[i], obstacles[i], timeout=5.0, **RRT_KWARGS) is not None for i in range(num_legacy))
+        legacy_s = (time.perf_counter() - t0) / num_legacy
+
+        for num_envs in args.num_envs:
+            start, goal, obstacles = random_planning_problems(num_envs, num_obstacles, args.device)
+            planner = BatchedRRT(X_LIM, Y_LIM, device=args.device)
+            t0 = time.perf_counter()
+            paths, lengths, success = planner.plan(start, goal, obstacles, timeout=60.0, **RRT_KWARGS)
+            new_s = (time.perf_counter() - t0) / num_envs
+            # every path must start at the start, end at the goal and keep clear of the obstacles
+            valid_points = torch.arange(paths.shape[1], device=args.device).unsqueeze(0) < lengths.unsqueeze(1)
+            clearance = torch.norm(paths.unsqueeze(2) - obstacles.unsqueeze(1), dim=3).min(dim=2)[0]
+            clearance = torch.where(valid_points, clearance, torch.full_like(clearance, float("inf")))[:, 1:-1].min().item()
+            end_err = (paths[torch.arange(num_envs), (lengths - 1).clamp(min=0)] - goal)[success].abs().max().item()
+            report(f"obstacles={num_obstacles} envs={num_envs} (plans/s)", legacy_s, new_s)
+            print(f"{'':<36} success legacy {legacy_success}/{num_legacy} | new {success.sum().item()}/{num_envs}"
+                  f" | min clearance {clearance:.2f} | goal err {end_err:.1e}")
+
+
+def legacy_rrt_tree_growth(start, num_nodes, action_scale=0.75):
+    """ Tree growth of the previous KinodynamicRRT.plan: re-stacked states list for the nearest neighbour and a treelib tree """
+    import treelib
+
+    states = [start]
+    tree = treelib.Tree()
+    tree.create_node(identifier=0)
+    while len(states) < num_nodes:
+        x_target = torch.tensor([torch.rand(1) * (X_LIM[1] - X_LIM[0]) + X_LIM[0],
+                                 torch.rand(1) * (Y_LIM[1] - Y_LIM[0]) + Y_LIM[0]], device=start.device)
+        d = torch.norm(torch.stack(states) - x_target, dim=1)
+        x_near_idx = d.argmin().item()
+        x_near = states[x_near_idx]
+        x_next = x_near + (x_target - x_near) / (torch.norm(x_target - x_near) + 0.01) * action_scale
+        tree.create_node(identifier=len(states), parent=x_near_idx)
+        states.append(x_next)
+    return states
+
+
+@register("rrt_tree_growth")
+def bench_rrt_tree_growth(args):
+    import contextlib
+    import io
+    from mqe.envs.wrappers.utils.rrt import GridIndex, KinodynamicRRT
+
+    # exactness of the grid nearest neighbour against brute force
+    index = GridIndex(X_LIM, Y_LIM, 0.75)
+    points = torch.rand(20000, 2) * torch.tensor([14., 14.]) + torch.tensor([0., -7.])
+    # a few points outside the workspace, as the goal can be
+    points[:200] += torch.randn(200, 2) * 10
+    for x, y in points.tolist():
+        index.insert(x, y)
+    queries = torch.rand(2000, 2) * 30 - torch.tensor([8., 15.])
+    mismatches = sum(index.nearest(x, y)[0] != torch.norm(points - torch.tensor([x, y]), dim=1).argmin().item() for x, y in queries.tolist())
+    print(f"grid nearest neighbour mismatches against brute force: {mismatches} / {len(queries)}")
+
+    start = torch.tensor([1.5, 0.0], device=args.device)
+    no_obstacles = torch.zeros(0, 2, device=args.device)
+    for num_nodes in (1000, 10000, 100000):
+        rrt = KinodynamicRRT(x_lim=X_LIM, y_lim=Y_LIM)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rrt.plan(start, None, no_obstacles, action_scale=0.75, goal_sample_prob=0., timeout=float("inf"), max_nodes=num_nodes)
+        new_s = time.perf_counter() - t0
+        # the re-stacking planner is quadratic, skip it for the largest tree
+        if num_nodes <= 10000:
+            t0 = time.perf_counter()
+            legacy_rrt_tree_growth(start, num_nodes)
+            legacy_s = time.perf_counter() - t0
+            report(f"nodes={num_nodes} (trees/s)", legacy_s, new_s)
+        else:
+            print(f"{f'nodes={num_nodes} (trees/s)':<36} new {1.0 / new_s:>10.1f} it/s | {new_s / num_nodes * 1e6:.1f} us/node")
+
+
+@register("plan_cache")
+def bench_plan_cache(args):
+    import tempfile
+    from mqe.envs.wrappers.utils.plan_cache import PlanCache
+    from mqe.envs.wrappers.utils.rrt import BatchedRRT
+
+    for num_envs in args.num_envs:
+        start, goal, obstacles = random_planning_problems(num_envs, 2, args.device)
+        planner = BatchedRRT(X_LIM, Y_LIM, device=args.device)
+        t0 = time.perf_counter()
+        paths, lengths, success = planner.plan(start, goal, obstacles, timeout=60.0, **RRT_KWARGS)
+        plan_s = time.perf_counter() - t0
+
+        cache = PlanCache(resolution=0.1)
+        keys = cache.make_keys(start, goal, obstacles)
+        planned = torch.where(success, lengths, torch.zeros_like(lengths)).tolist()
+        for i, key in enumerate(keys):
+            cache.put(key, paths[i, :planned[i]].cpu().numpy())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "plan_cache.npz")
+            cache.save(path)
+            file_mb = os.path.getsize(path) / 2**20
+            restored = PlanCache(path, resolution=0.1)
+
+        # same problems with the obstacles swapped: the key must not depend on their order
+        def lookup():
+            keys = restored.make_keys(start, goal, obstacles.flip(1))
+            return [torch.as_tensor(restored.get(key), device=args.device) for key in keys]
+
+        t0 = time.perf_counter()
+        cached = lookup()
+        lookup_s = time.perf_counter() - t0
+        max_err = max(((c - paths[i, :planned[i]]).abs().max().item() if planned[i] > 0 else 0.) for i, c in enumerate(cached))
+        report(f"envs={num_envs} (plan vs cache hit)", plan_s, lookup_s, max_err)
+        print(f"{'':<36} hit rate {restored.stats()['hit_rate']:.1%} | {len(restored.entries)} paths | {file_mb:.2f} MB on disk")
+
+
+@register("async_planner")
+def bench_async_planner(args):
+    from mqe.envs.wrappers.utils.async_planner import AsyncPlanner
+    from mqe.envs.wrappers.utils.rrt import BatchedRRT
+
+    for num_envs in args.num_envs:
+        start, goal, obstacles = random_planning_problems(num_envs, 2, "cpu")
+        t0 = time.perf_counter()
+        BatchedRRT(X_LIM, Y_LIM, device="cpu").plan(start, goal, obstacles, timeout=60.0, **RRT_KWARGS)
+        sync_s = time.perf_counter() - t0
+
+        planner = AsyncPlanner(num_envs, X_LIM, Y_LIM, rrt_kwargs=dict(timeout=60.0, **RRT_KWARGS), num_workers=4)
+        # warm up the workers (spawn + imports) before timing
+        planner.submit([0], start[:1], goal[:1], obstacles[:1])
+        while len(planner.poll()) == 0:
+            time.sleep(0.01)
+
+        # time the simulation thread spends in submit / poll, a quarter of the envs is reset halfway
+        blocked_s, received, t0 = 0., {}, time.perf_counter()
+        t = time.perf_counter()
+        planner.submit(list(range(num_envs)), start, goal, obstacles, keys=list(range(num_envs)))
+        blocked_s += time.perf_counter() - t
+        planner.invalidate(list(range(0, num_envs, 4)))
+        while len(received) < num_envs - len(range(0, num_envs, 4)):
+            t = time.perf_counter()
+            received.update((env_id, path) for env_id, path, _, _ in planner.poll())
+            blocked_s += time.perf_counter() - t
+            time.sleep(0.001)
+        async_s = time.perf_counter() - t0
+        stats = planner.stats()
+        planner.close()
+
+        report(f"envs={num_envs} (blocking plan vs submit/poll)", sync_s, blocked_s)
+        print(f"{'':<36} all paths after {async_s:.2f} s | stale dropped {stats['stale']} | "
+              f"received invalidated {sum(env_id % 4 == 0 for env_id in received)} | failed {stats['failed']} | "
+              f"keys left {len(planner.keys)} | latency mean {stats['latency_mean']:.2f} s")
+
+
+def legacy_draw_connect(ax, x_start, x_next):
+    """ Per-edge drawing of the previous TwoDVisualizer.draw_connect (scatter + line + canvas flush) """
+    ax.scatter(x_next[0], x_next[1], color='k', s=4, alpha=0.2)
+    ax.figure.canvas.draw()
+    ax.figure.canvas.flush_events()
+    ax.plot([x_start[0], x_next[0]], [x_start[1], x_next[1]], color='gray', linewidth=1, alpha=0.2)
+    ax.figure.canvas.draw()
+    ax.figure.canvas.flush_events()
+
+
+@register("tree_recorder")
+def bench_tree_recorder(args):
+    import contextlib
+    import io
+    import tempfile
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from mqe.envs.wrappers.utils.rrt import KinodynamicRRT
+    from mqe.envs.wrappers.utils.tree_recorder import TreeRecorder
+
+    start, goal, obstacles = (x[0].cpu() for x in random_planning_problems(1, 8, "cpu"))
+
+    def plan(num_nodes, recorder=None):
+        torch.manual_seed(0)
+        rrt = KinodynamicRRT(x_lim=X_LIM, y_lim=Y_LIM)
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rrt.plan(start, None, obstacles, action_scale=0.75, goal_sample_prob=0., timeout=float("inf"),
+                     max_nodes=num_nodes, recorder=recorder)
+        return time.perf_counter() - t0
+
+    # live drawing, only for a few edges
+    num_legacy = 100
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    edges = torch.rand(num_legacy, 2, 2).tolist()
+    t0 = time.perf_counter()
+    for x_start, x_next in edges:
+        legacy_draw_connect(ax, x_start, x_next)
+    legacy_edge_s = (time.perf_counter() - t0) / num_legacy
+
+    for num_nodes in (1000, 10000):
+        plan(num_nodes)
+        off_s = min(plan(num_nodes) for _ in range(3))
+        recorder = TreeRecorder()
+        on_s = min(plan(num_nodes, recorder) for _ in range(3))
+        report(f"nodes={num_nodes} (plans/s, live vs recorded)", off_s + legacy_edge_s * num_nodes, on_s)
+        print(f"{'':<36} recording overhead {(on_s / off_s - 1) * 100:+.1f}% | {len(recorder.plans[-1]['edges'])} edges recorded")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        t0 = time.perf_counter()
+        recorder.render(os.path.join(tmp_dir, "tree.png"))
+        png_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        recorder.render_animation(os.path.join(tmp_dir, "tree.gif"), num_frames=20)
+        gif_s = time.perf_counter() - t0
+    print(f"{'render 10000 nodes':<36} png {png_s:.2f} s | gif (20 frames) {gif_s:.2f} s")
+
+
+@register("grid_planner")
+def bench_grid_planner(args):
+    from mqe.envs.wrappers.utils.grid_planner import GridPlanner
+    from mqe.envs.wrappers.utils.rrt import BatchedRRT
+    from mqe.envs.wrappers.utils.trajectory import interpolate_trajectory
+
+    # box footprint radius of Go1PushUpperCfg.asset.vertex_list
+    planner = GridPlanner(X_LIM, Y_LIM, resolution=0.3, obstacle_radius=0.5, box_radius=0.79, device=args.device)
+    for num_obstacles in (2, 8):
+        for num_envs in args.num_envs:
+            start, goal, obstacles = random_planning_problems(num_envs, num_obstacles, args.device)
+            t0 = time.perf_counter()
+            BatchedRRT(X_LIM, Y_LIM, device=args.device).plan(start, goal, obstacles, timeout=60.0, **RRT_KWARGS)
+            rrt_s = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            paths, lengths, success = planner.plan(start, goal, obstacles)
+            trajectory = interpolate_trajectory(paths[success].reshape(int(success.sum()), -1), lengths=lengths[success])
+            grid_s = time.perf_counter() - t0
+
+            # clearance of the smoothed segments (the start may lie within the inflation radius)
+            valid = torch.arange(paths.shape[1] - 1, device=args.device).unsqueeze(0) < (lengths - 1).unsqueeze(1)
+            clear = planner.segment_clear(paths[:, :-1], paths[:, 1:], obstacles)
+            report(f"obstacles={num_obstacles} envs={num_envs} (batched rrt vs grid)", rrt_s, grid_s)
+            print(f"{'':<36} success {success.sum().item()}/{num_envs} | waypoints mean {lengths[success].float().mean().item():.1f}"
+                  f" | clear segments {(clear | ~valid)[:, 1:].all(dim=1)[success].float().mean().item():.1%} | trajectory {tuple(trajectory.shape)}")
+
+
+# ---------------------------------------------------------------------------
+# obstacle distance field (collision checks, collision degree, obstacle reward)
+# ---------------------------------------------------------------------------
+
+@register("obstacle_field")
+def bench_obstacle_field(args):
+    from mqe.envs.obstacle_field import ObstacleDistanceField
+
+    for num_obstacles in (2, 20):
+        for num_envs in args.num_envs:
+            _, _, obstacles = random_planning_problems(num_envs, num_obstacles, args.device)
+            field = ObstacleDistanceField(num_envs, num_obstacles, X_LIM, (-7.5, 7.5), resolution=0.2, margin=2.0, device=args.device)
+            rebuild_s = timeit(lambda: field.rebuild(obstacles), args.device, 10, 2)
+
+            for num_points in (1, 64):
+                points = torch.rand(num_envs, num_points, 2, device=args.device) * torch.tensor([14., 15.], device=args.device) \
+                    - torch.tensor([0., 7.5], device=args.device)
+
+                def legacy():
+                    return torch.norm(points.unsqueeze(2) - obstacles.unsqueeze(1), dim=3).min(dim=2)[0]
+
+                def new():
+                    return field.distance(points)
+
+                # the bilinear error only matters around the collision thresholds (>= 1 m)
+                exact = legacy()
+                near = (exact > 1.0) & (exact < 2.0)
+                report(f"obstacles={num_obstacles} envs={num_envs} points={num_points}", timeit(legacy, args.device, args.iters),
+                       timeit(new, args.device, args.iters), (new() - exact)[near].abs().max().item())
+            print(f"{'':<36} rebuild all envs {rebuild_s * 1000:.2f} ms")
+
+            # a nan box pose must not become a cell index
+            points = torch.rand(num_envs, 2, device=args.device)
+            points[0] = float("nan")
+            dist = field.distance(points)
+            assert torch.isinf(dist[0]) and torch.isfinite(dist[1:]).all(), "non-finite points must map to inf"
+
+
+# ---------------------------------------------------------------------------
+# batched obstacles (Go1PushUpperWrapper observation, obstacle reward and reset sampling)
+# ---------------------------------------------------------------------------
+
+def legacy_obstacle_step(obstacle_slots, sub_goals, reset_envs, scale=-0.1):
+    """ One obs<i>_pos tensor per obstacle, as the two hand written slots of the wrapper """
+    for obs_pos in obstacle_slots:
+        obs_pos[reset_envs, 0] = torch.FloatTensor(len(reset_envs)).uniform_(0, 14).to(obs_pos.device)
+        obs_pos[reset_envs, 1] = torch.FloatTensor(len(reset_envs)).uniform_(-7, 7).to(obs_pos.device)
+    obs = torch.cat([obs_pos[:, :2] for obs_pos in obstacle_slots], dim=1)
+    reward = 0
+    for obs_pos in obstacle_slots:
+        reward = reward + scale * (1 / (1 + torch.norm(sub_goals[:, :2] - obs_pos[:, :2], dim=1)))
+    return obs, reward
+
+@register("batched_obstacles")
+def bench_batched_obstacles(args):
+    from mqe.envs.obstacle_field import nearest_obstacles
+
+    for num_envs in args.num_envs:
+        sub_goals = torch.rand(num_envs, 2, device=args.device) * 14 - torch.tensor([0., 7.], device=args.device)
+        # ~1% of the envs reset per step
+        reset_envs = torch.randperm(num_envs, device=args.device)[:max(num_envs // 100, 1)]
+        for num_obstacles in (2, 4, 8, 16, 32):
+            obstacle_pos = torch.zeros(num_envs, num_obstacles, 3, device=args.device)
+            obstacle_slots = [obstacle_pos[:, i].clone() for i in range(num_obstacles)]
+
+            def new(k=None):
+                obstacle_pos[reset_envs, :, 0] = torch.rand(len(reset_envs), num_obstacles, device=args.device) * 14
+                obstacle_pos[reset_envs, :, 1] = torch.rand(len(reset_envs), num_obstacles, device=args.device) * 14 - 7
+                if k is None:
+                    obs = obstacle_pos[:, :, :2].reshape(num_envs, -1)
+                else:
+                    obs = nearest_obstacles(sub_goals, obstacle_pos, k).reshape(num_envs, -1)
+                reward = (-0.1 / (1 + torch.norm(sub_goals[:, None, :2] - obstacle_pos[:, :, :2], dim=2))).sum(dim=1)
+                return obs, reward
+
+            legacy_s = timeit(lambda: legacy_obstacle_step(obstacle_slots, sub_goals, reset_envs), args.device, args.iters)
+            report(f"obstacles={num_obstacles} envs={num_envs} (steps/s)", legacy_s, timeit(new, args.device, args.iters))
+            report(f"obstacles={num_obstacles} envs={num_envs} k=4 (steps/s)", legacy_s, timeit(lambda: new(4), args.device, args.iters))
+
+        # same obstacles in both layouts, the rewards must agree
+        obstacle_pos = torch.rand(num_envs, 8, 3, device=args.device) * 14
+        slots = [obstacle_pos[:, i].clone() for i in range(8)]
+        legacy_reward = sum(-0.1 / (1 + torch.norm(sub_goals - slot[:, :2], dim=1)) for slot in slots)
+        reward = (-0.1 / (1 + torch.norm(sub_goals[:, None, :2] - obstacle_pos[:, :, :2], dim=2))).sum(dim=1)
+        print(f"{'':<36} reward max err {(reward - legacy_reward).abs().max().item():.2e}")
+
+
+# ---------------------------------------------------------------------------
+# locomotion observation history (Go1.preprocess_action)
+# ---------------------------------------------------------------------------
+
+# default Go1 command config: vel commanded (3 entries), everything else from the default command
+LOCOMOTION_COMMAND_MAP = [(3, 0, 2.0), (4, 1, 2.0), (5, 2, 0.25)]
+
+def legacy_locomotion_history(history, locomotion_obs, actions, step_obs):
+    for obs_id, action_id, scale in LOCOMOTION_COMMAND_MAP:
+        locomotion_obs[:, obs_id] = actions[:, action_id] * scale
+    locomotion_obs[:, 0:3] = step_obs[:, 0:3]
+    locomotion_obs[:, 18:70] = step_obs[:, 18:70]
+    return torch.cat((history[:, 70:], locomotion_obs), dim=-1)
+
+def allocated_bytes(fn):
+    """ CPU bytes allocated by one call of fn """
+    with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    return sum(max(event.self_cpu_memory_usage, 0) for event in prof.key_averages())
+
+@register("locomotion_history")
+def bench_locomotion_history(args):
+    from mqe.envs.go1.history_buffer import HistoryBuffer
+
+    for num_envs in args.num_envs:
+        num_rows = num_envs * args.num_agents
+        actions = torch.rand(num_rows, 3, device=args.device)
+        step_obs = torch.rand(num_rows, 70, device=args.device)
+        obs_ids = torch.tensor([m[0] for m in LOCOMOTION_COMMAND_MAP], device=args.device)
+        action_ids = torch.tensor([m[1] for m in LOCOMOTION_COMMAND_MAP], device=args.device)
+        scales = torch.tensor([m[2] for m in LOCOMOTION_COMMAND_MAP], device=args.device)
+
+        legacy_obs = torch.zeros(num_rows, 70, device=args.device)
+        legacy_state = {"history": torch.zeros(num_rows, 2100, device=args.device)}
+        locomotion_obs = torch.zeros(num_rows, 70, device=args.device)
+        history = HistoryBuffer(num_rows, 70, 30, device=args.device)
+
+        def legacy():
+            legacy_state["history"] = legacy_locomotion_history(legacy_state["history"], legacy_obs, actions, step_obs)
+            return legacy_state["history"]
+
+        def new():
+            locomotion_obs[:, obs_ids] = actions[:, action_ids] * scales
+            locomotion_obs[:, 0:3] = step_obs[:, 0:3]
+            locomotion_obs[:, 18:70] = step_obs[:, 18:70]
+            history.push(locomotion_obs)
+            return history.get()
+
+        # same window after more than one full turn of the ring, with changing observations
+        for _ in range(45):
+            step_obs.uniform_()
+            max_err = (legacy() - new()).abs().max().item()
+        report(f"agents={num_rows} (steps/s)", timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), max_err)
+        if str(args.device) == "cpu":
+            print(f"{'':<36} allocated per step: legacy {allocated_bytes(legacy) / 2**20:.2f} MiB | new {allocated_bytes(new) / 2**20:.2f} MiB")
+
+
+# ---------------------------------------------------------------------------
+# locomotion policy inference (Go1.preprocess_action)
+# ---------------------------------------------------------------------------
+
+def synthetic_locomotion_checkpoint(directory, obs_dim=2100, latent_dim=2, device="cpu"):
+    """ Walk-these-ways shaped adaptation module and body with random weights, saved as TorchScript """
+    from mqe.envs.go1.locomotion_inference import BODY_FILE, ADAPTATION_MODULE_FILE
+
+    def mlp(dims):
+        layers = []
+        for i in range(len(dims) - 1):
+            layers.append(torch.nn.Linear(dims[i], dims[i + 1]))
+            if i < len(dims) - 2:
+                layers.append(torch.nn.ELU())
+        return torch.nn.Sequential(*layers).to(device)
+
+    torch.jit.save(torch.jit.script(mlp([obs_dim, 256, 128, latent_dim])), os.path.join(directory, ADAPTATION_MODULE_FILE))
+    torch.jit.save(torch.jit.script(mlp([obs_dim + latent_dim, 512, 256, 128, 12])), os.path.join(directory, BODY_FILE))
+
+@register("locomotion_inference")
+def bench_locomotion_inference(args):
+    import tempfile
+    from mqe.envs.go1.locomotion_inference import LocomotionInference
+
+    precisions = ["fp32", "bf16", "int8"] if str(args.device) == "cpu" else ["fp32", "bf16"]
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_locomotion_checkpoint(directory, device=args.device)
+        reference = LocomotionInference(directory, backend="jit", device=args.device)
+        backends = {precision: LocomotionInference(directory, backend="frozen", precision=precision, tolerance=float("inf"), device=args.device)
+                    for precision in precisions}
+        # the reduced precision model must not convert the modules of the reference
+        for precision, backend in backends.items():
+            dtypes = {p.dtype for p in list(backend.adaptation_module.parameters()) + list(backend.body.parameters())}
+            action, latent = backend.reference(torch.randn(4, backend.obs_dim, device=args.device))
+            ok = dtypes == {torch.float} and action.dtype == latent.dtype == torch.float
+            print(f"{'frozen ' + precision + ' reference':<36} {'fp32 ok' if ok else 'WRONG DTYPE ' + str(dtypes)}")
+
+        for num_agents in (2, 64, 512, 2000, 8000):
+            obs = torch.randn(num_agents, reference.obs_dim, device=args.device)
+            legacy_s = timeit(lambda: reference(obs), args.device, args.iters)
+            for precision, backend in backends.items():
+                max_err = (backend(obs) - reference(obs)).abs().max().item()
+                report(f"agents={num_agents} frozen {precision} (batches/s)", legacy_s, timeit(lambda: backend(obs), args.device, args.iters), max_err)
+
+
+# ---------------------------------------------------------------------------
+# actuator network history (Go1._compute_torques)
+# ---------------------------------------------------------------------------
+
+def legacy_actuator_substep(state, dof_pos, dof_vel, actions_scaled, network):
+    """ List lag buffer, cloned error / velocity history and torch.cat input, as Go1._compute_torques did """
+    state["lag_buffer"] = state["lag_buffer"][1:] + [actions_scaled.clone()]
+    joint_pos_err = (dof_pos - state["lag_buffer"][0]).reshape([-1, 12])
+    joint_vel = dof_vel.reshape([-1, 12])
+    xs = torch.cat((joint_pos_err.unsqueeze(-1), state["err_last"].unsqueeze(-1), state["err_last_last"].unsqueeze(-1),
+                    joint_vel.unsqueeze(-1), state["vel_last"].unsqueeze(-1), state["vel_last_last"].unsqueeze(-1)), dim=-1)
+    torques = network(xs.view(-1, 6))
+    state["err_last_last"] = torch.clone(state["err_last"])
+    state["err_last"] = torch.clone(joint_pos_err)
+    state["vel_last_last"] = torch.clone(state["vel_last"])
+    state["vel_last"] = torch.clone(joint_vel)
+    return torques
+
+@register("actuator_history")
+def bench_actuator_history(args):
+    lag_timesteps = 6
+    # unitree_go1.pt shaped MLP
+    network = torch.nn.Sequential(torch.nn.Linear(6, 32), torch.nn.Softsign(), torch.nn.Linear(32, 32), torch.nn.Softsign(),
+                                  torch.nn.Linear(32, 1)).to(args.device)
+    network.requires_grad_(False)
+
+    for num_robots in (1000, 8000):
+        dof_pos = torch.rand(num_robots, 12, device=args.device)
+        dof_vel = torch.rand(num_robots, 12, device=args.device)
+        actions_scaled = torch.rand(num_robots, 12, device=args.device)
+        zeros = torch.zeros(num_robots, 12, device=args.device)
+        legacy_state = {"lag_buffer": [zeros.clone() for _ in range(lag_timesteps + 1)], "err_last": zeros.clone(),
+                        "err_last_last": zeros.clone(), "vel_last": zeros.clone(), "vel_last_last": zeros.clone()}
+        new_state = {"lag_buffer": torch.zeros(lag_timesteps + 1, num_robots, 12, device=args.device), "lag_head": 0,
+                     "history": torch.zeros(num_robots, 12, 2, 3, device=args.device), "head": 0,
+                     "order": torch.tensor([[h, (h - 1) % 3, (h - 2) % 3] for h in range(3)], device=args.device)}
+
+        def legacy():
+            return legacy_actuator_substep(legacy_state, dof_pos, dof_vel, actions_scaled, network)
+
+        def new():
+            lag_buffer = new_state["lag_buffer"]
+            new_state["lag_head"] = (new_state["lag_head"] + 1) % lag_buffer.shape[0]
+            lag_buffer[new_state["lag_head"]] = actions_scaled
+            joint_pos_err = (dof_pos - lag_buffer[(new_state["lag_head"] + 1) % lag_buffer.shape[0]]).reshape([-1, 12])
+            history, head = new_state["history"], new_state["head"]
+            history[:, :, 0, head] = joint_pos_err
+            history[:, :, 1, head] = dof_vel.reshape([-1, 12])
+            torques = network(history.index_select(3, new_state["order"][head]).view(-1, 6))
+            new_state["head"] = (head + 1) % 3
+            return torques
+
+        # the torques must be identical over more substeps than the lag and history lengths
+        max_err = 0.
+        for _ in range(2 * (lag_timesteps + 3)):
+            actions_scaled.uniform_()
+            dof_pos.uniform_()
+            dof_vel.uniform_()
+            max_err = max(max_err, (legacy() - new()).abs().max().item())
+        report(f"robots={num_robots} (substeps/s)", timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), max_err)
+
+
+# ---------------------------------------------------------------------------
+# actuator surrogate (Go1._compute_torques, cfg.control.actuator_model)
+# ---------------------------------------------------------------------------
+
+@register("actuator_surrogate")
+def bench_actuator_surrogate(args):
+    from helpers.fit_actuator_surrogate import sample_inputs
+    from mqe.envs.go1.actuator_surrogate import PiecewiseLinearActuator, fit_error
+
+    network = torch.jit.load("./resources/actuator_nets/unitree_go1.pt", map_location=args.device)
+    xs = sample_inputs(200000).to(args.device)
+    with torch.no_grad():
+        surrogate = PiecewiseLinearActuator.fit(xs, network(xs))
+    # Go1Cfg.control stiffness / damping, torque = kp * (target - pos) - kd * vel
+    kp, kd = 20., 0.5
+
+    for num_robots in (1000, 8000):
+        batch = sample_inputs(num_robots * 12).to(args.device)
+        with torch.no_grad():
+            reference = network(batch)
+
+            def pd():
+                return -kp * batch[:, 0:1] - kd * batch[:, 3:4]
+
+            network_s = timeit(lambda: network(batch), args.device, args.iters)
+            report(f"robots={num_robots} surrogate (substeps/s)", network_s, timeit(lambda: surrogate(batch), args.device, args.iters),
+                   (surrogate(batch) - reference).abs().max().item())
+            report(f"robots={num_robots} pd (substeps/s)", network_s, timeit(pd, args.device, args.iters), (pd() - reference).abs().max().item())
+        err = fit_error(surrogate, batch, reference)
+        print(f"{'':<36} surrogate rmse {err['rmse']:.4f} Nm | r2 {err['r2']:.5f}")
+
+
+# ---------------------------------------------------------------------------
+# gait clock (Go1._step_contact_targets)
+# ---------------------------------------------------------------------------
+
+def legacy_gait_clock(gait_indices, phases, offsets, bounds, durations):
+    """ Per foot loop with boolean indexing, all three clock variants every step """
+    foot_indices = [gait_indices + phases + offsets + bounds,
+                    gait_indices + offsets,
+                    gait_indices + bounds,
+                    gait_indices + phases]
+    for idxs in foot_indices:
+        stance_idxs = torch.remainder(idxs, 1) < durations
+        swing_idxs = torch.remainder(idxs, 1) > durations
+        idxs[stance_idxs] = torch.remainder(idxs[stance_idxs], 1) * (0.5 / durations[stance_idxs])
+        idxs[swing_idxs] = 0.5 + (torch.remainder(idxs[swing_idxs], 1) - durations[swing_idxs]) * (0.5 / (1 - durations[swing_idxs]))
+    clock = torch.stack([torch.sin(2 * math.pi * idxs) for idxs in foot_indices], dim=1)
+    doubletime = torch.stack([torch.sin(4 * math.pi * idxs) for idxs in foot_indices], dim=1)
+    halftime = torch.stack([torch.sin(math.pi * idxs) for idxs in foot_indices], dim=1)
+    return clock, doubletime, halftime
+
+@register("gait_clock")
+def bench_gait_clock(args):
+    from mqe.envs.go1.gait_clock import foot_phases
+
+    # Go1Cfg.command.gaits
+    gaits = {"trotting": [0.5, 0, 0], "pacing": [0, 0, 0.5], "bounding": [0, 0.5, 0], "pronking": [0, 0, 0]}
+    for num_envs in args.num_envs:
+        num_robots = num_envs * args.num_agents
+        gait_indices = torch.rand(num_robots, device=args.device)
+        clock = torch.zeros(num_robots, 4, device=args.device)
+        for name, gait in gaits.items():
+            gait_params = torch.tensor(gait + [0.5], device=args.device).repeat(num_robots, 1)
+            # durations == phase lands exactly on the boundary for some robots
+            gait_params[::7, 3] = torch.rand(len(gait_params[::7]), device=args.device) * 0.6 + 0.2
+            gait_indices[::11] = 0.5
+
+            def legacy():
+                return legacy_gait_clock(gait_indices, *gait_params.unbind(1))
+
+            def new():
+                _, warped = foot_phases(gait_indices, gait_params)
+                return torch.sin(2 * math.pi * warped, out=clock)
+
+            _, warped = foot_phases(gait_indices, gait_params)
+            variants = (torch.sin(2 * math.pi * warped), torch.sin(4 * math.pi * warped), torch.sin(math.pi * warped))
+            max_err = max((a - b).abs().max().item() for a, b in zip(legacy(), variants))
+            report(f"{name} robots={num_robots} (steps/s)", timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), max_err)
+
+
+# ---------------------------------------------------------------------------
+# device placement of the wrapper math (no hard coded cuda tensors)
+# ---------------------------------------------------------------------------
+
+@register("device_check")
+def bench_device_check(args):
+    """ Builds every wrapper utility on args.device (e.g. --device cpu) and exits non-zero if an output lives elsewhere """
+    from mqe.envs.obstacle_field import ObstacleDistanceField, nearest_obstacles
+    from mqe.envs.go1.gait_clock import foot_phases
+    from mqe.envs.go1.history_buffer import HistoryBuffer
+    from mqe.envs.state_cache import StepStateCache
+    from mqe.envs.wrappers.utils.command_policy import CommandPolicy
+    from mqe.envs.wrappers.utils.egocentric_obs import EgocentricObservation
+    from mqe.envs.wrappers.utils.grid_planner import GridPlanner
+    from mqe.envs.wrappers.utils.mid_rewards import MidRewardEngine
+    from mqe.envs.wrappers.utils.polygon import PolygonGeometry
+    from mqe.envs.wrappers.utils.reward_stats import RewardStatistics
+    from mqe.envs.wrappers.utils.rrt import BatchedRRT, KinodynamicRRT
+    from mqe.envs.wrappers.utils.trajectory import TrajectoryPlanner, interpolate_trajectory
+
+    device = torch.device(args.device)
+    num_envs, num_agents = 8, args.num_agents
+    start, goal, obstacles = random_planning_problems(num_envs, 2, device)
+    box_pos = torch.rand(num_envs, 3, device=device)
+    base_pos = torch.rand(num_envs, num_agents, 3, device=device)
+    yaw = torch.rand(num_envs, num_agents, device=device)
+
+    planner = TrajectoryPlanner(num_envs, box_pos, torch.rand(num_envs, 3, device=device), device=device)
+    field = ObstacleDistanceField(num_envs, 2, X_LIM, Y_LIM, device=device)
+    field.rebuild(obstacles)
+    history = HistoryBuffer(num_envs * num_agents, 70, 30, device=device)
+    history.push(torch.rand(num_envs * num_agents, 70, device=device))
+    stats = RewardStatistics(["reward"], num_envs, device=device)
+    stats.add("reward", box_pos.sum())
+    rrt_paths, _, _ = BatchedRRT(X_LIM, Y_LIM, max_nodes=256, device=device).plan(start, goal, obstacles)
+    grid_paths, _, _ = GridPlanner(X_LIM, Y_LIM, device=device).plan(start, goal, obstacles)
+    trace = KinodynamicRRT(X_LIM, Y_LIM).plan(start[0], goal[0], obstacles[0], timeout=0.5)
+    vertex_list = [[-0.60, -0.60], [0.60, -0.60], [0.60, 0.60], [-0.60, 0.60]]
+    scales = dict(target_reward_scale=0.00325, approach_reward_scale=0.00075, collision_punishment_scale=-0.0025,
+                  push_reward_scale=0.0015, ocb_reward_scale=0.004, reach_target_reward_scale=10, exception_punishment_scale=-5)
+    box_state = torch.rand(num_envs, 13, device=device)
+    flags = torch.zeros(num_envs, dtype=torch.bool, device=device)
+    mid_reward, _ = MidRewardEngine(scales, num_envs, num_agents, vertex_list, dist_calculator=PlanarDist(), device=device).compute(
+        base_pos, box_state[:, :3], yaw[:, 0], box_pos, yaw[:, 1], box_state, box_state, box_state, flags, flags, flags)
+    num_npcs = 3
+    root_states = torch.rand(num_envs * num_agents, 13, device=device)
+    root_states_npc = torch.rand(num_envs * num_npcs, 13, device=device)
+    cache = StepStateCache(num_envs, num_agents, num_npcs, torch.zeros(num_envs, 3, device=device))
+    cache.begin_step(root_states, root_states[:, 3:7], root_states_npc)
+    actor = SyntheticActor(3 + 3 * num_agents).to(device)
+    actor.device = device
+    command = CommandPolicy(actor, num_envs, num_agents, device=device).act(torch.rand(num_envs, num_agents, 3 + 3 * num_agents, device=device))
+
+    outputs = {
+        "EgocentricObservation": EgocentricObservation(num_envs, num_agents, device=device).compute(base_pos, yaw, box_pos, yaw[:, 0], box_pos),
+        "TrajectoryPlanner": planner.update_next_planning_position(box_pos, planner.get_trajectory()),
+        "interpolate_trajectory": interpolate_trajectory(rrt_paths.flatten(1)),
+        "ObstacleDistanceField": field.distance(box_pos[:, :2]),
+        "nearest_obstacles": nearest_obstacles(box_pos, obstacles, 4),
+        "PolygonGeometry": PolygonGeometry([[-0.5, -0.25], [0.5, -0.25], [0.25, 0.75], [-0.25, 0.75]], device=device).signed_distance(box_pos[:, :2]),
+        "HistoryBuffer": history.get(),
+        "RewardStatistics": stats.sums,
+        "BatchedRRT": rrt_paths,
+        "GridPlanner": grid_paths,
+        "foot_phases": foot_phases(yaw.flatten(), torch.rand(num_envs * num_agents, 4, device=device))[1],
+        "MidRewardEngine": mid_reward,
+        "StepStateCache.base_rpy": cache.base_rpy,
+        "StepStateCache.agent_pos_in_box_frame": cache.agent_pos_in_box_frame,
+        "StepStateCache.value_exception": cache.value_exception("base_rpy", "npc_pos"),
+        "CommandPolicy": command,
+    }
+    if trace is not None:
+        outputs["KinodynamicRRT"] = torch.stack(trace)
+    wrong = []
+    for name, output in outputs.items():
+        ok = output.device.type == device.type and (device.index is None or output.device.index == device.index)
+        print(f"{name:<36} {str(output.device):<8} {'ok' if ok else 'WRONG DEVICE, expected ' + str(device)}")
+        if not ok:
+            wrong.append(name)
+    if wrong:
+        sys.exit(f"outputs on the wrong device: {', '.join(wrong)}")
+
+
+
+# ---------------------------------------------------------------------------
+# per-step derived poses (StepStateCache), one Go1PushMidWrapper step
+# ---------------------------------------------------------------------------
+
+def legacy_step_conversions(euler, root_states, root_states_npc, num_envs, num_agents, num_npcs, reset_ids):
+    """ The get_euler_xyz / cos / sin calls of check_termination (roll, pitch, out_of_area), cal_dist (general_dist),
+    Go1.compute_observations (base_rpy) and the mid wrapper (observation, reward), in step order.
+    Returns the outputs and the number of full-batch conversions.
+    """
+    npc = root_states_npc.view(num_envs, num_npcs, 13)
+    count = 0
+    def convert(quat):
+        nonlocal count
+        count += 1
+        return euler(quat)
+    # check_termination
+    rpy = convert(root_states[:, 3:7])
+    box_rpy = convert(npc[:, 0, 3:7])
+    count += 1
+    box_frame = torch.stack([torch.cos(box_rpy[:, 2]), torch.sin(box_rpy[:, 2])], dim=1)
+    dist_yaws = convert(npc[:, 0, 3:7])[:, 2], convert(npc[:, 1, 3:7])[:, 2]
+    # reset_idx writes the box of the reset envs
+    npc[reset_ids, 0, 3:7] = torch.nn.functional.normalize(torch.rand(len(reset_ids), 4, device=npc.device), dim=1)
+    # compute_observations
+    base_rpy = convert(root_states[:, 3:7])
+    # mid wrapper: observation, reward, two cal_dist
+    obs_yaws = convert(npc[:, 0, 3:7])[:, 2], convert(npc[:, 1, 3:7])[:, 2]
+    reward_rpy = convert(npc[:, 0, 3:7]), convert(npc[:, 1, 3:7])
+    reward_yaws = convert(npc[:, 0, 3:7])[:, 2], convert(npc[:, 1, 3:7])[:, 2], convert(npc[:, 1, 3:7])[:, 2]
+    return (rpy, base_rpy, reward_rpy[0], reward_rpy[1], obs_yaws[0], reward_yaws[0]), count
+
+def cached_step_conversions(cache, root_states, root_states_npc, base_quat, num_envs, num_npcs, reset_ids):
+    npc = root_states_npc.view(num_envs, num_npcs, 13)
+    cache.begin_step(root_states, base_quat, root_states_npc)
+    rpy = cache.base_rpy
+    box_frame = cache.box_frame
+    dist_yaws = cache.box_yaw, cache.target_yaw
+    npc[reset_ids, 0, 3:7] = torch.nn.functional.normalize(torch.rand(len(reset_ids), 4, device=npc.device), dim=1)
+    cache.update_states(root_states, root_states_npc, reset_ids)
+    base_rpy = cache.base_rpy
+    obs_yaws = cache.box_yaw, cache.target_yaw
+    reward_rpy = cache.box_rpy, cache.target_rpy
+    reward_yaws = cache.box_yaw, cache.target_yaw, cache.target_yaw
+    return (rpy, base_rpy, reward_rpy[0], reward_rpy[1], obs_yaws[0], reward_yaws[0])
+
+@register("state_cache")
+def bench_state_cache(args):
+    from isaacgym.torch_utils import get_euler_xyz
+    from mqe.envs.state_cache import StepStateCache
+
+    def euler_xyz(quat):
+        return torch.stack(get_euler_xyz(quat), dim=1)
+
+    num_npcs = 3
+    for num_envs in args.num_envs:
+        num_robots = num_envs * args.num_agents
+        root_states = torch.rand(num_robots, 13, device=args.device)
+        root_states[:, 3:7] = torch.nn.functional.normalize(torch.randn(num_robots, 4, device=args.device), dim=1)
+        base_quat = root_states[:, 3:7].clone()
+        root_states_npc = torch.rand(num_envs * num_npcs, 13, device=args.device)
+        root_states_npc[:, 3:7] = torch.nn.functional.normalize(torch.randn(num_envs * num_npcs, 4, device=args.device), dim=1)
+        env_origins = torch.zeros(num_envs, 3, device=args.device)
+        reset_ids = torch.randperm(num_envs, device=args.device)[:max(1, num_envs // 50)]
+        cache = StepStateCache(num_envs, args.num_agents, num_npcs, env_origins)
+
+        # same reset quaternions on both paths for the error check
+        torch.manual_seed(0)
+        legacy_out, legacy_count = legacy_step_conversions(euler_xyz, root_states, root_states_npc.clone(), num_envs, args.num_agents, num_npcs, reset_ids)
+        torch.manual_seed(0)
+        new_out = cached_step_conversions(cache, root_states, root_states_npc.clone(), base_quat, num_envs, num_npcs, reset_ids)
+        max_err = max((a - b).abs().max().item() for a, b in zip(legacy_out, new_out))
+        # the box frame rows of the reset envs were refreshed in place
+        box_yaw = legacy_out[2][:, 2]
+        max_err = max(max_err, (cache.box_frame - torch.stack([torch.cos(box_yaw), torch.sin(box_yaw)], dim=1)).abs().max().item())
+
+        def legacy():
+            return legacy_step_conversions(euler_xyz, root_states, root_states_npc, num_envs, args.num_agents, num_npcs, reset_ids)
+
+        def new():
+            return cached_step_conversions(cache, root_states, root_states_npc, base_quat, num_envs, num_npcs, reset_ids)
+
+        report(f"envs={num_envs} (steps/s)", timeit(legacy, args.device, args.iters), timeit(new, args.device, args.iters), max_err)
+        print(f"{'':<36} full-batch trig conversions per step: legacy {legacy_count} | cached {cache.evaluations} "
+              f"(requested {cache.requests}) | removed {legacy_count - cache.evaluations}")
+
+        # nan states are cleaned once in the cache and flagged, every consumer reads the same values
+        bad_quat = base_quat.clone()
+        bad_quat[0] = float("nan")
+        cache.begin_step(root_states, bad_quat, root_states_npc)
+        base_rpy = cache.base_rpy
+        flagged = cache.value_exception("base_rpy").nonzero().flatten().tolist()
+        ok = flagged == [0] and bool(torch.isfinite(base_rpy).all()) and cache.base_rpy is base_rpy
+        print(f"{'':<36} nan base quaternion of env 0: flagged envs {flagged} | {'ok' if ok else 'WRONG'}")
+
+        # an obstacle row (npc 2) is flagged by npc_pos but not by the box / target keys the mid wrapper reads
+        bad_npc = root_states_npc.clone()
+        bad_npc[2, :3] = float("nan")
+        cache.begin_step(root_states, base_quat, bad_npc)
+        flagged = cache.value_exception("npc_pos").nonzero().flatten().tolist()
+        flagged_box = cache.value_exception("box_pos", "target_pos", "box_rpy", "target_rpy").nonzero().flatten().tolist()
+        ok = flagged == [0] and flagged_box == []
+        print(f"{'':<36} nan obstacle of env 0: npc_pos flags {flagged}, box / target flag {flagged_box} | {'ok' if ok else 'WRONG'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("name", nargs="?", help="benchmark to run")
+    parser.add_argument("--list", action="store_true", help="list the available benchmarks")
+    parser.add_argument("--device", type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--num_envs", type=int, nargs="+", default=[500, 4000])
+    parser.add_argument("--num_agents", type=int, default=2)
+    parser.add_argument("--iters", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.list or args.name is None:
+        print("\n".join(sorted(BENCHMARKS.keys())))
+    else:
+        BENCHMARKS[args.name](args)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Export the actor of mid-level OpenRL checkpoints to an inference-only directory next to each module.pt:
+    actor/actor.jit.pt           TorchScript (obs, rnn_states, masks) -> (actions, rnn_states), deterministic
+    actor/actor_state_dict.pt    state dict of the same module
+    actor/spec.json              input / output spec (also embedded in actor.jit.pt)
+Point cfg.control.command_network_path of the upper config to the actor directory to load it without OpenRL.
+Exporting needs the training environment (isaacgym and openrl are required to unpickle module.pt).
+
+Usage (from the repository root):
+    python helpers/export_command_actor.py results/*/checkpoints/rl_model_*_steps/module.pt
+"""
+
+import isaacgym
+import argparse
+import json
+import os
+import sys
+import time
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mqe.envs.wrappers.utils.command_policy import (ACTOR_JIT_FILE, ACTOR_SPEC_FILE, ACTOR_STATE_DICT_FILE,
+                                                    OpenRLActor, load_command_actor, openrl_actor_spec)
+
+
+class DeterministicActor(torch.nn.Module):
+    """ Feature MLP of the policy network followed by the mean of its Gaussian head (the deterministic action) """
+    def __init__(self, base, fc_mean):
+        super().__init__()
+        self.base = base
+        self.fc_mean = fc_mean
+
+    def forward(self, obs, rnn_states, masks):
+        return self.fc_mean(self.base(obs)), rnn_states
+
+
+def tensor_bytes(modules):
+    return sum(t.numel() * t.element_size() for m in modules for t in list(m.parameters()) + list(m.buffers()))
+
+
+def export(path, output_dir=None, num_samples=1024):
+    output_dir = output_dir if output_dir is not None else os.path.join(os.path.dirname(path), "actor")
+
+    t0 = time.perf_counter()
+    module = torch.load(path, map_location="cpu")
+    legacy_load_s = time.perf_counter() - t0
+
+    policy = module.models["policy"]
+    openrl_actor = OpenRLActor(policy).eval()
+    spec = openrl_actor_spec(module, openrl_actor)
+    if spec["recurrent"] or not getattr(policy.act, "continuous_action", True):
+        raise ValueError(f"{path}: only non recurrent policies with a continuous action head can be exported")
+
+    actor = DeterministicActor(policy.base, policy.act.action_out.fc_mean).eval()
+    obs = torch.randn(num_samples, spec["obs_dim"])
+    rnn_states = torch.zeros(num_samples, *spec["rnn_shape"])
+    masks = torch.ones(num_samples, 1)
+    with torch.no_grad():
+        traced = torch.jit.trace(actor, (obs, rnn_states, masks))
+        expected, _ = openrl_actor(obs, rnn_states, masks)
+        max_err = (traced(obs, rnn_states, masks)[0] - expected).abs().max().item()
+    if max_err > 1e-5:
+        raise RuntimeError(f"{path}: exported actor deviates from the OpenRL actor (max err {max_err:.2e})")
+
+    spec.update(source=os.path.relpath(path), format_version=1)
+    os.makedirs(output_dir, exist_ok=True)
+    torch.jit.save(traced, os.path.join(output_dir, ACTOR_JIT_FILE), _extra_files={ACTOR_SPEC_FILE: json.dumps(spec)})
+    torch.save(actor.state_dict(), os.path.join(output_dir, ACTOR_STATE_DICT_FILE))
+    with open(os.path.join(output_dir, ACTOR_SPEC_FILE), "w") as f:
+        json.dump(spec, f, indent=4)
+
+    t0 = time.perf_counter()
+    exported, _ = load_command_actor(output_dir, device="cpu")
+    load_s = time.perf_counter() - t0
+
+    print(f"{path} -> {output_dir} (max err {max_err:.2e})")
+    print(f"    load time   module.pt {legacy_load_s * 1000:8.1f} ms | actor {load_s * 1000:8.1f} ms")
+    print(f"    file size   module.pt {os.path.getsize(path) / 2**20:8.2f} MB | actor {os.path.getsize(os.path.join(output_dir, ACTOR_JIT_FILE)) / 2**20:8.2f} MB")
+    print(f"    tensors     module.pt {tensor_bytes(module.models.values()) / 2**20:8.2f} MB | actor {tensor_bytes([exported]) / 2**20:8.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="module.pt files of OpenRL checkpoints")
+    parser.add_argument("--output_dir", type=str, default=None, help="output directory, only valid with a single path")
+    args = parser.parse_args()
+
+    if args.output_dir is not None and len(args.paths) > 1:
+        parser.error("--output_dir can only be used with a single checkpoint")
+    for path in args.paths:
+        export(path, args.output_dir)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Fit the piecewise linear actuator surrogate (mqe/envs/go1/actuator_surrogate.py) to the Go1 actuator network.
+
+The training inputs are (num_samples, 6) joint position errors and velocities of the last 3 substeps, logged
+by a Go1 env with cfg.control.actuator_log_size > 0 and saved with env.save_actuator_log(path). Without a log
+the inputs are sampled around a walking gait, which covers the network less faithfully.
+The torques are the outputs of the network itself. The fit error is reported on held-out samples, then select
+the surrogate with cfg.control.actuator_model = "surrogate".
+
+Usage (from the repository root):
+    python helpers/fit_actuator_surrogate.py --inputs actuator_log.pt
+    python helpers/fit_actuator_surrogate.py --num_samples 1000000 --num_knots 12
+"""
+
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mqe.envs.go1.actuator_surrogate import PiecewiseLinearActuator, fit_error
+
+
+def sample_inputs(num_samples, err_std=0.1, err_step_std=0.02, vel_std=2.0, vel_step_std=0.5):
+    """ Correlated error / velocity histories, (num_samples, 6) """
+    err = torch.randn(num_samples, 1) * err_std + torch.randn(num_samples, 3).cumsum(dim=1) * err_step_std
+    vel = torch.randn(num_samples, 1) * vel_std + torch.randn(num_samples, 3).cumsum(dim=1) * vel_step_std
+    return torch.cat([err, vel], dim=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--network", type=str, default="./resources/actuator_nets/unitree_go1.pt")
+    parser.add_argument("--inputs", type=str, default=None, help="logged (num_samples, 6) actuator inputs, see Go1.save_actuator_log")
+    parser.add_argument("--num_samples", type=int, default=500000, help="sampled inputs when no log is given")
+    parser.add_argument("--num_knots", type=int, default=8)
+    parser.add_argument("--holdout", type=float, default=0.1)
+    parser.add_argument("--output", type=str, default="./resources/actuator_nets/unitree_go1_surrogate.pt")
+    args = parser.parse_args()
+
+    network = torch.jit.load(args.network, map_location="cpu")
+    xs = torch.load(args.inputs, map_location="cpu").float() if args.inputs is not None else sample_inputs(args.num_samples)
+    with torch.no_grad():
+        torques = network(xs)
+
+    perm = torch.randperm(xs.shape[0])
+    num_test = int(xs.shape[0] * args.holdout)
+    test, train = perm[:num_test], perm[num_test:]
+    surrogate = PiecewiseLinearActuator.fit(xs[train], torques[train], num_knots=args.num_knots)
+
+    for name, ids in (("train", train), ("held-out", test)):
+        err = fit_error(surrogate, xs[ids], torques[ids])
+        print(f"{name:<9} samples {len(ids):>8} | rmse {err['rmse']:.4f} Nm | max abs {err['max_abs']:.4f} Nm | r2 {err['r2']:.5f}")
+
+    surrogate.save(args.output)
+    print(f"saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,6 +48,8 @@ from mqe.envs.base.base_task import BaseTask
 from mqe.utils.terrain.terrain import Terrain
 from mqe.utils.math import quat_apply_yaw, wrap_to_pi, torch_rand_sqrt_float
 from mqe.utils.helpers import class_to_dict
+from mqe.envs.obstacle_field import ObstacleDistanceField
+from mqe.envs.state_cache import StepStateCache
 from .legged_robot_config import LeggedRobotCfg
 
 from mqe.envs.utils_dist import dist_calculator
@@ -164,6 +166,7 @@ class LeggedRobot(BaseTask):
         self.root_states_npc = self.all_root_states.view(self.num_envs, -1, 13)[:, self.num_agents:, :].reshape(-1, 13) # (num_envs * num_npcs, 13)
         self.base_pos_npc = self.root_states_npc[:, 0:3]
         self.base_quat_npc = self.root_states_npc[:, 3:7]
+        self.state_cache.begin_step(self.root_states, self.base_quat, self.root_states_npc)
 
         self._post_physics_step_callback()
 
@@ -174,8 +177,11 @@ class LeggedRobot(BaseTask):
         self._step_npc()
         self.reset_ids = env_ids
         self.reset_idx(env_ids)
+        self.state_cache.update_states(self.root_states, self.root_states_npc, env_ids)
         if getattr(self.cfg.goal, "sequential_goal_pos", False) or getattr(self.cfg.goal, "received_goal_pos", False):
             self._update_target_state()
+            # only positions are written, the npc rotations stay valid
+            self.state_cache.update_states(self.root_states, self.root_states_npc)
         self.compute_observations() # in some cases a simulation step might be required to refresh some obs (for example body positions)
 
         self.last_actions[:] = self.actions[:]
@@ -201,7 +207,10 @@ class LeggedRobot(BaseTask):
         npc_state = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)
         box_state = npc_state[:, 0, :]
         target_state = npc_state[:, 1, :]
-        self.reach_subgoal_buf = self.dist_calculator.cal_dist(box_state,target_state) < self.cfg.goal.THRESHOLD
+        if self.dist_calculator.general_dist:
+            self.reach_subgoal_buf = self.dist_calculator.cal_dist(box_state, target_state, self.state_cache.box_yaw, self.state_cache.target_yaw) < self.cfg.goal.THRESHOLD
+        else:
+            self.reach_subgoal_buf = self.dist_calculator.cal_dist(box_state,target_state) < self.cfg.goal.THRESHOLD
         if getattr(self.cfg.goal, "sequential_goal_pos", False):
             final_pos = self.goal_point_list[-1].clone().detach().to(self.device).repeat(self.num_envs, 1)
             final_pos[:,:3] += self.env_origins
@@ -436,7 +445,7 @@ class LeggedRobot(BaseTask):
         """
         #pd controller
         if isinstance(self.cfg.control.action_scale, (tuple, list)):
-            self.cfg.control.action_scale = torch.tensor(self.cfg.control.action_scale, device= self.sim_device)
+            self.cfg.control.action_scale = torch.tensor(self.cfg.control.action_scale, device= self.device)
         actions_scaled = actions * self.cfg.control.action_scale
         control_type = self.cfg.control.control_type
         if control_type=="P":
@@ -506,6 +515,8 @@ class LeggedRobot(BaseTask):
                                                                         torch_rand_float(*self.cfg.obstacle_state.random_obs_rpy_range["p"], (len(obs_ids), 1), device=self.device),
                                                                         torch_rand_float(*self.cfg.obstacle_state.random_obs_rpy_range["y"], (len(obs_ids), 1), device=self.device)).squeeze()
                 base_init_state_npc[obs_ids, 0:3] += self.env_origins[env_ids].repeat(self.num_npcs,1)[obs_ids]
+            obs_pos_local = base_init_state_npc[obs_ids, :2].reshape(len(env_ids), self.num_obs, 2) - self.env_origins[env_ids, :2].unsqueeze(1)
+            self.obstacle_field.rebuild(obs_pos_local, env_ids)
 
         # add noise to init box state
         if True:
@@ -518,16 +529,13 @@ class LeggedRobot(BaseTask):
                 else:
                     # check collsion with obstacle
                     box_init_state = deepcopy(base_init_state_npc[box_ids])
-                    obs_state = base_init_state_npc[obs_ids].reshape(len(env_ids), self.num_obs, -1)
                     collision_flag = torch.ones(len(box_ids), dtype=torch.bool, device=self.device)
                     while torch.any(collision_flag):
                         box_init_state[collision_flag, 0] = torch_rand_float(*self.cfg.domain_rand.init_npc_pos_range["x"], (torch.sum(collision_flag),1), device=self.device).reshape(-1)
                         box_init_state[collision_flag, 1] = torch_rand_float(*self.cfg.domain_rand.init_npc_pos_range["y"], (torch.sum(collision_flag),1), device=self.device).reshape(-1)
                         box_init_state[collision_flag, 0:3] += self.env_origins[env_ids][collision_flag]
-                        check_collision_flag = torch.zeros(torch.sum(collision_flag), dtype=torch.bool, device=self.device)
-                        for i in range(self.num_obs):
-                            obs_state_i = obs_state[:, i, :]
-                            check_collision_flag |= torch.norm(box_init_state[collision_flag, :2] - obs_state_i[collision_flag, :2], dim=1) < self.cfg.domain_rand.obs_collision_threshold
+                        box_pos_local = box_init_state[collision_flag, :2] - self.env_origins[env_ids][collision_flag, :2]
+                        check_collision_flag = self.obstacle_field.distance(box_pos_local, env_ids[collision_flag]) < self.cfg.domain_rand.obs_collision_threshold
                         _collision_flag = deepcopy(collision_flag)
                         _collision_flag[collision_flag] = check_collision_flag
                         collision_flag = _collision_flag
@@ -685,11 +693,11 @@ class LeggedRobot(BaseTask):
         if len(reset_envs) > 0:
             final_goal =  self.cfg.goal.received_final_pos.clone().detach().to(self.device)
             final_goal =  final_goal + self.env_origins
-            if self.num_obs > 0:
-                obs1_pos = self.cfg.obstacle_state.obs1_pos + self.env_origins
-                obs2_pos = self.cfg.obstacle_state.obs2_pos + self.env_origins
-                self.root_states_npc.reshape(-1, self.num_npcs, 13)[:, 3, :3] = obs1_pos
-                self.root_states_npc.reshape(-1, self.num_npcs, 13)[:, 4, :3] = obs2_pos
+            obstacle_pos = getattr(self.cfg.obstacle_state, "obstacle_pos", None)
+            if self.num_obs > 0 and obstacle_pos is not None:
+                # (num_envs, num_obs, 3) env frame obstacles into the npc slots after the box, target and final target
+                self.root_states_npc.reshape(-1, self.num_npcs, 13)[:, 3:3 + self.num_obs, :3] = obstacle_pos + self.env_origins.unsqueeze(1)
+                self.obstacle_field.update(obstacle_pos[..., :2])
             self.root_states_npc.reshape(-1, self.num_npcs, 13)[:, 2, :3] = final_goal
             self.root_states = deepcopy(self.root_states.reshape(-1, 13))
             self.base_init_state_npc_net = deepcopy(self.root_states_npc.reshape(-1, 13))
@@ -829,6 +837,9 @@ class LeggedRobot(BaseTask):
         self.root_states_npc = self.all_root_states.view(self.num_envs, -1, 13)[:, self.num_agents:, :].reshape(-1, 13) # (num_envs * num_npcs, 13)
         self.base_pos_npc = self.root_states_npc[:, 0:3]
         self.base_quat_npc = self.root_states_npc[:, 3:7]
+        # derived poses (rpy, box frame, ...) of the current step, see mqe/envs/state_cache.py
+        self.state_cache = StepStateCache(self.num_envs, self.num_agents, self.num_npcs, self.env_origins)
+        self.state_cache.begin_step(self.root_states, self.base_quat, self.root_states_npc)
 
         # dof state
         self.all_dof_states = gymtorch.wrap_tensor(dof_state_tensor)
@@ -901,6 +912,14 @@ class LeggedRobot(BaseTask):
                         print(f"PD gain of joint {name} were not defined, setting them to zero")
         self.default_dof_pos = self.default_dof_pos.unsqueeze(0)
 
+        # env frame distance to the obstacles, rebuilt when they are reset or moved
+        self.obstacle_field = None
+        if self.num_obs > 0:
+            field_kwargs = getattr(self.cfg.obstacle_state, "distance_field_kwargs", None)
+            if field_kwargs is None:
+                field_kwargs = dict(x_lim=self.cfg.obstacle_state.random_obs_x_range, y_lim=self.cfg.obstacle_state.random_obs_y_range)
+            self.obstacle_field = ObstacleDistanceField(self.num_envs, self.num_obs, device=self.device, **field_kwargs)
+
     def _reset_buffers(self, env_ids):
         self.last_actions[env_ids] = 0.
         self.last_dof_vel[env_ids] = 0.
@@ -13,6 +13,7 @@ class Go1PushUpperCfg(Go1Cfg):
         episode_length_s = 160
         hie = True
         record_video = True
+        obstacle_obs_k = None   # None: all num_obs obstacles in the observation, k: the k obstacles nearest to the box (fixed observation size)
 
     # config of the robot 
     class asset(Go1Cfg.asset):
@@ -87,6 +88,7 @@ class Go1PushUpperCfg(Go1Cfg):
     # velocity control
     class control(Go1Cfg.control):
         control_type = 'C'
+        # OpenRL module.pt, or the actor directory exported by helpers/export_command_actor.py (loads without OpenRL)
         command_network_path = "./results/11-07-17_cuboid/checkpoints/rl_model_130000000_steps/module.pt"
 
     # termination conditions
@@ -98,7 +100,8 @@ class Go1PushUpperCfg(Go1Cfg):
         #    "pitch",
         #    "z_wave",
         #    "collision",
-        #    "far_away"
+        #    "far_away",
+        #    "value_exception", # nan or inf in the agent / npc states
         ]
 
     # viewer setting
@@ -114,6 +117,7 @@ class Go1PushUpperCfg(Go1Cfg):
             reach_target_reward_scale = 2
             exception_punishment_scale = -0.5
             obstacle_reward_scale = -0.1
+        obstacle_reward_nearest = False     # True: obstacle reward of the nearest obstacle only, from the obstacle distance field (instead of the sum over obstacles)
 
     # goal setting
     class goal:
@@ -168,12 +172,30 @@ class Go1PushUpperCfg(Go1Cfg):
                         p= [-0.01, 0.01],
                         y= [-0.01, 2 * np.pi],
                     )  
-        obs1_pos = [0.0, 0.0, 0.0]
-        obs2_pos = [0.0, 0.0, 0.0]
+        obstacle_pos = None     # (num_envs, num_obs, 3) env frame, set by Go1PushUpperWrapper
+        # per-env distance to the obstacles (env frame), see mqe/envs/obstacle_field.py
+        distance_field_kwargs = dict(x_lim=(0, 14), y_lim=(-7.5, 7.5), resolution=0.2, margin=2.0)
         check_setting = [static_obs_pos, random_obs_pos]
         if check_setting.count(True) != 1:
             raise ValueError("Only one of static_obs_pos, random_obs_pos can be True")
 
+    # obstacle-aware path planning at reset, replaces the spline trajectory of the planned envs
+    class planner:
+        type = "batched_rrt"    # "rrt": KinodynamicRRT one env at a time, "batched_rrt": BatchedRRT all envs at once, "grid": GridPlanner wavefront, all envs at once
+        x_lim = (0, 14)
+        y_lim = (-7, 7)
+        max_nodes = 4096        # batched_rrt only, preallocated tree size per env
+        rrt_kwargs = dict(action_scale=0.75, timeout=60, goal_sample_prob=0.75, REACH_THERESHOLD=1.5, COLLISION_THERESHOLD=0.3)
+        grid_kwargs = dict(resolution=0.3, obstacle_radius=0.5)    # grid only, obstacles are inflated by obstacle_radius + the box footprint radius
+        cache_path = None       # e.g. "./resources/plan_cache/push_upper.npz", persistent LRU cache of the planned paths (None: in memory only)
+        cache_capacity = 100000
+        cache_resolution = 0.1  # quantization (m) of the start, target and obstacle positions in the cache key
+        async_workers = 0       # > 0: plan in a pool of CPU worker processes, envs follow their spline until the path arrives
+        async_max_queue = 4096  # queued envs, the oldest requests are dropped beyond it
+        async_batch_size = 64   # envs per worker task
+        record_tree = False     # keep the planning trees in the wrapper's tree_recorder (not with async planning), rendered on request
+        record_max_plans = 16   # recorded trees, the later plans are not kept
+
     # init state of robot sysytem
     class init_state(Go1Cfg.init_state):
         multi_init_state = True
@@ -1,7 +1,7 @@
 from collections import OrderedDict, defaultdict
 import itertools
 import numpy as np
-from isaacgym.torch_utils import torch_rand_float, get_euler_xyz, quat_from_euler_xyz, tf_apply
+from isaacgym.torch_utils import torch_rand_float, quat_from_euler_xyz, tf_apply
 from isaacgym import gymtorch, gymapi, gymutil
 from copy import deepcopy
 import torch
@@ -133,18 +133,24 @@ class LeggedRobotField(LeggedRobot):
         return_ = super().check_termination()
         if not hasattr(self.cfg, "termination"): return return_
         
-        r, p, y = get_euler_xyz(self.base_quat)
-        r[r > np.pi] -= np.pi * 2 # to range (-pi, pi)
-        p[p > np.pi] -= np.pi * 2 # to range (-pi, pi)
+        r, p, y = self.state_cache.base_rpy.unbind(dim=1)
+        r = torch.where(r > np.pi, r - np.pi * 2, r) # to range (-pi, pi), not in place: base_rpy is shared
+        p = torch.where(p > np.pi, p - np.pi * 2, p) # to range (-pi, pi)
         z = self.root_states[:, 2] - self.agent_origins.reshape(-1, 3)[:, 2]
 
         base_init_state = deepcopy(self.base_init_state[:, :3].reshape(self.num_envs,self.num_agents, -1))
         base_init_state_npc = deepcopy(self.base_init_state_npc[:, :3].reshape(self.num_envs,self.num_npcs, -1))
-        base_state = (self.root_states[:, :3]-self.env_origins.repeat(self.num_agents, 1)).reshape(self.num_envs, self.num_agents, -1)
-        base_state_npc = (self.root_states_npc[:, :3]-self.env_origins.repeat(self.num_npcs, 1)).reshape(self.num_envs, self.num_npcs, -1)
+        # env frame positions of the step, nan / inf already replaced by the state cache
+        base_state = self.state_cache.base_pos
+        base_state_npc = self.state_cache.npc_pos
 
         self.exception_buf = torch.zeros(self.num_envs, dtype= torch.bool, device= self.device)
 
+        if "value_exception" in self.cfg.termination.termination_terms:
+            # nan or inf in the states would silently pass all the threshold checks below
+            self.value_exception_term_buff = self.state_cache.value_exception("base_rpy", "base_pos", "npc_pos")
+            self.exception_buf |= self.value_exception_term_buff
+
         if "roll" in self.cfg.termination.termination_terms:
             self.r_term_buff = (torch.abs(r) > self.cfg.termination.roll_kwargs["threshold"]).reshape(self.num_envs, -1).sum(1).to(torch.bool)
             self.exception_buf |= self.r_term_buff
@@ -179,14 +185,8 @@ class LeggedRobotField(LeggedRobot):
         
         if "out_of_area" in self.cfg.termination.termination_terms:
             self.out_of_area_term_buff = torch.zeros(self.num_envs, dtype= torch.bool, device= self.device)
-            # transfer agent_state to box coordinate
-            box_pos = base_state_npc[:,0,:2]
-            box_qyaternion = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:, 0 , 3:7]
-            box_rpy = torch.stack(get_euler_xyz(box_qyaternion), dim=1)
-            agent_pos_relative_to_box = base_state[:,:,:2] - box_pos.unsqueeze(1).repeat(1,self.num_agents,1)
-            # rotate agent_pos_relative_to_box to box coordinate
-            agent_pos_relative_to_box = torch.stack([agent_pos_relative_to_box[:,:,0]*torch.cos(box_rpy[:,2].unsqueeze(1)) + agent_pos_relative_to_box[:,:,1]*torch.sin(box_rpy[:,2].unsqueeze(1)),
-                                                     -agent_pos_relative_to_box[:,:,0]*torch.sin(box_rpy[:,2].unsqueeze(1)) + agent_pos_relative_to_box[:,:,1]*torch.cos(box_rpy[:,2].unsqueeze(1))], dim=2)
+            # agent_state in box coordinate
+            agent_pos_relative_to_box = self.state_cache.agent_pos_in_box_frame
             agent_x_relative_to_box = agent_pos_relative_to_box[:,:,0]
             agent_y_relative_to_box = agent_pos_relative_to_box[:,:,1]
             # check if agent is out of area
@@ -209,13 +209,13 @@ class LeggedRobotField(LeggedRobot):
         self.last_init_finished_buf = deepcopy(self.init_finished_buf)
 
         # calc collaboration degree and collision degree
-        obs_pos  = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:,2:2+self.num_obs,:2]
         box_pos  = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:,0,:2]
         base_pos = self.root_states.reshape(self.num_envs, self.num_agents, -1)[:,:,:2]
 
         if self.num_obs != 0:
             collision_threshold = getattr(self.cfg.goal, "collision_threshold", 1.0)
-            collision_dist,_ = torch.min(torch.norm(obs_pos - box_pos.unsqueeze(1).repeat(1,self.num_obs,1),dim=2),dim=1)
+            # cleaned box position (nan / inf -> 0, flagged by the value_exception term)
+            collision_dist = self.obstacle_field.distance(self.state_cache.npc_pos[:, 0, :2])
             collision_check = collision_dist < collision_threshold
             collision_buf = collision_check & ~self.init_reset_buf
             self.collision_degree_buf[collision_buf] +=1 
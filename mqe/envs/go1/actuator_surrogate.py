@@ -0,0 +1,52 @@
+import torch
+
+class PiecewiseLinearActuator(torch.nn.Module):
+    """ Additive piecewise linear surrogate of the actuator network, (N, 6) -> (N, 1) torques.
+
+    torque = bias + sum_i w_i x_i + sum_i sum_k v_ik relu(x_i - knot_ik) over the 6 inputs
+    (err, err_last, err_last_last, vel, vel_last, vel_last_last). The knots are quantiles of the fitted
+    inputs and the weights are the ridge least squares solution, so fitting has no training loop.
+    Evaluating it is one (N, 6 * num_knots) hinge tensor and two small matmuls.
+    """
+    def __init__(self, knots, linear, hinge_weights, bias):
+        super().__init__()
+        self.register_buffer("knots", knots)                    # (6, num_knots)
+        self.register_buffer("linear", linear)                  # (6, 1)
+        self.register_buffer("hinge_weights", hinge_weights)    # (6 * num_knots, 1)
+        self.register_buffer("bias", bias)                      # (1,)
+
+    @staticmethod
+    def features(xs, knots):
+        return torch.cat([xs, torch.relu(xs.unsqueeze(2) - knots).flatten(1)], dim=1)
+
+    def forward(self, xs):
+        hinges = torch.relu(xs.unsqueeze(2) - self.knots).flatten(1)
+        return torch.addmm(self.bias, xs, self.linear) + hinges @ self.hinge_weights
+
+    @classmethod
+    def fit(cls, xs, torques, num_knots=8, ridge=1e-6):
+        """ Fit to (N, 6) actuator inputs and the (N, 1) torques of the network """
+        xs = xs.float()
+        torques = torques.float().view(-1, 1)
+        quantiles = torch.linspace(0, 1, num_knots + 2, device=xs.device)[1:-1]
+        knots = torch.quantile(xs, quantiles, dim=0).T.contiguous()
+        features = torch.cat([cls.features(xs, knots), torch.ones(xs.shape[0], 1, device=xs.device)], dim=1)
+        gram = features.T @ features + ridge * xs.shape[0] * torch.eye(features.shape[1], device=xs.device)
+        weights = torch.linalg.solve(gram, features.T @ torques)
+        return cls(knots, weights[:6].clone(), weights[6:-1].clone(), weights[-1].clone())
+
+    def save(self, path):
+        torch.save({"knots": self.knots, "linear": self.linear, "hinge_weights": self.hinge_weights, "bias": self.bias}, path)
+
+    @classmethod
+    def load(cls, path, device="cpu"):
+        state = torch.load(path, map_location=device)
+        return cls(state["knots"], state["linear"], state["hinge_weights"], state["bias"])
+
+def fit_error(model, xs, torques):
+    """ RMSE, max abs error (Nm) and R^2 of model on (N, 6) inputs and (N, 1) torques """
+    with torch.no_grad():
+        err = model(xs).view(-1) - torques.view(-1)
+    rmse = err.pow(2).mean().sqrt().item()
+    r2 = 1 - err.pow(2).sum().item() / (torques - torques.mean()).pow(2).sum().clamp(min=1e-12).item()
+    return {"rmse": rmse, "max_abs": err.abs().max().item(), "r2": r2}
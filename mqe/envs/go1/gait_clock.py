@@ -0,0 +1,25 @@
+import torch
+
+def foot_phases(gait_indices, gait_params):
+    """ Phase of every foot (FL, FR, RL, RR) for all robots at once.
+
+    Args:
+        gait_indices: (robots,) gait clock in [0, 1)
+        gait_params: (robots, 4) phases, offsets, bounds and durations of the gait command
+    Returns:
+        foot_indices: (robots, 4) foot phases in [0, 1)
+        warped: (robots, 4) stance mapped to [0, 0.5) and swing to [0.5, 1), a phase equal to the duration is
+            kept unwrapped, as in the per foot version
+    """
+    phases = gait_params[:, 0:1]
+    offsets = gait_params[:, 1:2]
+    bounds = gait_params[:, 2:3]
+    durations = gait_params[:, 3:4]
+    gait_indices = gait_indices.unsqueeze(1)
+    raw = torch.cat([gait_indices + phases + offsets + bounds, gait_indices + offsets, gait_indices + bounds, gait_indices + phases], dim=1)
+    foot_indices = torch.remainder(raw, 1.0)
+
+    stance = foot_indices * (0.5 / durations)
+    swing = 0.5 + (foot_indices - durations) * (0.5 / (1 - durations))
+    warped = torch.where(foot_indices < durations, stance, torch.where(foot_indices > durations, swing, raw))
+    return foot_indices, warped
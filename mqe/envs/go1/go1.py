@@ -13,6 +13,10 @@ from mqe import LEGGED_GYM_ROOT_DIR, envs
 from mqe.envs.base.legged_robot import LeggedRobot
 from mqe.envs.field.legged_robot_field import LeggedRobotField
 from mqe.envs.go1.go1_config import Go1Cfg
+from mqe.envs.go1.history_buffer import HistoryBuffer
+from mqe.envs.go1.locomotion_inference import LocomotionInference
+from mqe.envs.go1.actuator_surrogate import PiecewiseLinearActuator
+from mqe.envs.go1.gait_clock import foot_phases
 from mqe.utils.math import quat_apply_yaw, wrap_to_pi, torch_rand_sqrt_float
 from mqe.utils.helpers import class_to_dict
 
@@ -62,34 +66,12 @@ class Go1(LeggedRobotField):
     
     def preprocess_action(self, actions):
 
-        if self.cfg.command.cfg.vel:
-            self.locomotion_obs[:, 3:5] = actions[:, self.vel_idx : self.vel_idx + 2] * self.cfg.control.obs_scales.lin_vel
-            self.locomotion_obs[:, 5] = actions[:, self.vel_idx + 2] * self.cfg.control.obs_scales.ang_vel
-        
-        if self.cfg.command.cfg.body_height:
-            self.locomotion_obs[:, 6] = actions[:, self.body_height_idx] * self.cfg.control.obs_scales.body_height
-        
-        if self.cfg.command.cfg.gait_freq:
-            self.locomotion_obs[:, 7] = actions[:, self.gait_freq_idx] * self.cfg.control.obs_scales.gait_freq
-
         if self.cfg.command.cfg.gait:
             raise NotImplementedError
-            
-        if self.cfg.command.cfg.footswing_height:
-            self.locomotion_obs[:, 12] = actions[:, self.footswing_height_idx] * self.cfg.control.obs_scales.footswing_height
-
-        if self.cfg.command.cfg.body_pose:
-            self.locomotion_obs[:, 13] = actions[:, self.body_pose_idx] * self.cfg.control.obs_scales.body_pitch
-            self.locomotion_obs[:, 14] = actions[:, self.body_pose_idx+1] * self.cfg.control.obs_scales.body_roll
-
-        if self.cfg.command.cfg.stance_width:
-            self.locomotion_obs[:, 15] = actions[:, self.stance_width_idx] * self.cfg.control.obs_scales.stance_width
 
-        if self.cfg.command.cfg.stance_length:
-            self.locomotion_obs[:, 16] = actions[:, self.stance_length_idx] * self.cfg.control.obs_scales.stance_length
-
-        if self.cfg.command.cfg.aux_reward:
-            self.locomotion_obs[:, 17] = actions[:, self.aux_reward_idx] * self.cfg.control.obs_scales.aux_reward
+        # commanded entries of the locomotion observation, index map built in _fill_command_obs
+        if len(self.command_obs_ids) > 0:
+            self.locomotion_obs[:, self.command_obs_ids] = actions[:, self.command_action_ids] * self.command_obs_scales
 
         self.locomotion_obs[:, 0 : 3] = self.obs_buf.projected_gravity
         self.locomotion_obs[:, 18 : 30] = self.obs_buf.dof_pos
@@ -97,8 +79,8 @@ class Go1(LeggedRobotField):
         self.locomotion_obs[:, 42 : 54] = self.last_locomotion_action
         self.locomotion_obs[:, 54 : 66] = self.last_two_locomotion_action
         self.locomotion_obs[:, 66 : 70] = self.obs_buf.clock_inputs
-        obs = self.locomotion_obs
-        self.history_locomotion_obs = torch.cat((self.history_locomotion_obs[:, 70:], self.locomotion_obs), dim=-1)
+        self.locomotion_history.push(self.locomotion_obs)
+        self.history_locomotion_obs = self.locomotion_history.get()
 
         locomotion_action = self.locomotion_policy(self.history_locomotion_obs)
 
@@ -141,11 +123,13 @@ class Go1(LeggedRobotField):
         super()._reset_buffers(env_ids)
         agent_ids = self.env_agent_indices[env_ids].reshape(-1)
         self.gait_indices[agent_ids] = 0
-        self.history_locomotion_obs[agent_ids] = 0
+        if self.cfg.control.control_type == "C":
+            self.locomotion_history.reset(agent_ids)
 
     def reset(self):
         """ Reset all robots"""
         self.reset_idx(torch.arange(self.num_envs, device=self.device))
+        self.state_cache.begin_step(self.root_states, self.base_quat, self.root_states_npc)
         self.compute_observations()
         return self.obs_buf
     
@@ -187,9 +171,18 @@ class Go1(LeggedRobotField):
         if self.cfg.obs.cfgs.clock_inputs or self.cfg.control.control_type == "C":
             assert self.cfg.control.control_type == "C", "To active clock_inputs, control_type should be set to \"C\" instead of \"{}\"".format(self.cfg.control.control_type)
             self.obs_buf.clock_inputs = copy(self.clock_inputs)
+
+        if getattr(self.cfg.obs.cfgs, "doubletime_clock_inputs", False):
+            self.obs_buf.doubletime_clock_inputs = copy(self.doubletime_clock_inputs)
+
+        if getattr(self.cfg.obs.cfgs, "halftime_clock_inputs", False):
+            self.obs_buf.halftime_clock_inputs = copy(self.halftime_clock_inputs)
+
+        if getattr(self.cfg.obs.cfgs, "desired_contact_states", False):
+            self.obs_buf.desired_contact_states = copy(self.desired_contact_states)
         
         if self.cfg.obs.cfgs.base_rpy:
-            self.obs_buf.base_rpy = torch.stack(get_euler_xyz(self.base_quat), dim=1)
+            self.obs_buf.base_rpy = self.state_cache.base_rpy
         
         if self.cfg.obs.cfgs.env_info and hasattr(self, "env_info"):
             self.obs_buf.env_info = self.env_info
@@ -239,74 +232,25 @@ class Go1(LeggedRobotField):
     def _step_contact_targets(self):
         if self.cfg.obs.cfgs.clock_inputs or self.cfg.control.control_type == "C":
             frequencies = self.locomotion_obs[:, 7]
-            phases = self.locomotion_obs[:, 8]
-            offsets = self.locomotion_obs[:, 9]
-            bounds = self.locomotion_obs[:, 10]
-            durations = self.locomotion_obs[:, 11]
             self.gait_indices = torch.remainder(self.gait_indices + self.dt * frequencies, 1.0)
 
-            foot_indices = [self.gait_indices + phases + offsets + bounds,
-                            self.gait_indices + offsets,
-                            self.gait_indices + bounds,
-                            self.gait_indices + phases]
-
-            self.foot_indices = torch.remainder(torch.cat([foot_indices[i].unsqueeze(1) for i in range(4)], dim=1), 1.0)
-
-            for idxs in foot_indices:
-                stance_idxs = torch.remainder(idxs, 1) < durations
-                swing_idxs = torch.remainder(idxs, 1) > durations
-
-                idxs[stance_idxs] = torch.remainder(idxs[stance_idxs], 1) * (0.5 / durations[stance_idxs])
-                idxs[swing_idxs] = 0.5 + (torch.remainder(idxs[swing_idxs], 1) - durations[swing_idxs]) * (
-                            0.5 / (1 - durations[swing_idxs]))
+            # (robots, 4) over the feet, from the phases, offsets, bounds and durations of the gait command
+            self.foot_indices, foot_indices = foot_phases(self.gait_indices, self.locomotion_obs[:, 8:12])
 
             # if self.cfg.commands.durations_warp_clock_inputs:
 
-            self.clock_inputs[:, 0] = torch.sin(2 * np.pi * foot_indices[0])
-            self.clock_inputs[:, 1] = torch.sin(2 * np.pi * foot_indices[1])
-            self.clock_inputs[:, 2] = torch.sin(2 * np.pi * foot_indices[2])
-            self.clock_inputs[:, 3] = torch.sin(2 * np.pi * foot_indices[3])
-
-            self.doubletime_clock_inputs[:, 0] = torch.sin(4 * np.pi * foot_indices[0])
-            self.doubletime_clock_inputs[:, 1] = torch.sin(4 * np.pi * foot_indices[1])
-            self.doubletime_clock_inputs[:, 2] = torch.sin(4 * np.pi * foot_indices[2])
-            self.doubletime_clock_inputs[:, 3] = torch.sin(4 * np.pi * foot_indices[3])
-
-            self.halftime_clock_inputs[:, 0] = torch.sin(np.pi * foot_indices[0])
-            self.halftime_clock_inputs[:, 1] = torch.sin(np.pi * foot_indices[1])
-            self.halftime_clock_inputs[:, 2] = torch.sin(np.pi * foot_indices[2])
-            self.halftime_clock_inputs[:, 3] = torch.sin(np.pi * foot_indices[3])
-
-        #     # von mises distribution
-        #     kappa = self.cfg.rewards.kappa_gait_probs
-        #     smoothing_cdf_start = torch.distributions.normal.Normal(0,
-        #                                                             kappa).cdf  # (x) + torch.distributions.normal.Normal(1, kappa).cdf(x)) / 2
-
-        #     smoothing_multiplier_FL = (smoothing_cdf_start(torch.remainder(foot_indices[0], 1.0)) * (
-        #             1 - smoothing_cdf_start(torch.remainder(foot_indices[0], 1.0) - 0.5)) +
-        #                                smoothing_cdf_start(torch.remainder(foot_indices[0], 1.0) - 1) * (
-        #                                        1 - smoothing_cdf_start(
-        #                                    torch.remainder(foot_indices[0], 1.0) - 0.5 - 1)))
-        #     smoothing_multiplier_FR = (smoothing_cdf_start(torch.remainder(foot_indices[1], 1.0)) * (
-        #             1 - smoothing_cdf_start(torch.remainder(foot_indices[1], 1.0) - 0.5)) +
-        #                                smoothing_cdf_start(torch.remainder(foot_indices[1], 1.0) - 1) * (
-        #                                        1 - smoothing_cdf_start(
-        #                                    torch.remainder(foot_indices[1], 1.0) - 0.5 - 1)))
-        #     smoothing_multiplier_RL = (smoothing_cdf_start(torch.remainder(foot_indices[2], 1.0)) * (
-        #             1 - smoothing_cdf_start(torch.remainder(foot_indices[2], 1.0) - 0.5)) +
-        #                                smoothing_cdf_start(torch.remainder(foot_indices[2], 1.0) - 1) * (
-        #                                        1 - smoothing_cdf_start(
-        #                                    torch.remainder(foot_indices[2], 1.0) - 0.5 - 1)))
-        #     smoothing_multiplier_RR = (smoothing_cdf_start(torch.remainder(foot_indices[3], 1.0)) * (
-        #             1 - smoothing_cdf_start(torch.remainder(foot_indices[3], 1.0) - 0.5)) +
-        #                                smoothing_cdf_start(torch.remainder(foot_indices[3], 1.0) - 1) * (
-        #                                        1 - smoothing_cdf_start(
-        #                                    torch.remainder(foot_indices[3], 1.0) - 0.5 - 1)))
-
-        #     self.desired_contact_states[:, 0] = smoothing_multiplier_FL
-        #     self.desired_contact_states[:, 1] = smoothing_multiplier_FR
-        #     self.desired_contact_states[:, 2] = smoothing_multiplier_RL
-        #     self.desired_contact_states[:, 3] = smoothing_multiplier_RR
+            # only the clock variants that are observed
+            torch.sin(2 * np.pi * foot_indices, out=self.clock_inputs)
+            if getattr(self.cfg.obs.cfgs, "doubletime_clock_inputs", False):
+                torch.sin(4 * np.pi * foot_indices, out=self.doubletime_clock_inputs)
+            if getattr(self.cfg.obs.cfgs, "halftime_clock_inputs", False):
+                torch.sin(np.pi * foot_indices, out=self.halftime_clock_inputs)
+
+            if getattr(self.cfg.obs.cfgs, "desired_contact_states", False):
+                # von mises distribution
+                cdf = self.smoothing_cdf_start
+                phase = torch.remainder(foot_indices, 1.0)
+                self.desired_contact_states[:] = cdf(phase) * (1 - cdf(phase - 0.5)) + cdf(phase - 1) * (1 - cdf(phase - 0.5 - 1))
 
         # if self.cfg.commands.num_commands > 9:
         #     self.desired_footswing_height = self.commands[:, 9]
@@ -324,7 +268,7 @@ class Go1(LeggedRobotField):
         """
         #pd controller
         if isinstance(self.cfg.control.action_scale, (tuple, list)):
-            self.cfg.control.action_scale = torch.tensor(self.cfg.control.action_scale, device= self.sim_device)
+            self.cfg.control.action_scale = torch.tensor(self.cfg.control.action_scale, device= self.device)
         actions_scaled = actions * self.cfg.control.action_scale
         actions_scaled = actions_scaled.reshape(-1, 12)
         actions_scaled[:, [0, 3, 6, 9]] *= self.cfg.control.hip_scale_reduction
@@ -334,24 +278,39 @@ class Go1(LeggedRobotField):
         if control_type == "C" or control_type == "control_net":
             
             if self.cfg.domain_rand.randomize_lag_timesteps:
-                self.lag_buffer = self.lag_buffer[1:] + [actions_scaled.clone()]
-                self.joint_pos_target = self.lag_buffer[0] + self.default_dof_pos
+                # the slot after the newest one holds the action of lag_timesteps substeps ago
+                self.lag_head = (self.lag_head + 1) % self.lag_buffer.shape[0]
+                self.lag_buffer[self.lag_head] = actions_scaled
+                self.joint_pos_target = self.lag_buffer[(self.lag_head + 1) % self.lag_buffer.shape[0]] + self.default_dof_pos
             else:
                 self.joint_pos_target = actions_scaled + self.default_dof_pos
 
             self.joint_pos_err = (self.dof_pos - self.joint_pos_target).reshape([-1, 12]) # + self.motor_offsets
             self.joint_vel = self.dof_vel.reshape([-1, 12])
-            torques = self.actuator_network(self.joint_pos_err, self.joint_pos_err_last, self.joint_pos_err_last_last,
-                                            self.joint_vel, self.joint_vel_last, self.joint_vel_last_last)
-            self.joint_pos_err_last_last = torch.clone(self.joint_pos_err_last)
-            self.joint_pos_err_last = torch.clone(self.joint_pos_err)
-            self.joint_vel_last_last = torch.clone(self.joint_vel_last)
-            self.joint_vel_last = torch.clone(self.joint_vel)
+            self.actuator_history[:, :, 0, self.actuator_head] = self.joint_pos_err
+            self.actuator_history[:, :, 1, self.actuator_head] = self.joint_vel
+            # (err, err_last, err_last_last, vel, vel_last, vel_last_last) per joint
+            xs = self.actuator_history.index_select(3, self.actuator_slot_order[self.actuator_head])
+            if self.actuator_log is not None:
+                self._log_actuator_inputs(xs.view(-1, 6))
+            torques = self.actuator_network(xs.view(-1, 6))
+            self.actuator_head = (self.actuator_head + 1) % 3
             # torques = torques * self.motor_strengths
             return torch.clip(torques, -self.torque_limits, self.torque_limits)
         else:
             return super()._compute_torques(actions)
 
+    def _log_actuator_inputs(self, xs, num_rows=256):
+        """ Keep num_rows random actuator inputs per substep in the actuator_log ring """
+        rows = torch.randint(xs.shape[0], (min(num_rows, xs.shape[0]),), device=self.device)
+        ids = (self.actuator_log_count + torch.arange(len(rows), device=self.device)) % self.actuator_log.shape[0]
+        self.actuator_log[ids] = xs[rows]
+        self.actuator_log_count += len(rows)
+
+    def save_actuator_log(self, path):
+        """ Save the logged (num_samples, 6) actuator inputs, the training data of helpers/fit_actuator_surrogate.py """
+        torch.save(self.actuator_log[:min(self.actuator_log_count, self.actuator_log.shape[0])].cpu(), path)
+
     #----------------------------------------
     def _init_buffers(self):
         """ Initialize torch tensors which will contain simulation states and processed quantities
@@ -359,31 +318,36 @@ class Go1(LeggedRobotField):
         ### get gym GPU state tensors ###
         super()._init_buffers()
 
-        self.lag_buffer = [torch.zeros_like(self.dof_pos, device=self.device) for i in range(self.cfg.domain_rand.lag_timesteps + 1)]
+        # ring of the last lag_timesteps + 1 scaled actions, lag_head is the newest
+        self.lag_buffer = torch.zeros(self.cfg.domain_rand.lag_timesteps + 1, *self.dof_pos.shape, dtype=torch.float, device=self.device)
+        self.lag_head = 0
 
         if self.cfg.control.control_type == "actuator_net" or self.cfg.control.control_type == "C":
 
-            actuator_network = torch.jit.load(self.cfg.control.actuator_network_path + "/unitree_go1.pt", map_location=self.device)
-
-            def eval_actuator_network(joint_pos, joint_pos_last, joint_pos_last_last, joint_vel, joint_vel_last,
-                                      joint_vel_last_last):
+            if getattr(self.cfg.control, "actuator_model", "network") == "surrogate":
+                actuator_network = PiecewiseLinearActuator.load(self.cfg.control.actuator_surrogate_path, device=self.device)
+            else:
+                actuator_network = torch.jit.load(self.cfg.control.actuator_network_path + "/unitree_go1.pt", map_location=self.device)
 
-                xs = torch.cat((joint_pos.unsqueeze(-1),
-                                joint_pos_last.unsqueeze(-1),
-                                joint_pos_last_last.unsqueeze(-1),
-                                joint_vel.unsqueeze(-1),
-                                joint_vel_last.unsqueeze(-1),
-                                joint_vel_last_last.unsqueeze(-1)), dim=-1)
+            def eval_actuator_network(xs):
+                """ xs: (num_robots * 12, 6) joint position errors and velocities of the last 3 substeps """
                 with torch.no_grad():
-                    torques = actuator_network(xs.view(self.num_envs * self.num_agents * 12, 6))
+                    torques = actuator_network(xs)
                 return torques.view(self.num_envs, self.num_actuated_dof)
 
             self.actuator_network = eval_actuator_network
 
-            self.joint_pos_err_last_last = torch.zeros((self.num_envs * self.num_agents, 12), device=self.device)
-            self.joint_pos_err_last = torch.zeros((self.num_envs * self.num_agents, 12), device=self.device)
-            self.joint_vel_last_last = torch.zeros((self.num_envs * self.num_agents, 12), device=self.device)
-            self.joint_vel_last = torch.zeros((self.num_envs * self.num_agents, 12), device=self.device)
+            # joint position error and velocity of the last 3 substeps, (num_robots, 12, [err, vel], slot),
+            # slot actuator_head is written next
+            self.actuator_history = torch.zeros((self.num_envs * self.num_agents, 12, 2, 3), device=self.device)
+            self.actuator_head = 0
+            # slots of (current, last, last_last) for each head
+            self.actuator_slot_order = torch.tensor([[h, (h - 1) % 3, (h - 2) % 3] for h in range(3)], dtype=torch.long, device=self.device)
+
+        self.actuator_log = None
+        if getattr(self.cfg.control, "actuator_log_size", 0) > 0:
+            self.actuator_log = torch.zeros((self.cfg.control.actuator_log_size, 6), device=self.device)
+            self.actuator_log_count = 0
 
     def _prepare_locomotion_policy(self):
         # currently only support walk_these_ways
@@ -391,21 +355,15 @@ class Go1(LeggedRobotField):
 
         locomotion_obs = self._fill_command_obs()
         self.locomotion_obs = locomotion_obs.repeat([self.num_envs * self.num_agents, 1])
-        self.history_locomotion_obs = torch.zeros(self.num_envs * self.num_agents, 2100, dtype=torch.float, device=self.device, requires_grad=False)
-        
-        body = torch.jit.load(self.cfg.control.locomotion_policy_dir + '/body_latest.jit', map_location=self.device)
-        adaptation_module = torch.jit.load(self.cfg.control.locomotion_policy_dir + '/adaptation_module_latest.jit', map_location=self.device)
-
-        def policy(obs, info={}):
-            with torch.no_grad():
-                
-                latent = adaptation_module.forward(obs)
-                action = body.forward(torch.cat((obs, latent), dim=-1))
-
-            info['latent'] = latent
-            return action
+        # the last 30 locomotion observations, oldest first, as expected by the adaptation module
+        self.locomotion_history = HistoryBuffer(self.num_envs * self.num_agents, 70, 30, device=self.device)
+        self.history_locomotion_obs = self.locomotion_history.get()
         
-        self.locomotion_policy = policy
+        self.locomotion_policy = LocomotionInference(self.cfg.control.locomotion_policy_dir,
+                                                     backend=getattr(self.cfg.control, "locomotion_backend", "jit"),
+                                                     precision=getattr(self.cfg.control, "locomotion_precision", "fp32"),
+                                                     tolerance=getattr(self.cfg.control, "locomotion_tolerance", None),
+                                                     device=self.device)
 
     def _fill_command_obs(self):
         """
@@ -414,6 +372,8 @@ class Go1(LeggedRobotField):
 
         idx = 0
         locomotion_obs = torch.zeros(1, 70, dtype=torch.float, device=self.device, requires_grad=False)
+        # (locomotion obs column, action column, obs scale) of the commanded entries
+        command_map = []
 
         if not self.cfg.command.cfg.vel:
             locomotion_obs[0, 3] = self.cfg.control.default_command.lin_vel_x * self.cfg.control.obs_scales.lin_vel
@@ -421,18 +381,22 @@ class Go1(LeggedRobotField):
             locomotion_obs[0, 5] = self.cfg.control.default_command.ang_vel * self.cfg.control.obs_scales.ang_vel
         else:
             self.vel_idx = idx
+            command_map += [(3, idx, self.cfg.control.obs_scales.lin_vel), (4, idx + 1, self.cfg.control.obs_scales.lin_vel),
+                            (5, idx + 2, self.cfg.control.obs_scales.ang_vel)]
             idx += 3
         
         if not self.cfg.command.cfg.body_height:
             locomotion_obs[0, 6] = self.cfg.control.default_command.body_height * self.cfg.control.obs_scales.body_height
         else:
             self.body_height_idx = idx
+            command_map.append((6, idx, self.cfg.control.obs_scales.body_height))
             idx += 1
         
         if not self.cfg.command.cfg.gait_freq:
             locomotion_obs[0, 7] = self.cfg.control.default_command.gait_freq * self.cfg.control.obs_scales.gait_freq
         else:
             self.gait_freq_idx = idx
+            command_map.append((7, idx, self.cfg.control.obs_scales.gait_freq))
             idx += 1
 
         if not self.cfg.command.cfg.gait:
@@ -448,6 +412,7 @@ class Go1(LeggedRobotField):
             locomotion_obs[0, 12] = self.cfg.control.default_command.footswing_height * self.cfg.control.obs_scales.footswing_height
         else:
             self.footswing_height_idx = idx
+            command_map.append((12, idx, self.cfg.control.obs_scales.footswing_height))
             idx += 1
 
         if not self.cfg.command.cfg.body_pose:
@@ -455,26 +420,33 @@ class Go1(LeggedRobotField):
             locomotion_obs[0, 14] = self.cfg.control.default_command.body_roll * self.cfg.control.obs_scales.body_roll
         else:
             self.body_pose_idx = idx
+            command_map += [(13, idx, self.cfg.control.obs_scales.body_pitch), (14, idx + 1, self.cfg.control.obs_scales.body_roll)]
             idx += 2
 
         if not self.cfg.command.cfg.stance_width:
             locomotion_obs[0, 15] = self.cfg.control.default_command.stance_width * self.cfg.control.obs_scales.stance_width
         else:
             self.stance_width_idx = idx
+            command_map.append((15, idx, self.cfg.control.obs_scales.stance_width))
             idx += 1
 
         if not self.cfg.command.cfg.stance_length:
             locomotion_obs[0, 16] = self.cfg.control.default_command.stance_length * self.cfg.control.obs_scales.stance_length
         else:
             self.stance_length_idx = idx
+            command_map.append((16, idx, self.cfg.control.obs_scales.stance_length))
             idx += 1
 
         if not self.cfg.command.cfg.aux_reward:
             locomotion_obs[0, 17] = self.cfg.control.default_command.aux_reward * self.cfg.control.obs_scales.aux_reward
         else:
             self.aux_reward_idx = idx
+            command_map.append((17, idx, self.cfg.control.obs_scales.aux_reward))
             idx += 1
 
+        self.command_obs_ids = torch.tensor([m[0] for m in command_map], dtype=torch.long, device=self.device)
+        self.command_action_ids = torch.tensor([m[1] for m in command_map], dtype=torch.long, device=self.device)
+        self.command_obs_scales = torch.tensor([m[2] for m in command_map], dtype=torch.float, device=self.device)
         return locomotion_obs
 
     def _init_custom_buffers__(self):
@@ -513,3 +485,7 @@ class Go1(LeggedRobotField):
         self.clock_inputs = torch.zeros(self.num_envs * self.num_agents, 4, dtype=torch.float, device=self.device, requires_grad=False)
         self.doubletime_clock_inputs = torch.zeros(self.num_envs * self.num_agents, 4, dtype=torch.float, device=self.device, requires_grad=False)
         self.halftime_clock_inputs = torch.zeros(self.num_envs * self.num_agents, 4, dtype=torch.float, device=self.device, requires_grad=False)
+        if getattr(self.cfg.obs.cfgs, "desired_contact_states", False):
+            # one row per robot, smoothed with a normal cdf of std kappa_gait_probs
+            self.desired_contact_states = torch.zeros(self.num_envs * self.num_agents, 4, dtype=torch.float, device=self.device, requires_grad=False)
+            self.smoothing_cdf_start = torch.distributions.normal.Normal(0, getattr(self.cfg.rewards, "kappa_gait_probs", 0.07)).cdf
@@ -120,7 +120,13 @@ class Go1Cfg(LeggedRobotFieldCfg):
         hip_scale_reduction = 0.5
 
         locomotion_policy_dir = "./mqe/utils/locomotion_checkpoints/walk_these_ways"
+        locomotion_backend = "jit"      # "jit": adaptation module and body as loaded, "frozen": both fused in one frozen graph optimized for inference
+        locomotion_precision = "fp32"   # frozen backend only, "bf16" or "int8" (dynamic quantization, CPU only)
+        locomotion_tolerance = None     # max deviation of the frozen backend from the jit policy before falling back to it, None: per precision default
         actuator_network_path = "./resources/actuator_nets"
+        actuator_model = "network"      # "network": actuator_network_path/unitree_go1.pt, "surrogate": piecewise linear fit of it, see helpers/fit_actuator_surrogate.py
+        actuator_surrogate_path = "./resources/actuator_nets/unitree_go1_surrogate.pt"
+        actuator_log_size = 0           # > 0: keep that many actuator network inputs to fit the surrogate, saved with Go1.save_actuator_log()
 
         class default_command:
 
@@ -264,6 +270,9 @@ class Go1Cfg(LeggedRobotFieldCfg):
             gait_commands = False
             timing_parameter = False
             clock_inputs = False
+            doubletime_clock_inputs = False     # clock variants are only computed when observed
+            halftime_clock_inputs = False
+            desired_contact_states = False      # von mises smoothed contact schedule of the gait clock
             last_action = True
             last_last_action = True
             imu = False
@@ -0,0 +1,38 @@
+import torch
+
+class HistoryBuffer:
+    """ Fixed length observation history without reallocation, replaces torch.cat((history[:, D:], obs)).
+
+    The (num_rows, history_len * step_dim) window is kept twice in a (num_rows, 2 * history_len * step_dim)
+    mirrored ring: push() advances the head and writes the new step into slot head and slot head + history_len.
+    The history_len slots after the head are then always the window from the oldest to the newest step,
+    so get() is a strided view of the storage (row stride 2 * history_len * step_dim), in the same order
+    as the concatenated history, and no copy is needed to feed it to a network.
+    NOTE: the view returned by get() is overwritten by the next push().
+    """
+    def __init__(self, num_rows, step_dim, history_len, dtype=torch.float, device="cpu"):
+        self.num_rows = num_rows
+        self.step_dim = step_dim
+        self.history_len = history_len
+        self.storage = torch.zeros(num_rows, 2 * history_len * step_dim, dtype=dtype, device=device)
+        self.head = history_len - 1
+
+    def push(self, step):
+        """ step: (num_rows, step_dim), becomes the newest entry of every row """
+        self.head = (self.head + 1) % self.history_len
+        start = self.head * self.step_dim
+        mirror = start + self.history_len * self.step_dim
+        self.storage[:, start:start + self.step_dim] = step
+        self.storage[:, mirror:mirror + self.step_dim] = step
+
+    def get(self):
+        """ (num_rows, history_len * step_dim) view, oldest step first """
+        start = (self.head + 1) * self.step_dim
+        return self.storage[:, start:start + self.history_len * self.step_dim]
+
+    def reset(self, rows=None):
+        """ Zero the history of rows (all rows if None) """
+        if rows is None:
+            self.storage.zero_()
+        else:
+            self.storage[rows] = 0
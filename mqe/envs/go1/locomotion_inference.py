@@ -0,0 +1,114 @@
+import os
+
+import torch
+
+# files of a walk-these-ways checkpoint directory
+BODY_FILE = "body_latest.jit"
+ADAPTATION_MODULE_FILE = "adaptation_module_latest.jit"
+
+# max abs deviation of the actions from the jit backend accepted per precision
+DEFAULT_TOLERANCES = {"fp32": 1e-4, "bf16": 5e-2, "int8": 5e-2}
+
+ACTIVATIONS = {"ELU": torch.nn.ELU, "ReLU": torch.nn.ReLU, "Tanh": torch.nn.Tanh, "LeakyReLU": torch.nn.LeakyReLU}
+
+class FusedLocomotionPolicy(torch.nn.Module):
+    """ Adaptation module and body in one module, (N, history) -> ((N, 12) action, (N, latent) latent) """
+    def __init__(self, adaptation_module, body):
+        super().__init__()
+        self.adaptation_module = adaptation_module
+        self.body = body
+
+    def forward(self, obs):
+        latent = self.adaptation_module(obs)
+        return self.body(torch.cat((obs, latent), dim=-1)), latent
+
+def to_eager(module):
+    """ Eager copy of a TorchScript MLP (Sequential of Linear and activation layers), dynamic quantization
+    only handles eager modules
+    """
+    name = getattr(module, "original_name", type(module).__name__)
+    if name == "Linear":
+        linear = torch.nn.Linear(module.weight.shape[1], module.weight.shape[0], bias=module.bias is not None)
+        linear.load_state_dict(module.state_dict())
+        return linear.to(module.weight.device)
+    if name == "ELU":
+        return torch.nn.ELU(alpha=getattr(module, "alpha", 1.0))
+    if name in ACTIVATIONS:
+        return ACTIVATIONS[name]()
+    if name == "Sequential":
+        return torch.nn.Sequential(*[to_eager(child) for child in module.children()])
+    raise ValueError(f"Cannot convert {name} of the locomotion policy to an eager module.")
+
+def input_dim(module):
+    """ in_features of the first Linear layer """
+    return next(p for p in module.parameters() if p.dim() == 2).shape[1]
+
+class LocomotionInference:
+    """ Inference backend of the frozen walk-these-ways locomotion policy, called as policy(obs, info=None),
+    the latent is written into info['latent'] when a dict is given.
+
+    backend "jit": adaptation module and body as loaded, two TorchScript calls per step (reference).
+    backend "frozen": both in one scripted FusedLocomotionPolicy, frozen (parameters folded into the graph)
+    and optimized for inference. precision "bf16" runs the frozen graph in bfloat16, "int8" quantizes its
+    Linear layers dynamically (CPU only). The frozen backend is checked against the reference on random
+    histories when it is built, above tolerance it falls back to the reference.
+    """
+    def __init__(self, policy_dir, backend="jit", precision="fp32", tolerance=None, device="cpu", validation_batch=256):
+        self.device = device
+        self.policy_dir = policy_dir
+        self.body = torch.jit.load(os.path.join(policy_dir, BODY_FILE), map_location=device)
+        self.adaptation_module = torch.jit.load(os.path.join(policy_dir, ADAPTATION_MODULE_FILE), map_location=device)
+        self.obs_dim = input_dim(self.adaptation_module)
+
+        self.backend = backend
+        self.precision = precision
+        self.dtype = torch.bfloat16 if precision == "bf16" else torch.float
+        self.model = None
+        if backend == "frozen":
+            self.model = self._freeze(precision)
+            tolerance = DEFAULT_TOLERANCES[precision] if tolerance is None else tolerance
+            self.max_error = self.validate(validation_batch)
+            if self.max_error > tolerance:
+                print(f"Frozen {precision} locomotion policy deviates by {self.max_error:.2e} > {tolerance:.2e}, using the jit policy.")
+                self.backend, self.precision, self.dtype, self.model = "jit", "fp32", torch.float, None
+        elif backend != "jit":
+            raise ValueError(f"Unknown locomotion backend {backend}, expected 'jit' or 'frozen'.")
+
+    def _freeze(self, precision):
+        if precision == "int8":
+            if str(self.device) != "cpu":
+                raise ValueError("int8 locomotion inference is only supported on the CPU.")
+            fused = FusedLocomotionPolicy(to_eager(self.adaptation_module), to_eager(self.body))
+            fused = torch.ao.quantization.quantize_dynamic(fused, {torch.nn.Linear}, dtype=torch.qint8)
+        elif precision in ("fp32", "bf16"):
+            # second copies of the modules, .to(dtype) converts the parameters in place and the reference stays fp32
+            adaptation_module = torch.jit.load(os.path.join(self.policy_dir, ADAPTATION_MODULE_FILE), map_location=self.device)
+            body = torch.jit.load(os.path.join(self.policy_dir, BODY_FILE), map_location=self.device)
+            fused = FusedLocomotionPolicy(adaptation_module, body).to(self.dtype)
+        else:
+            raise ValueError(f"Unknown locomotion precision {precision}, expected 'fp32', 'bf16' or 'int8'.")
+        frozen = torch.jit.freeze(torch.jit.script(fused.eval()))
+        return torch.jit.optimize_for_inference(frozen)
+
+    def reference(self, obs):
+        latent = self.adaptation_module.forward(obs)
+        return self.body.forward(torch.cat((obs, latent), dim=-1)), latent
+
+    @torch.no_grad()
+    def validate(self, batch_size=256):
+        """ Max abs deviation of the actions from the reference on random histories """
+        obs = torch.randn(batch_size, self.obs_dim, dtype=torch.float, device=self.device)
+        action, _ = self.model(obs.to(self.dtype))
+        return (action.float() - self.reference(obs)[0]).abs().max().item()
+
+    def __call__(self, obs, info=None):
+        with torch.no_grad():
+            if self.model is None:
+                action, latent = self.reference(obs)
+            else:
+                action, latent = self.model(obs.to(self.dtype))
+                action, latent = action.float(), latent.float()
+
+        if info is not None:
+            info['latent'] = latent
+        return action
@@ -29,6 +29,8 @@ class Go1Object(Go1):
         self.init_state_npc = getattr(self.cfg.init_state, "init_states_npc")
         if getattr(self.cfg.env,"num_obs",0) != 0:
             self.obs_states =getattr(self.cfg.obstacle_state, "states_obs")
+            # one init state per obstacle, repeated when there are fewer than num_obs
+            self.obs_states = [self.obs_states[i % len(self.obs_states)] for i in range(self.cfg.env.num_obs)]
             self.init_state_npc = self.init_state_npc + self.obs_states
         if hasattr(self.cfg.init_state, "default_npc_joint_angles"):
             self.default_dof_pos_npc = torch.tensor(self.cfg.init_state.default_npc_joint_angles, dtype=torch.float, device=self.device, requires_grad=False).reshape(1, -1)
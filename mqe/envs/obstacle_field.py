@@ -0,0 +1,101 @@
+import math
+
+import torch
+
+class ObstacleDistanceField:
+    """ Per-env 2D Euclidean distance to the closest obstacle centre, tabulated on a grid in env frame.
+
+    The (num_envs, num_y * num_x) table covers x_lim / y_lim plus margin and is only rebuilt for the envs
+    whose obstacles moved (update()) or on request (rebuild()), the rebuild is O(cells * num_obstacles).
+    distance() answers any number of points per env with a bilinear lookup (four gathers), independent
+    of the number of obstacles. Points outside the grid are clamped to it and their distance is increased
+    by the distance to the clamped point.
+    """
+    def __init__(self, num_envs, num_obstacles, x_lim, y_lim, resolution=0.2, margin=1.0, device="cpu"):
+        self.num_envs = num_envs
+        self.num_obstacles = num_obstacles
+        self.resolution = resolution
+        self.device = device
+
+        self.origin = torch.tensor([x_lim[0] - margin, y_lim[0] - margin], dtype=torch.float, device=device)
+        self.num_x = int(math.ceil((x_lim[1] - x_lim[0] + 2 * margin) / resolution)) + 1
+        self.num_y = int(math.ceil((y_lim[1] - y_lim[0] + 2 * margin) / resolution)) + 1
+        self.xs = self.origin[0] + torch.arange(self.num_x, dtype=torch.float, device=device) * resolution
+        self.ys = self.origin[1] + torch.arange(self.num_y, dtype=torch.float, device=device) * resolution
+        self._upper = torch.tensor([self.num_x - 1, self.num_y - 1], dtype=torch.float, device=device)
+
+        # obstacles the table was built from, nan until the first build
+        self.obstacles = torch.full((num_envs, num_obstacles, 2), float("nan"), dtype=torch.float, device=device)
+        self.values = torch.full((num_envs, self.num_y * self.num_x), float("inf"), dtype=torch.float, device=device)
+
+    def rebuild(self, obstacle_states, env_ids=None):
+        """ Rebuild the table of env_ids (all envs if None) from their (len(env_ids), num_obstacles, >=2) obstacles """
+        obstacle_states = obstacle_states[..., :2].float()
+        values = torch.full((obstacle_states.shape[0], self.num_y, self.num_x), float("inf"), dtype=torch.float, device=self.device)
+        for m in range(obstacle_states.shape[1]):
+            dx = self.xs.view(1, 1, -1) - obstacle_states[:, m, 0].view(-1, 1, 1)
+            dy = self.ys.view(1, -1, 1) - obstacle_states[:, m, 1].view(-1, 1, 1)
+            values = torch.minimum(values, dx ** 2 + dy ** 2)
+        values = values.sqrt_().view(obstacle_states.shape[0], -1)
+
+        if env_ids is None:
+            self.obstacles[:] = obstacle_states
+            self.values[:] = values
+        else:
+            self.obstacles[env_ids] = obstacle_states
+            self.values[env_ids] = values
+
+    def update(self, obstacle_states):
+        """ Rebuild the envs whose (num_envs, num_obstacles, >=2) obstacles differ from the last build,
+        returns their ids
+        """
+        changed = (obstacle_states[..., :2] != self.obstacles).any(dim=2).any(dim=1)
+        env_ids = changed.nonzero(as_tuple=False).flatten()
+        if len(env_ids) > 0:
+            self.rebuild(obstacle_states[env_ids], env_ids)
+        return env_ids
+
+    def distance(self, points, env_ids=None):
+        """ Distance to the closest obstacle of (n, 2) or (n, K, 2) env frame points -> (n,) or (n, K),
+        one point set per env of env_ids (all envs if None). Non-finite points are inf (never indexed)
+        """
+        if self.num_obstacles == 0:
+            return torch.full(points.shape[:-1], float("inf"), dtype=torch.float, device=self.device)
+        squeeze = points.dim() == 2
+        if squeeze:
+            points = points.unsqueeze(1)
+        if env_ids is None:
+            env_ids = torch.arange(points.shape[0], device=self.device)
+
+        uv = (points[..., :2] - self.origin) / self.resolution
+        # a nan point would become a garbage cell index, look it up at the origin and report inf
+        finite = torch.isfinite(uv).all(dim=-1)
+        uv = torch.where(finite.unsqueeze(-1), uv, torch.zeros_like(uv))
+        uv_clamped = torch.minimum(torch.clamp(uv, min=0.), self._upper)
+        cell = torch.minimum(uv_clamped.floor(), self._upper - 1)
+        frac = uv_clamped - cell
+        cell = cell.long()
+        index = (env_ids.view(-1, 1) * self.values.shape[1] + cell[..., 1] * self.num_x + cell[..., 0])
+
+        values = self.values.view(-1)
+        fx = frac[..., 0]
+        fy = frac[..., 1]
+        dist = (values[index] * (1 - fx) + values[index + 1] * fx) * (1 - fy) \
+             + (values[index + self.num_x] * (1 - fx) + values[index + self.num_x + 1] * fx) * fy
+        dist = dist + torch.norm(uv - uv_clamped, dim=-1) * self.resolution
+        dist = torch.where(finite, dist, torch.full_like(dist, float("inf")))
+        return dist.squeeze(1) if squeeze else dist
+
+def nearest_obstacles(points, obstacle_states, k):
+    """ The k obstacles closest to each point, (n, 2) points and (n, num_obstacles, >= 2) obstacles -> (n, k, 2)
+    sorted by distance. With fewer than k obstacles the farthest one is repeated (zeros without obstacles).
+    """
+    num_obstacles = obstacle_states.shape[1]
+    if num_obstacles == 0:
+        return torch.zeros(points.shape[0], k, 2, dtype=obstacle_states.dtype, device=obstacle_states.device)
+    obstacles = obstacle_states[..., :2]
+    dist = torch.norm(obstacles - points[:, :2].unsqueeze(1), dim=2)
+    index = dist.topk(min(k, num_obstacles), dim=1, largest=False, sorted=True)[1]
+    if k > num_obstacles:
+        index = torch.cat([index, index[:, -1:].expand(-1, k - num_obstacles)], dim=1)
+    return obstacles.gather(1, index.unsqueeze(2).expand(-1, -1, 2))
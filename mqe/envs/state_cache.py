@@ -0,0 +1,175 @@
+from isaacgym.torch_utils import get_euler_xyz
+
+import torch
+
+from mqe.utils.math import sanitize_
+
+class StepStateCache:
+    """ Derived robot, box and target states of one simulation step, shared by the env and the wrappers.
+
+    begin_step() is called once after refresh_actor_root_state_tensor. Every entry is computed on first use
+    and returned from the cache afterwards, so base_rpy, the box / target rpy and the box frame are
+    converted once per step however many consumers read them. update_states() follows writes to the root
+    states during the step (reset_idx, _update_target_state): positions are recomputed on next use and the
+    rotations are only recomputed for the envs given (rows of the cached tensors, not the full batch).
+    requests / evaluations count the full-batch trig conversions asked for and actually run this step,
+    their difference is the number of conversions the cache removed.
+    The rpy and position entries are sanitized once, when they are computed (nan / inf -> 0), and
+    value_exception() returns the per-env flag of the entries that had any, so every consumer reads the
+    same values whatever the order they run in. The npc entries are flagged per npc, box_pos / target_pos /
+    box_rpy / target_rpy only flag the box and target rows.
+    NOTE: cached tensors are shared, consumers must not modify them in place.
+    """
+    TRIG_KEYS = ("base_rpy", "npc_rpy", "box_frame")
+    SANITIZED_KEYS = ("base_rpy", "base_pos", "npc_pos", "npc_rpy")
+    # entries flagged per (env, npc) and the npc rows behind the box / target keys of value_exception()
+    NPC_KEYS = ("npc_pos", "npc_rpy")
+    ROW_KEYS = {"box_pos": ("npc_pos", 0), "target_pos": ("npc_pos", 1), "box_rpy": ("npc_rpy", 0), "target_rpy": ("npc_rpy", 1)}
+
+    def __init__(self, num_envs, num_agents, num_npcs, env_origins):
+        self.num_envs = num_envs
+        self.num_agents = num_agents
+        self.num_npcs = num_npcs
+        self.env_origins = env_origins
+        self.values = {}
+        self.flags = {}
+        self._computers = {
+            "base_rpy": lambda: torch.stack(get_euler_xyz(self.base_quat), dim=1),
+            "base_pos": lambda: self.root_states[:, :3].view(self.num_envs, self.num_agents, 3) - self.env_origins.unsqueeze(1),
+            "npc_pos": lambda: self.root_states_npc[:, :3].view(self.num_envs, self.num_npcs, 3) - self.env_origins.unsqueeze(1),
+            "npc_rpy": self._npc_rpy,
+            "box_frame": lambda: self._box_frame(self.box_yaw),
+            "agent_pos_in_box_frame": self._agent_pos_in_box_frame,
+        }
+        self.requests = 0
+        self.evaluations = 0
+        self.removed_last_step = 0
+
+    def begin_step(self, root_states, base_quat, root_states_npc):
+        """ root_states: (num_envs * num_agents, 13), base_quat: (num_envs * num_agents, 4),
+            root_states_npc: (num_envs * num_npcs, 13)
+        """
+        self.removed_last_step = self.removed
+        self.root_states = root_states
+        self.base_quat = base_quat
+        self.root_states_npc = root_states_npc
+        self.values.clear()
+        self.flags.clear()
+        self.requests = 0
+        self.evaluations = 0
+
+    def update_states(self, root_states, root_states_npc, env_ids=None):
+        """ The root states were written (or reassigned) after begin_step, the npc rotations of env_ids changed """
+        self.root_states = root_states
+        self.root_states_npc = root_states_npc
+        for key in [key for key in self.values if key not in self.TRIG_KEYS]:
+            del self.values[key]
+            self.flags.pop(key, None)
+        if env_ids is None:
+            return
+        if "npc_rpy" in self.values:
+            npc_rpy = self._npc_rpy(env_ids)
+            self.flags["npc_rpy"][env_ids] = self._sanitize_("npc_rpy", npc_rpy)
+            self.values["npc_rpy"][env_ids] = npc_rpy
+        if "box_frame" in self.values:
+            self.values["box_frame"][env_ids] = self._box_frame(self.values["npc_rpy"][env_ids, 0, 2])
+
+    @property
+    def removed(self):
+        return self.requests - self.evaluations
+
+    def value_exception(self, *keys):
+        """ (num_envs,) bool, envs with nan / inf in any of the (sanitized) entries keys,
+            a key of ROW_KEYS only checks its npc row (e.g. "box_pos" is row 0 of npc_pos)
+        """
+        flag = torch.zeros(self.num_envs, dtype=torch.bool, device=self.env_origins.device)
+        for key in keys:
+            key, row = self.ROW_KEYS.get(key, (key, None))
+            self._get(key, count=False)
+            if key in self.NPC_KEYS:
+                flag |= self.flags[key][:, row] if row is not None else self.flags[key].any(dim=1)
+            else:
+                flag |= self.flags[key]
+        return flag
+
+    def _get(self, key, count=True):
+        if count and key in self.TRIG_KEYS:
+            self.requests += 1
+        if key not in self.values:
+            if key in self.TRIG_KEYS:
+                self.evaluations += 1
+            value = self._computers[key]()
+            if key in self.SANITIZED_KEYS:
+                self.flags[key] = self._sanitize_(key, value)
+            self.values[key] = value
+        return self.values[key]
+
+    def _sanitize_(self, key, value):
+        """ nan / inf -> 0 in place, (num_envs,) flag, (rows, npcs) for the npc entries """
+        if key in self.NPC_KEYS:
+            return sanitize_(value, num_envs=value.shape[0] * value.shape[1]).view(value.shape[:2])
+        return sanitize_(value, num_envs=self.num_envs)
+
+    def _npc_rpy(self, env_ids=slice(None)):
+        quat = self.root_states_npc.view(self.num_envs, self.num_npcs, 13)[env_ids, :2, 3:7]
+        return torch.stack(get_euler_xyz(quat.reshape(-1, 4)), dim=1).view(-1, 2, 3)
+
+    @staticmethod
+    def _box_frame(box_yaw):
+        return torch.stack([torch.cos(box_yaw), torch.sin(box_yaw)], dim=-1)
+
+    # agents
+    @property
+    def base_rpy(self):
+        """ (num_envs * num_agents, 3) roll, pitch, yaw in [0, 2 pi) """
+        return self._get("base_rpy")
+
+    @property
+    def base_pos(self):
+        """ (num_envs, num_agents, 3) relative to the env origins """
+        return self._get("base_pos")
+
+    # npcs, box = npc 0, target = npc 1
+    @property
+    def npc_pos(self):
+        """ (num_envs, num_npcs, 3) relative to the env origins """
+        return self._get("npc_pos")
+
+    @property
+    def box_pos(self):
+        return self.npc_pos[:, 0]
+
+    @property
+    def target_pos(self):
+        return self.npc_pos[:, 1]
+
+    @property
+    def box_rpy(self):
+        return self._get("npc_rpy")[:, 0]
+
+    @property
+    def target_rpy(self):
+        return self._get("npc_rpy")[:, 1]
+
+    @property
+    def box_yaw(self):
+        return self.box_rpy[:, 2]
+
+    @property
+    def target_yaw(self):
+        return self.target_rpy[:, 2]
+
+    @property
+    def box_frame(self):
+        """ (num_envs, 2) cos, sin of the box yaw """
+        return self._get("box_frame")
+
+    @property
+    def agent_pos_in_box_frame(self):
+        """ (num_envs, num_agents, 2) agent xy relative to the box, in the box frame """
+        return self._get("agent_pos_in_box_frame")
+
+    def _agent_pos_in_box_frame(self):
+        rel = self.base_pos[:, :, :2] - self.box_pos[:, :2].unsqueeze(1)
+        cos, sin = self.box_frame[:, 0:1], self.box_frame[:, 1:2]
+        return torch.stack([rel[..., 0] * cos + rel[..., 1] * sin, -rel[..., 0] * sin + rel[..., 1] * cos], dim=-1)
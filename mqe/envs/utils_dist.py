@@ -18,22 +18,36 @@ class dist_calculator:
         vertex_new = torch.stack([x_new, y_new], dim=1)
         return vertex_new
     
-    def cal_dist(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor):
+    def box_vertices(self, x:torch.Tensor, y:torch.Tensor, yaw:torch.Tensor):
+        """
+        Vertexes of the boxes at (x, y, yaw) in the world coordinate (num_env, num_vertexes, 2), one cos / sin for all vertexes
+        """
+        vertex = torch.tensor(self.vertex_list).to(x.device)
+        cos, sin = torch.cos(yaw).unsqueeze(1), torch.sin(yaw).unsqueeze(1)
+        return torch.stack([vertex[:, 0] * cos - vertex[:, 1] * sin + x.unsqueeze(1),
+                            vertex[:, 0] * sin + vertex[:, 1] * cos + y.unsqueeze(1)], dim=2)
+
+    def cal_dist(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor, current_yaw:torch.Tensor=None, target_yaw:torch.Tensor=None):
+        """
+        current_yaw / target_yaw: (num_env,) yaw of the boxes when already known (e.g. env.state_cache.box_yaw), else from the quaternions
+        """
         if self.general_dist:
             if self.yaw_active:
-                return self.cal_general_dist_with_yaw(current_box_state, target_box_state)
+                return self.cal_general_dist_with_yaw(current_box_state, target_box_state, current_yaw, target_yaw)
             else:
-                return self.cal_general_dist(current_box_state, target_box_state)
+                return self.cal_general_dist(current_box_state, target_box_state, current_yaw, target_yaw)
         else:
             return torch.norm((current_box_state[:, 0:2] - target_box_state[:, 0:2]).float(), dim=1)
 
-    def cal_general_dist_with_yaw(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor):
+    def cal_general_dist_with_yaw(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor, current_yaw:torch.Tensor=None, target_yaw:torch.Tensor=None):
         current_x = current_box_state[:,0]
         current_y = current_box_state[:,1]
-        current_yaw = torch.stack(get_euler_xyz(current_box_state[:,3:7]),dim=1)[:,2]
+        if current_yaw is None:
+            current_yaw = get_euler_xyz(current_box_state[:,3:7])[2]
         target_x = target_box_state[:,0]
         target_y = target_box_state[:,1]
-        target_yaw = torch.stack(get_euler_xyz(target_box_state[:,3:7]),dim=1)[:,2]
+        if target_yaw is None:
+            target_yaw = get_euler_xyz(target_box_state[:,3:7])[2]
 
         yaw_diff = current_yaw - target_yaw
         yaw_diff = self.lambda_yaw * ((yaw_diff + torch.pi) % (2 * torch.pi) - torch.pi)
@@ -42,7 +56,7 @@ class dist_calculator:
         dist = torch.norm(dist, dim=1)
         return dist
 
-    def cal_general_dist(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor):
+    def cal_general_dist(self, current_box_state:torch.Tensor, target_box_state:torch.Tensor, current_yaw:torch.Tensor=None, target_yaw:torch.Tensor=None):
         """
         Calculate the general distance between current box and target box of all the vertexes
         """
@@ -54,31 +68,16 @@ class dist_calculator:
 
         current_x = current_box_state[:,0]
         current_y = current_box_state[:,1]
-        current_yaw = torch.stack(get_euler_xyz(current_box_state[:,3:7]),dim=1)[:,2]
+        if current_yaw is None:
+            current_yaw = get_euler_xyz(current_box_state[:,3:7])[2]
         target_x = target_box_state[:,0]
         target_y = target_box_state[:,1]
-        target_yaw = torch.stack(get_euler_xyz(target_box_state[:,3:7]),dim=1)[:,2]
-        
-        box_vertex_list = self.vertex_list
-        box_vertex_list = torch.tensor(box_vertex_list).to(current_x.device)
-
-        # calculate current box vertexes in the world coordinate
-        current_vertex_list = []
-        for vertex in box_vertex_list:
-            vertex = self.rotate_point(vertex[0], vertex[1], current_yaw)
-            vertex[:,0] += current_x
-            vertex[:,1] += current_y
-            current_vertex_list.append(vertex)
-        current_vertex_list = torch.stack(current_vertex_list, dim=1)
+        if target_yaw is None:
+            target_yaw = get_euler_xyz(target_box_state[:,3:7])[2]
 
-        # calculate the target box vertexes in the world coordinate
-        target_vertex_list = []
-        for vertex in box_vertex_list:
-            vertex = self.rotate_point(vertex[0], vertex[1], target_yaw)
-            vertex[:,0] += target_x
-            vertex[:,1] += target_y
-            target_vertex_list.append(vertex)
-        target_vertex_list = torch.stack(target_vertex_list, dim=1) 
+        # calculate the current and target box vertexes in the world coordinate
+        current_vertex_list = self.box_vertices(current_x, current_y, current_yaw)
+        target_vertex_list = self.box_vertices(target_x, target_y, target_yaw)
 
         # calculate the distance between the current box vertexes and the target box vertexes
         return torch.sum(torch.norm(current_vertex_list - target_vertex_list, dim=2), dim=1)
\ No newline at end of file
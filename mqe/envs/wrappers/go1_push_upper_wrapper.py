@@ -3,17 +3,22 @@ from gym import spaces
 import numpy
 import torch
 from copy import copy,deepcopy
+from time import perf_counter
 from mqe.envs.wrappers.empty_wrapper import EmptyWrapper
-from mqe.envs.wrappers.utils.trajectory import TrajectoryPlanner
-from openrl.modules.ppo_module import PPOModule
-from mqe.envs.wrappers.utils.rrt import KinodynamicRRT,TwoDVisualizer
+from mqe.envs.wrappers.utils.trajectory import TrajectoryPlanner, interpolate_trajectory
+from mqe.envs.wrappers.utils.rrt import KinodynamicRRT, BatchedRRT
+from mqe.envs.wrappers.utils.grid_planner import GridPlanner
+from mqe.envs.wrappers.utils.tree_recorder import TreeRecorder
+from mqe.envs.wrappers.utils.plan_cache import PlanCache
+from mqe.envs.wrappers.utils.async_planner import AsyncPlanner
+from mqe.envs.wrappers.utils.egocentric_obs import EgocentricObservation
+from mqe.envs.obstacle_field import nearest_obstacles
+from mqe.envs.wrappers.utils.reward_stats import RewardStatistics
+from mqe.envs.wrappers.utils.command_policy import CommandPolicy, load_command_actor
+from mqe.utils.math import sanitize_
 
 from isaacgym.torch_utils import *
 
-# convert tensor to numpy
-def _t2n(tensor):
-    return tensor.detach().cpu().numpy()
-
 # tensor type
 def rotation_matrix_2D(theta):
     theta = theta.float()
@@ -53,49 +58,27 @@ def normalize_rpy(box_rpy):
     
     return box_rpy
 
-def interpolate_trajectory(trajectory, target_points=13):
-    num_envs, current_points = trajectory.shape[0], trajectory.shape[1] // 2
-    new_trajectory = torch.zeros((num_envs, target_points * 2), device='cuda:0')
-    
-    for i in range(num_envs):
-        x = trajectory[i, 0::2].cpu().numpy()
-        y = trajectory[i, 1::2].cpu().numpy()
-        
-        if current_points < target_points:
-            interp_x = np.interp(
-                np.linspace(0, current_points - 1, target_points),
-                np.arange(current_points), x
-            )
-            interp_y = np.interp(
-                np.linspace(0, current_points - 1, target_points),
-                np.arange(current_points), y
-            )
-        else:
-            arc_length = np.cumsum(np.sqrt(np.diff(x)**2 + np.diff(y)**2))
-            arc_length = np.insert(arc_length, 0, 0)
-            interp_arc = np.linspace(0, arc_length[-1], target_points)
-            interp_x = np.interp(interp_arc, arc_length, x)
-            interp_y = np.interp(interp_arc, arc_length, y)
-        
-        new_trajectory[i, 0::2] = torch.tensor(interp_x)
-        new_trajectory[i, 1::2] = torch.tensor(interp_y)
-    
-    return new_trajectory
-
 class Go1PushUpperWrapper(EmptyWrapper):
     def __init__(self, env):
         super().__init__(env)
 
-        self.observation_space = spaces.Box(low=-float('inf'), high=float('inf'), shape=(26,), dtype=float)
+        # obstacles in the observation: all num_obs of them, or the obstacle_obs_k nearest to the box (fixed size for any num_obs)
+        self.obstacle_obs_k = getattr(self.cfg.env, "obstacle_obs_k", None)
+        num_obstacle_obs = self.num_obs if self.obstacle_obs_k is None else self.obstacle_obs_k
+        self.observation_space = spaces.Box(low=-float('inf'), high=float('inf'), shape=(6 * self.num_agents + 10 + 2 * num_obstacle_obs,), dtype=float)
         self.action_space = spaces.Box(low=-1, high=1, shape=(2,), dtype=float)     # should be revised in openrl_ws/utils.py
-        self.action_scale = torch.tensor([[[0.5, 0.5, 0.5],],], device="cuda").repeat(self.num_envs, self.num_agents, 1)
+        self.action_scale = torch.tensor([[[0.5, 0.5, 0.5],],], device=self.device).repeat(self.num_envs, self.num_agents, 1)
         self.net_origin = torch.tensor(self.cfg.generalize_obsersation.net_origin).to(self.device)
         
         self.planning = True
         self.reset_count = 0
+        self.async_planner = None
+        # planning trees, only kept with cfg.planner.record_tree, render them with tree_recorder.render()
+        self.tree_recorder = TreeRecorder(max_plans=getattr(self.cfg.planner, "record_max_plans", None)) \
+            if getattr(self.cfg.planner, "record_tree", False) else None
 
-        self.obs1_pos = torch.randn(self.num_envs, 3, device="cuda")
-        self.obs2_pos = torch.randn(self.num_envs, 3, device="cuda")
+        # obstacle positions in env frame, (num_envs, num_obs, 3)
+        self.obstacle_pos = torch.zeros(self.num_envs, self.num_obs, 3, device=self.device)
       
         self.target_reward_scale = self.cfg.rewards.scales.target_reward_scale
         self.reach_target_reward_scale = self.cfg.rewards.scales.reach_target_reward_scale
@@ -103,14 +86,11 @@ class Go1PushUpperWrapper(EmptyWrapper):
         self.exception_punishment_scale = self.cfg.rewards.scales.exception_punishment_scale
         self.obstacle_reward_scale = self.cfg.rewards.scales.obstacle_reward_scale
 
-        self.reward_buffer = {
-            "distance_to_target_reward": 0,
-            "exception_punishment": 0,
-            "obstacle_reward_scale": 0,
-            "reach_target_reward":0,
-            "trajectory_rewards":0,
-            "step_count": 0,
-        }
+        self.reward_stats = RewardStatistics(["distance_to_target_reward",
+                                              "exception_punishment",
+                                              "obstacle_reward_scale",
+                                              "reach_target_reward",
+                                              "trajectory_rewards",], self.num_envs, device=self.device)
 
         # init command policy
         self._prepare_command_policy()
@@ -118,25 +98,147 @@ class Go1PushUpperWrapper(EmptyWrapper):
     def _prepare_command_policy(self):
         assert self.cfg.control.command_network_path != None, "No command policy provided."
 
-        self.rnn_states_command = np.zeros((self.num_envs * self.num_agents, 1, 64))
-        self.mask_command = np.ones((self.num_envs * self.num_agents, 1))
-
         self.command_observation_space = spaces.Box(low=-float('inf'), high=float('inf'), shape=(3 + 3 * self.num_agents,), dtype=float)
         self.command_action_space = spaces.Box(low=-1, high=1, shape=(3,), dtype=float)
 
-        self.command_module = torch.load(self.cfg.control.command_network_path, map_location=self.device)
+        command_actor, command_spec = load_command_actor(self.cfg.control.command_network_path, device=self.device)
+        self.command_policy = CommandPolicy(command_actor, self.num_envs, self.num_agents, rnn_shape=command_spec["rnn_shape"], device=self.device)
+        self.command_obs_builder = EgocentricObservation(self.num_envs, self.num_agents, include_target_yaw=False, device=self.device)
+
+    def _compute_command_observation(self, obs_buf):
+        # get agent state
+        base_pos = obs_buf.base_pos.reshape(self.num_envs, self.num_agents, -1)
+        base_yaw = obs_buf.base_rpy.reshape(self.num_envs, self.num_agents, -1)[:, :, 2]
+        # get box state and target pos, converted once per step by the env
+        state_cache = self.env.state_cache
+        box_pos = state_cache.box_pos
+        target_pos = state_cache.target_pos
+        box_yaw = state_cache.box_yaw
+
+        # rotate target, box and other agents' state to agent's local state
+        return self.command_obs_builder.compute(base_pos, base_yaw, box_pos, box_yaw, target_pos)
 
     def _init_extras(self, obs):
         return
 
     def reset_target_positions(self, env_ids):
-        new_positions = torch.randn(len(env_ids), 3, device="cuda")
+        new_positions = torch.randn(len(env_ids), 3, device=self.device)
         new_positions[:, 0] = new_positions[:, 0].abs() + 9.5
         new_positions[:, 1] = new_positions[:, 1] + 2 * torch.sign(new_positions[:, 1])
         new_positions[:, 2] = 0.1
 
         self.final_target_pos[env_ids] = new_positions
 
+    def _grid_kwargs(self):
+        # obstacles are inflated by the radius of the box footprint
+        box_radius = torch.tensor(self.cfg.asset.vertex_list, dtype=torch.float).norm(dim=1).max().item()
+        return dict(box_radius=box_radius, **getattr(self.cfg.planner, "grid_kwargs", {}))
+
+    def _run_planner(self, start, end, obs_combined):
+        """ Plan with the configured planner, returns a list of (num_points, 2) paths, empty for the failed envs """
+        planner_cfg = self.cfg.planner
+        x_lim = planner_cfg.x_lim
+        y_lim = planner_cfg.y_lim
+
+        if planner_cfg.type in ("batched_rrt", "grid"):
+            if planner_cfg.type == "grid":
+                self.grid_planner = GridPlanner(x_lim=x_lim, y_lim=y_lim, device=self.device, **self._grid_kwargs())
+                paths, lengths, success = self.grid_planner.plan(start=start, goal=end, obstacle_states=obs_combined)
+            else:
+                self.rrt = BatchedRRT(x_lim=x_lim, y_lim=y_lim, max_nodes=planner_cfg.max_nodes, device=self.device)
+                paths, lengths, success = self.rrt.plan(start=start, goal=end, obstacle_states=obs_combined, recorder=self.tree_recorder,
+                                                        **planner_cfg.rrt_kwargs)
+            lengths = torch.where(success, lengths, torch.zeros_like(lengths)).tolist()
+            return [paths[i, :lengths[i]] for i in range(len(lengths))]
+
+        self.rrt = KinodynamicRRT(x_lim=x_lim, y_lim=y_lim)
+
+        planned_traces = []
+        for i in range(start.shape[0]):
+            planned_trace = self.rrt.plan(start=start[i], goal=end[i] , recorder=self.tree_recorder, obstacle_states=obs_combined[i], 
+                                          **planner_cfg.rrt_kwargs)
+            if planned_trace is not None:
+                planned_traces.append(torch.stack(planned_trace))
+            else:
+                print("Fail to plane")
+                planned_traces.append(torch.zeros(0, 2, device=self.device))
+        return planned_traces
+
+    def _plan_cache(self):
+        planner_cfg = self.cfg.planner
+        return PlanCache.shared(getattr(planner_cfg, "cache_path", None),
+                                capacity=getattr(planner_cfg, "cache_capacity", 100000),
+                                resolution=getattr(planner_cfg, "cache_resolution", 0.1))
+
+    def _log_plan_cache(self, cache):
+        stats = cache.stats()
+        print(f"Plan cache: {stats['hits']} / {stats['lookups']} hits ({stats['hit_rate']:.1%}), "
+              f"{stats['saved_time']:.1f} s of planning saved, {stats['size']} paths cached")
+
+    def _plan_paths(self, start, end, obs_combined):
+        """ Look up the paths of all envs in the plan cache and plan the misses, returns a list of
+        (num_points, 2) paths, empty for the failed envs
+        """
+        cache = self._plan_cache()
+        keys = cache.make_keys(start, end, obs_combined)
+        cached = [cache.get(key) for key in keys]
+        planned = [None if path is None else torch.as_tensor(path, device=self.device) for path in cached]
+
+        miss_ids = [i for i, path in enumerate(planned) if path is None]
+        if len(miss_ids) > 0:
+            t0 = perf_counter()
+            new_paths = self._run_planner(start[miss_ids], end[miss_ids], obs_combined[miss_ids])
+            cache.record_planning_time(perf_counter() - t0, len(miss_ids))
+            for i, path in zip(miss_ids, new_paths):
+                planned[i] = path.float()
+                cache.put(keys[i], path.cpu().numpy())
+            if cache.path is not None:
+                cache.save()
+
+        self._log_plan_cache(cache)
+        return planned
+
+    def _submit_plans(self, env_ids, start, end, obs_combined):
+        """ Switch the cache hits to their path right away and queue the misses in the async planner, the other
+        envs follow their spline until poll_plans() receives their path
+        """
+        env_ids = [int(env_id) for env_id in env_ids]
+        cache = self._plan_cache()
+        keys = cache.make_keys(start, end, obs_combined)
+        cached = [cache.get(key) for key in keys]
+
+        hit_ids = [env_id for env_id, path in zip(env_ids, cached) if path is not None]
+        self.async_planner.invalidate(hit_ids)
+        self._apply_paths(hit_ids, [torch.as_tensor(path, device=self.device) for path in cached if path is not None])
+
+        miss = [i for i, path in enumerate(cached) if path is None]
+        if len(miss) > 0:
+            self.async_planner.submit([env_ids[i] for i in miss], start[miss], end[miss], obs_combined[miss], keys=[keys[i] for i in miss])
+
+    def poll_plans(self):
+        """ Switch the envs whose async plan is ready to their path, non-blocking """
+        results = self.async_planner.poll()
+        if len(results) == 0:
+            return
+        cache = self._plan_cache()
+        for env_id, path, seconds, key in results:
+            # no key: the worker raised, nothing to cache
+            if key is not None:
+                cache.put(key, path)
+                cache.record_planning_time(seconds, 1)
+        self._apply_paths([env_id for env_id, _, _, _ in results], [torch.as_tensor(path, device=self.device) for _, path, _, _ in results])
+
+    def _apply_paths(self, env_ids, paths):
+        """ Resample the paths of env_ids into their trajectory, envs with an empty (failed) path keep the spline """
+        planned = [(env_id, path.float()) for env_id, path in zip(env_ids, paths) if len(path) > 0]
+        if len(planned) == 0:
+            return 0
+        planned_ids = [env_id for env_id, _ in planned]
+        lengths = torch.tensor([len(path) for _, path in planned], device=self.device)
+        padded_paths = torch.nn.utils.rnn.pad_sequence([path for _, path in planned], batch_first=True)
+        self.trajectory[planned_ids, :] = interpolate_trajectory(padded_paths.reshape(len(planned_ids), -1), lengths=lengths)
+        return len(planned_ids)
+
     def set_target_pos(self, target_pos):
         self.cfg.goal.received_final_pos = target_pos
 
@@ -149,27 +251,21 @@ class Go1PushUpperWrapper(EmptyWrapper):
             self.next_target_pos = next_target_pos
 
         obs_buf = self.env.reset()
-        
+        self.command_policy.reset()
+
         # extract npc pos from self.root_states_npc\
         npc_pos = self.root_states_npc[:, :3].reshape(self.num_envs, self.num_npcs, -1)
         
-        # init obstacles position
-        self.obs1_pos = npc_pos[:,3,:] - self.env.env_origins
-        self.obs2_pos = npc_pos[:,4,:] - self.env.env_origins
+        # init obstacles position, the npcs after the box, target and final target
+        self.obstacle_pos = npc_pos[:, 3:3 + self.num_obs, :] - self.env.env_origins.unsqueeze(1)
         # (optional)
-        # self.obs1_pos[:, 0] = torch.FloatTensor(self.num_envs).uniform_(0, 14).to("cuda")
-        # self.obs2_pos[:, 0] = torch.FloatTensor(self.num_envs).uniform_(0, 14).to("cuda")
-
-        # self.obs1_pos[:, 1] = torch.FloatTensor(self.num_envs).uniform_(-7, 7).to("cuda")
-        # self.obs2_pos[:, 1] = torch.FloatTensor(self.num_envs).uniform_(-7, 7).to("cuda")
-
-        # self.obs1_pos[:, 2] = 0.1
-        # self.obs2_pos[:, 2] = 0.1
-        self.cfg.obstacle_state.obs1_pos = self.obs1_pos
-        self.cfg.obstacle_state.obs2_pos = self.obs2_pos
+        # self.obstacle_pos[:, :, 0].uniform_(0, 14)
+        # self.obstacle_pos[:, :, 1].uniform_(-7, 7)
+        # self.obstacle_pos[:, :, 2] = 0.1
+        self.cfg.obstacle_state.obstacle_pos = self.obstacle_pos
         
         # init final goal position
-        self.final_target_pos = torch.randn(self.num_envs, 3, device="cuda")
+        self.final_target_pos = torch.randn(self.num_envs, 3, device=self.device)
         self.final_target_pos[:, 0] = self.final_target_pos[:, 0].abs() + 9.5
         # self.final_target_pos[:, 1] = torch.rand(self.final_target_pos[:, 1].shape) * 10 - 5  # random y freely
         self.final_target_pos[:, 1] = self.final_target_pos[:, 1] + 3 * torch.sign(self.final_target_pos[:, 1])  #  farther y
@@ -183,45 +279,45 @@ class Go1PushUpperWrapper(EmptyWrapper):
         box_pos = npc_pos[:,0,:] - self.env.env_origins
         box_rot = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:, 0 , 3:7]
         target_pos = npc_pos[:,1,:] - self.env.env_origins
-        self.Planner = TrajectoryPlanner(self.num_envs, box_pos, self.final_target_pos)
+        self.Planner = TrajectoryPlanner(self.num_envs, box_pos, self.final_target_pos, device=self.device)
         self.trajectory = self.Planner.get_trajectory()
+        if self.async_planner is not None:
+            # plans in flight belong to the previous trajectories
+            self.async_planner.invalidate(range(self.num_envs))
 
         # initialize RRT
         if self.num_obs > 0 and self.planning == True and self.reset_count == 4:  
-            x_lim = (0, 14)
-            y_lim = (-7, 7)
-            self.rrt = KinodynamicRRT(x_lim=x_lim, y_lim=y_lim)
-            vis = TwoDVisualizer()
-
-            obs1_pos_2d = self.cfg.obstacle_state.obs1_pos[:, :2]  
-            obs2_pos_2d = self.cfg.obstacle_state.obs2_pos[:, :2] 
-            obs_combined = torch.cat([obs1_pos_2d.unsqueeze(1), obs2_pos_2d.unsqueeze(1)], dim=1) 
+            obs_combined = self.obstacle_pos[:, :, :2]
             start= box_pos[:, :2]
             end = self.final_target_pos[:, :2]
 
-            for i in range(self.num_envs):
-                if vis is not None:
-                    vis.clear()
-                    vis.set_bounds(x_lim, y_lim)
-                    vis.draw_state(start[i], color='k', s=20, alpha=1)
-                    vis.draw_state(end[i], color='g', s=20, alpha=1)
-                    vis.draw_obstacle(obs_combined[i], s=20, alpha=1)
-                planned_trace = self.rrt.plan(start=start[i], goal=end[i] , visualizer=vis, obstacle_states=obs_combined[i], 
-                                                                    action_scale=0.75, 
-                                                                    timeout=60, 
-                                                                    goal_sample_prob=0.75, 
-                                                                    REACH_THERESHOLD=1.5, 
-                                                                    COLLISION_THERESHOLD=0.3)
-                if planned_trace is not None:
-                    concatenated_trace = torch.cat(planned_trace).unsqueeze(0)
-                    self.trajectory[i, :] = interpolate_trajectory(concatenated_trace)
-                else:
-                    print("Fail to plane")
+            planner_cfg = self.cfg.planner
+            if getattr(planner_cfg, "async_workers", 0) > 0:
+                if self.async_planner is None:
+                    self.async_planner = AsyncPlanner(self.num_envs, planner_cfg.x_lim, planner_cfg.y_lim, planner_type=planner_cfg.type,
+                                                      max_nodes=planner_cfg.max_nodes, rrt_kwargs=planner_cfg.rrt_kwargs, grid_kwargs=self._grid_kwargs(),
+                                                      num_workers=planner_cfg.async_workers, max_queue=planner_cfg.async_max_queue,
+                                                      batch_size=planner_cfg.async_batch_size)
+                self._submit_plans(range(self.num_envs), start, end, obs_combined)
+            else:
+                num_planned = self._apply_paths(range(self.num_envs), self._plan_paths(start, end, obs_combined))
+                print(f"RRT planned {num_planned} / {self.num_envs} envs")
 
         next_planning_position = self.Planner.update_next_planning_position(box_pos, self.trajectory)  
-        obs = torch.cat([base_info, target_pos[:, :2], box_pos[:, :2], box_rot, self.obs1_pos[:, :2], self.obs2_pos[:, :2], next_planning_position], dim=1).unsqueeze(1)
+        obs = torch.cat([base_info, target_pos[:, :2], box_pos[:, :2], box_rot, self._obstacle_observation(box_pos), next_planning_position], dim=1).unsqueeze(1)
         return obs
 
+    def _obstacle_observation(self, box_pos):
+        """ (num_envs, 2 * num_obs) obstacle xy, or the obstacle_obs_k nearest to the box sorted by distance """
+        if self.obstacle_obs_k is None:
+            return self.obstacle_pos[:, :, :2].reshape(self.num_envs, -1)
+        return nearest_obstacles(box_pos[:, :2], self.obstacle_pos, self.obstacle_obs_k).reshape(self.num_envs, -1)
+
+    def close(self):
+        if self.async_planner is not None:
+            self.async_planner.close()
+        return super().close()
+
     def step(self, action):
         sub_goals = action.clone()
         sub_goals = torch.clip(sub_goals, -1, 1)
@@ -233,78 +329,14 @@ class Go1PushUpperWrapper(EmptyWrapper):
 
         self.env.next_target_pos = sub_goals
         
-        # organize middle-layer observation
-        # get agent state
-        base_pos = deepcopy(self.obs_buf.base_pos) 
-        base_rpy = deepcopy(self.obs_buf.base_rpy)  
-        # get box state and target pos
-        npc_pos = self.root_states_npc[:, :3].reshape(self.num_envs, self.num_npcs, -1)
-        box_pos = npc_pos[:,0,:] - self.env.env_origins
-        target_pos = npc_pos[:,1,:] - self.env.env_origins 
-        box_qyaternion = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:, 0 , 3:7]
-        box_rpy = torch.stack(get_euler_xyz(box_qyaternion), dim=1)
-        target_qyaternion = self.root_states_npc.reshape(self.num_envs, self.num_npcs, -1)[:, 1 , 3:7]
-        target_rpy = torch.stack(get_euler_xyz(target_qyaternion), dim=1)
-
-        # rotate box state and target pos to agent's local state
-        box_pos = box_pos.repeat_interleave(self.num_agents, dim=0)
-        target_pos = target_pos.repeat_interleave(self.num_agents, dim=0)
-        box_rpy = box_rpy.repeat_interleave(self.num_agents, dim=0)
-        target_rpy = target_rpy.repeat_interleave(self.num_agents, dim=0)
-        rotated_box_pos = torch.stack([(box_pos[:, 0] - base_pos[:, 0]) * torch.cos(-base_rpy[:, 2]) - (box_pos[:, 1] - base_pos[:, 1]) * torch.sin(-base_rpy[:, 2]),
-                                       (box_pos[:, 0] - base_pos[:, 0]) * torch.sin(-base_rpy[:, 2]) + (box_pos[:, 1] - base_pos[:, 1]) * torch.cos(-base_rpy[:, 2]),
-                                      box_pos[:, 2]], dim=1)
-        rotated_target_pos = torch.stack([(target_pos[:, 0] - base_pos[:, 0]) * torch.cos(-base_rpy[:, 2]) - (target_pos[:, 1] - base_pos[:, 1]) * torch.sin(-base_rpy[:, 2]),
-                                          (target_pos[:, 0] - base_pos[:, 0]) * torch.sin(-base_rpy[:, 2]) + (target_pos[:, 1] - base_pos[:, 1]) * torch.cos(-base_rpy[:, 2]),
-                                         target_pos[:, 2]], dim=1)
-        rotated_box_rpy = deepcopy(box_rpy)
-        rotated_box_rpy[:,2] = box_rpy[:,2] - base_rpy[:,2]
-        rotated_box_rpy = normalize_rpy(rotated_box_rpy)
-        rotated_target_rpy = deepcopy(target_rpy)
-        rotated_target_rpy[:,2] = target_rpy[:,2] - base_rpy[:,2]
-        rotated_target_rpy = normalize_rpy(rotated_target_rpy)
-        rotated_box_pos = rotated_box_pos.reshape([self.env.num_envs, self.env.num_agents, -1])
-        rotated_box_rpy = rotated_box_rpy.reshape([self.env.num_envs, self.env.num_agents, -1])
-        rotated_target_pos = rotated_target_pos.reshape([self.env.num_envs, self.env.num_agents, -1])
-        rotated_target_rpy = rotated_target_rpy.reshape([self.env.num_envs, self.env.num_agents, -1])
-
-        # rotate other agents' state to agent's local state
-        base_pos = base_pos.reshape([self.env.num_envs, self.env.num_agents, -1])
-        base_rpy = base_rpy.reshape([self.env.num_envs, self.env.num_agents, -1])
-        base_info = torch.cat([base_pos, base_rpy], dim=2)
-        all_base_info = []
-        if self.num_agents != 1:
-            for i in range(1, self.env.num_agents):
-                other_base_info = deepcopy(torch.roll(base_info, i, dims=1))
-                # roate other agents' state to agent's local state
-                other_base_pos = torch.stack([(other_base_info[:, :, 0] - base_pos[:, :, 0]) * torch.cos(-base_rpy[:, :, 2]) - (other_base_info[:, :, 1] - base_pos[:, :, 1]) * torch.sin(-base_rpy[:, :, 2]),
-                                              (other_base_info[:, :, 0] - base_pos[:, :, 0]) * torch.sin(-base_rpy[:, :, 2]) + (other_base_info[:, :, 1] - base_pos[:, :, 1]) * torch.cos(-base_rpy[:, :, 2]),
-                                              other_base_info[:, :, 2]], dim=2)
-                other_base_rpy = deepcopy(other_base_info[:, :, 3:6])
-                other_base_rpy[:, :, 2] = other_base_info[:, :, 5] - base_rpy[:, :, 2]
-                other_base_rpy = normalize_rpy(other_base_rpy)
-                other_base_info = torch.cat([other_base_pos[:,:,:2], other_base_rpy[:,:,2].unsqueeze(2)], dim=2)
-                all_base_info.append(other_base_info)
-            all_base_info = torch.cat(all_base_info, dim=2)
-
         # observation for middle layer
-        command_obs = torch.cat([rotated_target_pos[:,:,:2], rotated_box_pos[:,:,:2], rotated_box_rpy[:,:,2].unsqueeze(2), all_base_info], dim=2)
+        command_obs = self._compute_command_observation(self.obs_buf)
 
-        # remove nan and inf in obs
-        command_obs[torch.isnan(command_obs)] = 0
-        command_obs[torch.isinf(command_obs)] = 0
+        # remove nan and inf in obs, the middle layer is not punished for them (the flag is not used)
+        sanitize_(command_obs, num_envs=self.num_envs)
 
-        # fit for openrl
-        command_obs = command_obs.cpu().numpy()
-        command_obs = np.concatenate(command_obs, axis=0)
-
-        # middle layer policy
-        command_action,_ = self.command_module.act(command_obs, self.rnn_states_command, self.mask_command, deterministic=True)
-        
-        # fit for openrl
-        command_action = np.array(np.split(_t2n(command_action), self.num_envs))
-        command_action = torch.from_numpy(0.5 * command_action).cuda().clip(-1, 1)
-        command_action = torch.clip(command_action, -1, 1)
+        # middle layer policy, stays on the device
+        command_action = self.command_policy.act(command_obs)
 
         obs_buf, _, termination, info = self.env.step((command_action * self.action_scale).reshape(-1, self.command_action_space.shape[0]))
 
@@ -324,22 +356,12 @@ class Go1PushUpperWrapper(EmptyWrapper):
         # env reset
         reset_envs = (self.episode_length_buf == 0).nonzero(as_tuple=False).flatten()
         if len(reset_envs) > 0:
+            self.command_policy.reset(reset_envs)
             self.reset_target_positions(reset_envs)
             self.set_target_pos(self.final_target_pos)
             self.Planner.reset_trajectory(reset_envs, self.final_target_pos)
 
-            if self.num_obs > 0:
-                self.obs1_pos[reset_envs, :] = npc_pos[reset_envs , 3, :] - self.env.env_origins[reset_envs, :]
-                self.obs2_pos[reset_envs, :] = npc_pos[reset_envs , 4, :] - self.env.env_origins[reset_envs, :]
-            else:
-                self.obs1_pos[reset_envs, 0] = torch.FloatTensor(len(reset_envs)).uniform_(0, 9).to("cuda")
-                self.obs2_pos[reset_envs, 0] = torch.FloatTensor(len(reset_envs)).uniform_(0, 9).to("cuda")
-
-                self.obs1_pos[reset_envs, 1] = torch.FloatTensor(len(reset_envs)).uniform_(-5, 5).to("cuda")
-                self.obs2_pos[reset_envs, 1] = torch.FloatTensor(len(reset_envs)).uniform_(-5, 5).to("cuda")
-
-                self.obs1_pos[reset_envs, 2] = 0.1
-                self.obs2_pos[reset_envs, 2] = 0.1
+            self.obstacle_pos[reset_envs] = npc_pos[reset_envs, 3:3 + self.num_obs, :] - self.env.env_origins[reset_envs].unsqueeze(1)
 
         if self.planning == False:
             self.trajectory = self.Planner.get_trajectory(self.episode_length_buf)
@@ -349,34 +371,30 @@ class Go1PushUpperWrapper(EmptyWrapper):
             # third_point = self.trajectory[reset_envs, 4:6]
             # seventh_point = self.trajectory[reset_envs, 12:14]
 
-            # y_offset = (torch.rand(len(reset_envs), 1, device='cuda:0') * (3 - 2) + 2)  
-            # sign = torch.sign(torch.rand(len(reset_envs), 1, device='cuda:0') - 0.5)  
+            # y_offset = (torch.rand(len(reset_envs), 1, device=self.device) * (3 - 2) + 2)  
+            # sign = torch.sign(torch.rand(len(reset_envs), 1, device=self.device) - 0.5)  
 
             # third_point[:, 1] = third_point[:, 1] + (y_offset * sign).squeeze()
             # seventh_point[:, 1] = seventh_point[:, 1] - (y_offset * sign).squeeze()
 
-            # self.cfg.obstacle_state.obs1_pos[reset_envs, :] = torch.cat((third_point, torch.full((len(reset_envs), 1), 0.1, device='cuda:0')), dim=1)
-            # self.cfg.obstacle_state.obs2_pos[reset_envs, :] = torch.cat((seventh_point, torch.full((len(reset_envs), 1), 0.1, device='cuda:0')), dim=1)
-            self.cfg.obstacle_state.obs1_pos[reset_envs, 0] = torch.FloatTensor(len(reset_envs)).uniform_(0, 14).to("cuda")
-            self.cfg.obstacle_state.obs2_pos[reset_envs, 0] = torch.FloatTensor(len(reset_envs)).uniform_(0, 14).to("cuda")
-
-            self.cfg.obstacle_state.obs1_pos[reset_envs, 1] = torch.FloatTensor(len(reset_envs)).uniform_(-7, 7).to("cuda")
-            self.cfg.obstacle_state.obs2_pos[reset_envs, 1] = torch.FloatTensor(len(reset_envs)).uniform_(-7, 7).to("cuda")
-
-            self.obs1_pos = self.cfg.obstacle_state.obs1_pos
-            self.obs2_pos = self.cfg.obstacle_state.obs2_pos
+            # self.cfg.obstacle_state.obstacle_pos[reset_envs, 0, :] = torch.cat((third_point, torch.full((len(reset_envs), 1), 0.1, device=self.device)), dim=1)
+            # self.cfg.obstacle_state.obstacle_pos[reset_envs, 1, :] = torch.cat((seventh_point, torch.full((len(reset_envs), 1), 0.1, device=self.device)), dim=1)
+            obstacle_pos = self.cfg.obstacle_state.obstacle_pos
+            obstacle_pos[reset_envs, :, 0] = torch.rand(len(reset_envs), self.num_obs, device=self.device) * 14
+            obstacle_pos[reset_envs, :, 1] = torch.rand(len(reset_envs), self.num_obs, device=self.device) * 14 - 7
+            self.obstacle_pos = obstacle_pos
 
             self.trajectory = self.Planner.get_trajectory(self.episode_length_buf)          
 
+        if self.async_planner is not None:
+            # reset envs are back on their spline, plan them again with the new target and obstacles
+            if len(reset_envs) > 0:
+                obs_combined = self.obstacle_pos[reset_envs, :, :2]
+                self._submit_plans(reset_envs.tolist(), box_pos[reset_envs, :2], self.final_target_pos[reset_envs, :2], obs_combined)
+            self.poll_plans()
+
         next_planning_position = self.Planner.update_next_planning_position(box_pos, self.trajectory)  
-        obs = torch.cat([base_info, target_pos[:, :2], box_pos[:, :2], box_rot, self.obs1_pos[:, :2], self.obs2_pos[:, :2], next_planning_position], dim=1).unsqueeze(1)
-        
-        # remove nan and inf in obs and reward
-        self.value_exception_buf = torch.isnan(obs).any(dim=2).any(dim=1) \
-                                | torch.isinf(obs).any(dim=2).any(dim=1) \
-                                
-        obs[torch.isnan(obs)] = 0
-        obs[torch.isinf(obs)] = 0
+        obs = torch.cat([base_info, target_pos[:, :2], box_pos[:, :2], box_rot, self._obstacle_observation(box_pos), next_planning_position], dim=1).unsqueeze(1)
 
         # calculate reward 
         base_pos = obs_buf.base_pos     # (env_num, agent_num, 3)
@@ -386,28 +404,23 @@ class Go1PushUpperWrapper(EmptyWrapper):
         base_vel = base_vel.reshape([self.env.num_envs, self.env.num_agents, -1])
         base_rpy = base_rpy.reshape([self.env.num_envs, self.env.num_agents, -1])
 
-        # occlude nan or inf
-        box_pos[torch.isnan(box_pos)] = 0
-        box_pos[torch.isinf(box_pos)] = 0
-        base_pos[torch.isnan(base_pos)] = 0
-        base_pos[torch.isinf(base_pos)] = 0
-        box_rpy[torch.isnan(box_rpy)] = 0
-        box_rpy[torch.isinf(box_rpy)] = 0
+        # get env_id which should be reseted because of nan or inf, and occlude them
+        # only a non-finite obs flags the env (and is punished), the states are just cleaned.
+        # base_rpy in the obs was cleaned by the state cache, its flag comes from it
+        self.value_exception_buf = sanitize_(obs, num_envs=self.num_envs) | self.env.state_cache.value_exception("base_rpy")
+        sanitize_(box_pos, base_pos, num_envs=self.num_envs)
         
-        self.reward_buffer["step_count"] += 1
-
         reward = torch.zeros([self.env.num_envs, 1], device=self.env.device)
 
         # calculate reach target reward and set finish task termination
         if self.reach_target_reward_scale != 0:
-            reward[self.finished_buf, :] += self.reach_target_reward_scale
-            self.reward_buffer["reach_target_reward"] += self.reach_target_reward_scale * self.finished_buf.sum().item()
+            reward += self.reach_target_reward_scale * self.finished_buf.float().unsqueeze(1)
+            self.reward_stats.add("reach_target_reward", self.reach_target_reward_scale * self.finished_buf.sum())
         
         # calculate exception punishment
         if self.exception_punishment_scale != 0:
-            reward[self.exception_buf, :] += self.exception_punishment_scale
-            reward[self.value_exception_buf, :] += self.exception_punishment_scale
-            self.reward_buffer["exception_punishment"] += self.exception_punishment_scale * self.exception_buf.sum().item()
+            reward += self.exception_punishment_scale * (self.exception_buf.float() + self.value_exception_buf.float()).unsqueeze(1)
+            self.reward_stats.add("exception_punishment", self.exception_punishment_scale * self.exception_buf.sum())
 
         # calculate distance from current_box_pos to target_box_pos reward
         if self.target_reward_scale != 0:
@@ -416,19 +429,19 @@ class Go1PushUpperWrapper(EmptyWrapper):
             target_distance *= self.target_reward_scale
             target_distance = target_distance.unsqueeze(1)
             reward[:, :] += target_distance
-            self.reward_buffer["distance_to_target_reward"] += torch.sum(target_distance).cpu()
+            self.reward_stats.add("distance_to_target_reward", torch.sum(target_distance))
 
         if self.obstacle_reward_scale != 0:
-            obs1_distance = torch.norm(sub_goals[:, :2] - self.obs1_pos[:, :2], dim=1)
-            obs2_distance = torch.norm(sub_goals[:, :2] - self.obs2_pos[:, :2], dim=1)
-            obs1_distance = 1 / (1 + obs1_distance)
-            obs2_distance = 1 / (1 + obs2_distance)
-            obs1_reward = self.obstacle_reward_scale * obs1_distance
-            obs2_reward = self.obstacle_reward_scale * obs2_distance
-            obstacle_reward = obs1_reward + obs2_reward
+            if getattr(self.cfg.rewards, "obstacle_reward_nearest", False):
+                # nearest obstacle only, looked up in the obstacle distance field of the env
+                self.obstacle_field.update(self.obstacle_pos[..., :2])
+                obstacle_reward = self.obstacle_reward_scale / (1 + self.obstacle_field.distance(sub_goals[:, :2]))
+            else:
+                obstacle_distance = torch.norm(sub_goals[:, None, :2] - self.obstacle_pos[:, :, :2], dim=2)
+                obstacle_reward = (self.obstacle_reward_scale / (1 + obstacle_distance)).sum(dim=1)
             obstacle_reward = obstacle_reward.unsqueeze(1)
             reward[:, :] += obstacle_reward
-            self.reward_buffer["obstacle_reward_scale"] += torch.sum(obstacle_reward).cpu()
+            self.reward_stats.add("obstacle_reward_scale", torch.sum(obstacle_reward))
 
         # calculate trajectory rewards
         if self.trajectory_rewards_scale != 0:
@@ -437,6 +450,8 @@ class Go1PushUpperWrapper(EmptyWrapper):
             next_planne_reward *= self.trajectory_rewards_scale
             next_planne_reward = next_planne_reward.unsqueeze(1)
             reward[:, :] += next_planne_reward
-            self.reward_buffer["trajectory_rewards"] += torch.sum(next_planne_reward).cpu()
+            self.reward_stats.add("trajectory_rewards", torch.sum(next_planne_reward))
+
+        self.reward_stats.record_step(reward, termination)
 
         return obs, reward, termination, info
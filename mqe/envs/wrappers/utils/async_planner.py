@@ -0,0 +1,173 @@
+import contextlib
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from mqe.envs.wrappers.utils.rrt import KinodynamicRRT, BatchedRRT
+from mqe.envs.wrappers.utils.grid_planner import GridPlanner
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+def _plan_worker(planner_type, x_lim, y_lim, max_nodes, rrt_kwargs, grid_kwargs, start, goal, obstacle_states):
+    """ Plan a batch of envs on the CPU of a worker process, returns (list of (num_points, 2) paths, seconds) """
+    start = torch.from_numpy(start)
+    goal = torch.from_numpy(goal)
+    obstacle_states = torch.from_numpy(obstacle_states)
+
+    t0 = perf_counter()
+    if planner_type in ("batched_rrt", "grid"):
+        if planner_type == "grid":
+            planner = GridPlanner(x_lim=x_lim, y_lim=y_lim, device="cpu", **grid_kwargs)
+            paths, lengths, success = planner.plan(start=start, goal=goal, obstacle_states=obstacle_states)
+        else:
+            planner = BatchedRRT(x_lim=x_lim, y_lim=y_lim, max_nodes=max_nodes, device="cpu")
+            paths, lengths, success = planner.plan(start=start, goal=goal, obstacle_states=obstacle_states, **rrt_kwargs)
+        lengths = torch.where(success, lengths, torch.zeros_like(lengths)).tolist()
+        planned = [paths[i, :lengths[i]].numpy() for i in range(len(lengths))]
+    else:
+        rrt = KinodynamicRRT(x_lim=x_lim, y_lim=y_lim)
+        planned = []
+        for i in range(start.shape[0]):
+            with contextlib.redirect_stdout(io.StringIO()):
+                trace = rrt.plan(start=start[i], goal=goal[i], obstacle_states=obstacle_states[i], **rrt_kwargs)
+            planned.append(torch.stack(trace).numpy() if trace is not None else np.zeros((0, 2), dtype=np.float32))
+    return planned, perf_counter() - t0
+
+
+class AsyncPlanner:
+    """ Plans paths in a pool of CPU worker processes while the simulation keeps stepping.
+
+    submit() queues the planning problems of some envs and bumps their plan version, poll() is non-blocking
+    and returns the finished paths whose version is still current, results of envs that were reset (or
+    re-submitted) in the meantime are dropped. Requests wait in a bounded queue (the oldest are dropped
+    when it overflows, these envs keep their spline) and are sent to the workers in batches of batch_size,
+    with at most max_in_flight batches at a time. Workers are spawned, so they never touch the CUDA context
+    of the simulation, and plan on their CPU. A batch whose worker raises is counted as failed, its envs get
+    an empty path (they keep their spline) instead of the exception ending the simulation step.
+    The optional cache key of a request is kept with it and dropped wherever the request is dropped.
+    """
+    def __init__(self, num_envs, x_lim, y_lim, planner_type="batched_rrt", max_nodes=4096, rrt_kwargs=None, grid_kwargs=None,
+                 num_workers=2, max_queue=4096, batch_size=64, max_in_flight=None, worker_threads=1):
+        self.num_envs = num_envs
+        self.planner_args = (planner_type, tuple(x_lim), tuple(y_lim), max_nodes, dict(rrt_kwargs or {}), dict(grid_kwargs or {}))
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight if max_in_flight is not None else 2 * num_workers
+
+        self.versions = np.zeros(num_envs, dtype=np.int64)
+        # env_id -> plan cache key of its current request
+        self.keys = {}
+        # env_id -> (version, submit time, start, goal, obstacle_states)
+        self.queue = OrderedDict()
+        # future -> (env_ids, versions, submit times)
+        self.in_flight = {}
+        self.executor = ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker, initargs=(worker_threads,))
+
+        self.num_submitted = 0
+        self.num_completed = 0
+        self.num_stale = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+        self.latency_sum = 0.
+        self.latency_max = 0.
+        self.planning_time = 0.
+
+    def invalidate(self, env_ids):
+        """ Drop the queued requests and in flight results of env_ids """
+        for env_id in env_ids:
+            self.versions[env_id] += 1
+            self.queue.pop(env_id, None)
+            self.keys.pop(env_id, None)
+
+    def submit(self, env_ids, start, goal, obstacle_states, keys=None):
+        """
+        Args:
+            env_ids: list of env indices
+            start, goal: (len(env_ids), 2)
+            obstacle_states: (len(env_ids), num_obstacles, 2)
+            keys: optional plan cache keys of the requests, returned with their path by poll()
+        """
+        env_ids = [int(env_id) for env_id in env_ids]
+        self.invalidate(env_ids)
+        start = start[:, :2].float().cpu().numpy()
+        goal = goal[:, :2].float().cpu().numpy()
+        obstacle_states = obstacle_states[..., :2].float().cpu().numpy()
+        now = perf_counter()
+        for i, env_id in enumerate(env_ids):
+            self.queue[env_id] = (self.versions[env_id], now, start[i], goal[i], obstacle_states[i])
+            if keys is not None:
+                self.keys[env_id] = keys[i]
+        self.num_submitted += len(env_ids)
+        while len(self.queue) > self.max_queue:
+            env_id, _ = self.queue.popitem(last=False)
+            self.keys.pop(env_id, None)
+            self.num_dropped += 1
+        self._dispatch()
+
+    def poll(self):
+        """ Non-blocking, returns a list of (env_id, (num_points, 2) path, planning seconds, cache key) of the
+        finished current plans, failed plans have an empty path. The key is None for the envs of a batch whose
+        worker raised (nothing to cache) or when submit() got no keys.
+        """
+        results = []
+        now = perf_counter()
+        for future in [future for future in self.in_flight if future.done()]:
+            env_ids, versions, submit_times = self.in_flight.pop(future)
+            try:
+                paths, seconds = future.result()
+                failed = False
+            except Exception as e:
+                print(f"Async planning of {len(env_ids)} envs failed ({type(e).__name__}: {e}), they keep their spline.")
+                paths, seconds = [np.zeros((0, 2), dtype=np.float32)] * len(env_ids), 0.
+                failed = True
+                self.num_failed += len(env_ids)
+            self.planning_time += seconds
+            for env_id, version, submit_time, path in zip(env_ids, versions, submit_times, paths):
+                if version != self.versions[env_id]:
+                    self.num_stale += 1
+                    continue
+                key = self.keys.pop(env_id, None)
+                if failed:
+                    results.append((env_id, path, seconds, None))
+                    continue
+                latency = now - submit_time
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+                self.num_completed += 1
+                results.append((env_id, path, seconds / len(env_ids), key))
+        self._dispatch()
+        return results
+
+    def _dispatch(self):
+        while len(self.queue) > 0 and len(self.in_flight) < self.max_in_flight:
+            batch = [self.queue.popitem(last=False) for _ in range(min(self.batch_size, len(self.queue)))]
+            env_ids = [env_id for env_id, _ in batch]
+            versions = [request[0] for _, request in batch]
+            submit_times = [request[1] for _, request in batch]
+            start, goal, obstacle_states = (np.stack([request[k] for _, request in batch]) for k in (2, 3, 4))
+            future = self.executor.submit(_plan_worker, *self.planner_args, start, goal, obstacle_states)
+            self.in_flight[future] = (env_ids, versions, submit_times)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.queue),
+            "in_flight": sum(len(env_ids) for env_ids, _, _ in self.in_flight.values()),
+            "submitted": self.num_submitted,
+            "completed": self.num_completed,
+            "stale": self.num_stale,
+            "dropped": self.num_dropped,
+            "failed": self.num_failed,
+            "latency_mean": self.latency_sum / max(self.num_completed, 1),
+            "latency_max": self.latency_max,
+            "planning_time": self.planning_time,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,92 @@
+import json
+import os
+
+import torch
+
+# files of an exported actor directory, see helpers/export_command_actor.py
+ACTOR_JIT_FILE = "actor.jit.pt"
+ACTOR_STATE_DICT_FILE = "actor_state_dict.pt"
+ACTOR_SPEC_FILE = "spec.json"
+
+class OpenRLActor(torch.nn.Module):
+    """ Deterministic actor of an OpenRL policy network with the (obs, rnn_states, masks) -> (actions, rnn_states)
+    signature used by CommandPolicy. This is the module traced by the export command.
+    """
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+    def forward(self, obs, rnn_states, masks):
+        # "original" forward of the policy network is what PPOModule.act() calls
+        actions, _, rnn_states = self.policy("original", obs, rnn_states, masks, None, True)
+        return actions, rnn_states
+
+def openrl_actor_spec(module, actor):
+    """ Input / output spec of the actor of a pickled OpenRL module """
+    linears = [m for m in actor.modules() if isinstance(m, torch.nn.Linear)]
+    cfg = getattr(module, "cfg", None)
+    return {
+        "obs_dim": linears[0].in_features,
+        "action_dim": linears[-1].out_features,
+        "recurrent": hasattr(actor.policy, "rnn"),
+        "rnn_shape": [getattr(cfg, "recurrent_N", 1), getattr(cfg, "hidden_size", 64)],
+        "dtype": "float32",
+    }
+
+def load_command_actor(path, device="cpu"):
+    """ Load the mid-level actor, returns (actor, spec)
+
+    path is either an actor directory written by helpers/export_command_actor.py (TorchScript, no OpenRL
+    needed) or a pickled OpenRL module.pt (requires OpenRL to unpickle, also loads the critic and optimizer)
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, ACTOR_SPEC_FILE)) as f:
+            spec = json.load(f)
+        actor = torch.jit.load(os.path.join(path, ACTOR_JIT_FILE), map_location=device)
+        return actor, spec
+
+    module = torch.load(path, map_location=device)
+    actor = OpenRLActor(module.models["policy"])
+    return actor, openrl_actor_spec(module, actor)
+
+class CommandPolicy:
+    """ Frozen mid-level actor used by the upper wrapper, tensors in and tensors out on the env device.
+
+    The actor is called with device tensors, so no numpy round trip is needed. The RNN states and masks
+    live on the device and are reset per env at episode end.
+    """
+    def __init__(self, actor, num_envs, num_agents, rnn_shape=(1, 64), action_scale=0.5, device="cpu"):
+        self.num_envs = num_envs
+        self.num_agents = num_agents
+        self.action_scale = action_scale
+        self.device = device
+
+        self.actor = actor
+        self.actor.eval()
+
+        self.rnn_states = torch.zeros(num_envs * num_agents, *rnn_shape, dtype=torch.float, device=device)
+        self.masks = torch.ones(num_envs * num_agents, 1, dtype=torch.float, device=device)
+
+    @torch.no_grad()
+    def act(self, obs):
+        """
+        Args:
+            obs: (num_envs, num_agents, obs_dim) mid-level observation
+        Returns:
+            (num_envs, num_agents, 3) command in [-1, 1]
+        """
+        actions, rnn_states = self.actor(obs.reshape(self.num_envs * self.num_agents, -1), self.rnn_states, self.masks)
+        self.rnn_states.copy_(rnn_states)
+        self.masks.fill_(1.)
+        return (self.action_scale * actions).reshape(self.num_envs, self.num_agents, -1).clip(-1, 1)
+
+    def reset(self, env_ids=None):
+        """ Clear the RNN states of env_ids (all envs if None) and mask them for the next act() """
+        rnn_states = self.rnn_states.view(self.num_envs, self.num_agents, -1)
+        masks = self.masks.view(self.num_envs, self.num_agents)
+        if env_ids is None:
+            rnn_states.zero_()
+            masks.zero_()
+        else:
+            rnn_states[env_ids] = 0.
+            masks[env_ids] = 0.
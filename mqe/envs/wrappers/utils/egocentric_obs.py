@@ -0,0 +1,75 @@
+import torch
+
+class EgocentricObservation:
+    """ Batched SE(2) observation kernel shared by the push wrappers.
+
+    For every agent it expresses the target, the box and all other agents in the agent's own frame
+    and writes the result into a preallocated (num_envs, num_agents, obs_dim) buffer.
+    Layout per agent (same as the original hand written version):
+        [target_x, target_y, (target_yaw), box_x, box_y, box_yaw, (other_x, other_y, other_yaw) * (num_agents - 1)]
+    where other agent k of agent a is agent (a - k) % num_agents, i.e. torch.roll(base_info, k, dims=1).
+    NOTE: the returned tensor is the internal buffer, it is overwritten by the next call.
+    """
+    def __init__(self, num_envs, num_agents, include_target_yaw=False, device="cpu"):
+        self.num_envs = num_envs
+        self.num_agents = num_agents
+        self.include_target_yaw = include_target_yaw
+        self.device = device
+
+        self.target_dim = 3 if include_target_yaw else 2
+        self.obs_dim = self.target_dim + 3 * num_agents
+
+        # index of the k-th other agent seen by agent a, shape (num_agents, num_agents - 1)
+        agent_ids = torch.arange(num_agents, device=device)
+        shifts = torch.arange(1, num_agents, device=device)
+        self.other_ids = (agent_ids.unsqueeze(1) - shifts.unsqueeze(0)) % num_agents
+
+        # entity 0 is the target, entity 1 is the box, entities 2: are the other agents
+        num_entities = num_agents + 1
+        self.rel_pos = torch.zeros(num_envs, num_agents, num_entities, 2, dtype=torch.float, device=device)
+        self.rel_yaw = torch.zeros(num_envs, num_agents, num_entities, dtype=torch.float, device=device)
+
+        self.obs = torch.zeros(num_envs, num_agents, self.obs_dim, dtype=torch.float, device=device)
+        self._target_view = self.obs[..., :self.target_dim]
+        self._entity_view = self.obs[..., self.target_dim:].view(num_envs, num_agents, num_agents, 3)
+
+    def compute(self, base_pos, base_yaw, box_pos, box_yaw, target_pos, target_yaw=None):
+        """
+        Args:
+            base_pos: (num_envs, num_agents, >=2) agent positions
+            base_yaw: (num_envs, num_agents) agent yaw
+            box_pos: (num_envs, >=2) box positions
+            box_yaw: (num_envs,) box yaw
+            target_pos: (num_envs, >=2) target positions
+            target_yaw: (num_envs,) target yaw, only read when include_target_yaw is True
+        Returns:
+            (num_envs, num_agents, obs_dim) observation buffer
+        """
+        base_xy = base_pos[..., :2]
+        self.rel_pos[:, :, 0] = target_pos[:, None, :2] - base_xy
+        self.rel_pos[:, :, 1] = box_pos[:, None, :2] - base_xy
+        self.rel_pos[:, :, 2:] = base_xy[:, self.other_ids] - base_xy.unsqueeze(2)
+
+        if self.include_target_yaw:
+            self.rel_yaw[:, :, 0] = target_yaw.unsqueeze(1)
+        self.rel_yaw[:, :, 1] = box_yaw.unsqueeze(1)
+        self.rel_yaw[:, :, 2:] = base_yaw[:, self.other_ids]
+        self.rel_yaw.sub_(base_yaw.unsqueeze(2)).remainder_(2 * torch.pi)
+
+        # rotate by -yaw of the observing agent
+        cos_yaw = torch.cos(base_yaw).unsqueeze(2)
+        sin_yaw = torch.sin(base_yaw).unsqueeze(2)
+        dx = self.rel_pos[..., 0]
+        dy = self.rel_pos[..., 1]
+        local_x = dx * cos_yaw + dy * sin_yaw
+        local_y = dy * cos_yaw - dx * sin_yaw
+
+        self._target_view[..., 0] = local_x[:, :, 0]
+        self._target_view[..., 1] = local_y[:, :, 0]
+        if self.include_target_yaw:
+            self._target_view[..., 2] = self.rel_yaw[:, :, 0]
+        self._entity_view[..., 0] = local_x[:, :, 1:]
+        self._entity_view[..., 1] = local_y[:, :, 1:]
+        self._entity_view[..., 2] = self.rel_yaw[:, :, 1:]
+
+        return self.obs
@@ -0,0 +1,149 @@
+import torch
+
+from mqe.envs.wrappers.utils.polygon import PolygonGeometry, PolygonSDF
+
+class MidRewardEngine:
+    """ Batched reward terms of the mid-level push task.
+
+    Terms are registered from the reward scales, a term whose scale is zero is never evaluated.
+    Each term is computed for all (env, agent) pairs at once by self._reward_<name>() which returns
+    the unscaled reward (broadcastable to (num_envs, num_agents)) and the value logged in reward_stats.
+    """
+    # scale name in cfg.rewards.scales -> term name (also the key in reward_stats)
+    # NOTE: the order is the order in which the terms are accumulated
+    TERMS = {
+        "reach_target_reward_scale": "reach_target_reward",
+        "exception_punishment_scale": "exception_punishment",
+        "target_reward_scale": "distance_to_target_reward",
+        "approach_reward_scale": "approach_to_box_reward",
+        "collision_punishment_scale": "collision_punishment",
+        "push_reward_scale": "push_reward",
+        "ocb_reward_scale": "ocb_reward",
+    }
+
+    def __init__(self, scales: dict, num_envs, num_agents, vertex_list, dist_calculator=None, expanded_ocb_reward=False,
+                 ocb_sdf_resolution=None, device="cpu"):
+        self.num_envs = num_envs
+        self.num_agents = num_agents
+        # exact nearest edge, or a bilinear lookup in a cached grid of the polygon
+        if ocb_sdf_resolution is None:
+            self.polygon = PolygonGeometry(vertex_list, device=device)
+        else:
+            self.polygon = PolygonSDF(vertex_list, resolution=ocb_sdf_resolution, device=device)
+        self.dist_calculator = dist_calculator
+        self.expanded_ocb_reward = expanded_ocb_reward
+        self.device = device
+
+        # all agent pairs (i < j) for the collision punishment
+        self.pair_i, self.pair_j = torch.triu_indices(num_agents, num_agents, offset=1, device=device)
+
+        self._prepare_reward_function(scales)
+
+    def _prepare_reward_function(self, scales):
+        """ Looks for self._reward_<TERM_NAME> for all non zero scales """
+        self.reward_scales = {}
+        self.reward_functions = []
+        self.reward_names = []
+        for scale_name, name in self.TERMS.items():
+            scale = scales.get(scale_name, 0)
+            if scale == 0:
+                continue
+            self.reward_scales[name] = scale
+            self.reward_names.append(name)
+            self.reward_functions.append(getattr(self, "_reward_" + name))
+
+    def compute(self, base_pos, box_pos, box_yaw, target_pos, target_yaw, box_state, last_box_state, target_state,
+                finished_buf, exception_buf, value_exception_buf):
+        """
+        Args:
+            base_pos: (num_envs, num_agents, 3) agent positions
+            box_pos, target_pos: (num_envs, 3) box / target positions relative to the env origins
+            box_yaw, target_yaw: (num_envs,) box / target yaw
+            box_state, last_box_state, target_state: (num_envs, 13) npc root states
+            finished_buf, exception_buf, value_exception_buf: (num_envs,) bool buffers
+        Returns:
+            reward: (num_envs, num_agents)
+            logs: dict of term name -> 0-dim tensor summed over the batch
+        """
+        self.base_pos = base_pos
+        self.box_pos = box_pos
+        self.box_yaw = box_yaw
+        self.target_pos = target_pos
+        self.target_yaw = target_yaw
+        self.box_state = box_state
+        self.last_box_state = last_box_state
+        self.target_state = target_state
+        self.finished_buf = finished_buf
+        self.exception_buf = exception_buf
+        self.value_exception_buf = value_exception_buf
+
+        reward = torch.zeros(self.num_envs, self.num_agents, dtype=torch.float, device=self.device)
+        logs = {}
+        for name, reward_function in zip(self.reward_names, self.reward_functions):
+            rew, log = reward_function()
+            reward += rew * self.reward_scales[name]
+            logs[name] = log * self.reward_scales[name]
+        return reward, logs
+
+    #------------ reward functions----------------
+    def _reward_reach_target_reward(self):
+        finished = self.finished_buf.float()
+        return finished.unsqueeze(1), finished.sum()
+
+    def _reward_exception_punishment(self):
+        exception = self.exception_buf.float() + self.value_exception_buf.float()
+        return exception.unsqueeze(1), exception.sum()
+
+    def _reward_distance_to_target_reward(self):
+        # distance from current_box_pos to target_box_pos
+        past_distance = self.dist_calculator.cal_dist(self.last_box_state, self.target_state, target_yaw=self.target_yaw)
+        distance = self.dist_calculator.cal_dist(self.box_state, self.target_state, self.box_yaw, self.target_yaw)
+        distance_reward = 100 * (2 * (past_distance - distance) - 0.01 * distance)
+        return distance_reward.unsqueeze(1), distance_reward.sum()
+
+    def _reward_approach_to_box_reward(self):
+        # distance from each robot to box
+        distance = torch.norm(self.box_pos.unsqueeze(1) - self.base_pos, dim=2)
+        approach_reward = -(distance + 0.5)**2
+        return approach_reward, approach_reward.sum()
+
+    def _reward_collision_punishment(self):
+        # distance of all agent pairs at once, each pair punishes both agents
+        distance = torch.norm(self.base_pos[:, self.pair_i] - self.base_pos[:, self.pair_j], dim=2)
+        collision_punishment = 1 / (0.02 + distance / 3)
+        punishment = torch.zeros(self.num_envs, self.num_agents, dtype=torch.float, device=self.device)
+        punishment.index_add_(1, self.pair_i, collision_punishment)
+        punishment.index_add_(1, self.pair_j, collision_punishment)
+        return punishment, collision_punishment.sum()
+
+    def _reward_push_reward(self):
+        push = (torch.norm(self.box_state[:, 7:9], dim=1) > 0.1).float()
+        return push.unsqueeze(1), push.sum()
+
+    def _reward_ocb_reward(self):
+        target_vec = self.target_pos[:, :2] - self.box_pos[:, :2]
+        if self.expanded_ocb_reward:
+            # rotate target direction by delta_yaw/2 (Circular Arc Interpolation Trajectory)
+            original_target_direction = target_vec / torch.norm(target_vec + 0.01, dim=1, keepdim=True)
+            delta_yaw = self.target_yaw - self.box_yaw
+            delta_yaw = (delta_yaw + torch.pi) % (2 * torch.pi) - torch.pi
+            cos_half = torch.cos(-delta_yaw / 2)
+            sin_half = torch.sin(-delta_yaw / 2)
+            target_direction = torch.stack([original_target_direction[:, 0] * cos_half - original_target_direction[:, 1] * sin_half,
+                                            original_target_direction[:, 0] * sin_half + original_target_direction[:, 1] * cos_half], dim=1)
+        else:
+            target_direction = target_vec / torch.norm(target_vec, dim=1, keepdim=True)
+
+        # agent positions in box frame, all (env, agent) pairs at once
+        cos_yaw = torch.cos(self.box_yaw.float()).unsqueeze(1)
+        sin_yaw = torch.sin(self.box_yaw.float()).unsqueeze(1)
+        gf_pos = self.base_pos[:, :, :2] - self.box_pos[:, None, :2]
+        box_relative_pos = torch.stack([gf_pos[..., 0] * cos_yaw + gf_pos[..., 1] * sin_yaw,
+                                        gf_pos[..., 1] * cos_yaw - gf_pos[..., 0] * sin_yaw], dim=2)
+        normal_vector = self.polygon.nearest_normal(box_relative_pos.reshape(-1, 2))
+        normal_vector = normal_vector.reshape(self.num_envs, self.num_agents, 2)
+        # back to world frame
+        normal_vector = torch.stack([normal_vector[..., 0] * cos_yaw - normal_vector[..., 1] * sin_yaw,
+                                     normal_vector[..., 0] * sin_yaw + normal_vector[..., 1] * cos_yaw], dim=2)
+        ocb_reward = torch.sum(target_direction.unsqueeze(1) * normal_vector, dim=2)
+        return ocb_reward, ocb_reward.sum()
@@ -0,0 +1,109 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+class PlanCache:
+    """ LRU cache of planned paths keyed by the quantized (box start, final target, obstacle positions).
+
+    Obstacles are sorted inside the key, so their order does not matter. Failed plans are cached as empty
+    paths, they would fail again after the same timeout. The cache is persisted with save() to a .npz file
+    of flat int32 keys / float32 waypoints with offset arrays (no pickle), in LRU order.
+    Use PlanCache.shared() to get the instance shared by all envs / wrappers of the process.
+    """
+    _shared = {}
+
+    def __init__(self, path=None, capacity=100000, resolution=0.1):
+        self.path = path
+        self.capacity = capacity
+        self.resolution = resolution
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.planning_time = 0.
+        self.num_planned = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    @classmethod
+    def shared(cls, path=None, capacity=100000, resolution=0.1):
+        key = (os.path.abspath(path) if path is not None else None, resolution)
+        if key not in cls._shared:
+            cls._shared[key] = cls(path, capacity, resolution)
+        return cls._shared[key]
+
+    def make_keys(self, start, goal, obstacle_states):
+        """
+        Args:
+            start, goal: (num_envs, >=2)
+            obstacle_states: (num_envs, num_obstacles, >=2)
+        Returns:
+            list of num_envs hashable keys
+        """
+        quantize = lambda x: torch.round(x[..., :2] / self.resolution).long().cpu().tolist()
+        keys = []
+        for s, g, obstacles in zip(quantize(start), quantize(goal), quantize(obstacle_states)):
+            keys.append(tuple(s + g + [v for obstacle in sorted(obstacles) for v in obstacle]))
+        return keys
+
+    def get(self, key):
+        """ (num_points, 2) float32 array of the cached path, None on a miss """
+        path = self.entries.get(key)
+        if path is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return path
+
+    def put(self, key, path):
+        """ path: (num_points, 2), empty for a failed plan """
+        self.entries[key] = np.asarray(path, dtype=np.float32).reshape(-1, 2)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def record_planning_time(self, seconds, num_plans):
+        self.planning_time += seconds
+        self.num_planned += num_plans
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        mean_planning_time = self.planning_time / max(self.num_planned, 1)
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "lookups": lookups,
+            "hit_rate": self.hits / max(lookups, 1),
+            "planning_time": self.planning_time,
+            "saved_time": self.hits * mean_planning_time,
+        }
+
+    def save(self, path=None):
+        path = path if path is not None else self.path
+        keys = [np.asarray(key, dtype=np.int32) for key in self.entries.keys()]
+        paths = list(self.entries.values())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f,
+                resolution=np.float64(self.resolution),
+                key_data=np.concatenate(keys) if keys else np.zeros(0, dtype=np.int32),
+                key_offsets=np.cumsum([0] + [len(key) for key in keys], dtype=np.int64),
+                path_data=np.concatenate(paths) if paths else np.zeros((0, 2), dtype=np.float32),
+                path_offsets=np.cumsum([0] + [len(p) for p in paths], dtype=np.int64))
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path if path is not None else self.path
+        with np.load(path) as data:
+            if float(data["resolution"]) != self.resolution:
+                print(f"Plan cache {path} was built with resolution {float(data['resolution'])}, ignored")
+                return
+            key_data, key_offsets = data["key_data"], data["key_offsets"]
+            path_data, path_offsets = data["path_data"], data["path_offsets"]
+        for i in range(len(key_offsets) - 1):
+            key = tuple(key_data[key_offsets[i]:key_offsets[i + 1]].tolist())
+            self.put(key, path_data[path_offsets[i]:path_offsets[i + 1]])
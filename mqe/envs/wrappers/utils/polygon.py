@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+import torch
+
+from mqe import LEGGED_GYM_ROOT_DIR
+
+class PolygonGeometry:
+    """ Edge geometry of a pushed object, precomputed once from cfg.asset.vertex_list.
+
+    The vertices are given in the object body frame and in order around the polygon, edge i goes
+    from vertex i to vertex i + 1 (the last edge closes the polygon).
+    Queries take a batch of body frame points (N, 2) and broadcast against the cached (num_edges, 2)
+    tensors, no per-call tensor construction and no materialized repeats.
+    """
+    def __init__(self, vertex_list, device="cpu"):
+        self.device = device
+        self.vertices = torch.tensor(vertex_list, dtype=torch.float, device=device)
+        self.num_edges = self.vertices.shape[0]
+
+        self.next_vertices = torch.roll(self.vertices, -1, dims=0)
+        self.edges = self.next_vertices - self.vertices
+        self.edge_lengths = torch.norm(self.edges, dim=1)
+        self.edge_unit = self.edges / self.edge_lengths.unsqueeze(1)
+        self.edge_normals = torch.stack([-self.edge_unit[:, 1], self.edge_unit[:, 0]], dim=1)
+
+    def nearest_edge(self, points):
+        """
+        Args:
+            points: (N, 2) points in the body frame
+        Returns:
+            dist: (N,) distance to the closest edge
+            index: (N,) index of the closest edge
+        """
+        vp = points[:, None, :] - self.vertices
+        vp_next = points[:, None, :] - self.next_vertices
+
+        # distance to the supporting line, only valid if the projection falls on the segment
+        cross_prod = torch.abs(vp[..., 0] * self.edge_unit[:, 1] - vp[..., 1] * self.edge_unit[:, 0])
+        on_segment = ((vp * self.edges).sum(dim=2) >= 0) & ((vp_next * self.edges).sum(dim=2) <= 0)
+        dist_to_line = torch.where(on_segment, cross_prod, torch.full_like(cross_prod, float("inf")))
+
+        dist_to_vertex1 = torch.norm(vp, dim=2)
+        dist_to_vertex2 = torch.norm(vp_next, dim=2)
+        dist_each_edge = torch.minimum(torch.minimum(dist_to_line, dist_to_vertex1), dist_to_vertex2)
+        return torch.min(dist_each_edge, dim=1)
+
+    def nearest_normal(self, points):
+        """ Normal of the edge closest to each point (N, 2) -> (N, 2), body frame """
+        _, index = self.nearest_edge(points)
+        return self.edge_normals[index]
+
+    def contains(self, points):
+        """ Even-odd test, (N, 2) -> (N,) bool """
+        py = points[:, None, 1]
+        crosses_y = (self.vertices[:, 1] > py) != (self.next_vertices[:, 1] > py)
+        dy = torch.where(self.edges[:, 1] == 0, torch.ones_like(self.edges[:, 1]), self.edges[:, 1])
+        x_cross = self.vertices[:, 0] + (py - self.vertices[:, 1]) * self.edges[:, 0] / dy
+        crossings = (crosses_y & (points[:, None, 0] < x_cross)).sum(dim=1)
+        return crossings % 2 == 1
+
+    def signed_distance(self, points):
+        """ Distance to the boundary, negative inside the polygon, (N, 2) -> (N,) """
+        dist, _ = self.nearest_edge(points)
+        return torch.where(self.contains(points), -dist, dist)
+
+
+class PolygonSDF:
+    """ Signed distance and nearest edge normal of a PolygonGeometry tabulated on a body frame grid.
+
+    The grid covers the bounding box of the polygon plus margin and is answered with a bilinear
+    lookup (one gather per cell corner) instead of the (N, num_edges) exact computation. The tables
+    only depend on the vertex list, the resolution and the margin, they are cached on disk under
+    cache_dir keyed by a hash of these. Points outside the grid are clamped to its border, their
+    distance is corrected by the distance to the border point.
+    """
+    def __init__(self, vertex_list, resolution=0.01, margin=2.0, cache_dir=None, device="cpu"):
+        self.device = device
+        self.resolution = resolution
+        self.margin = margin
+        self.cache_dir = cache_dir if cache_dir is not None else os.path.join(LEGGED_GYM_ROOT_DIR, "resources", "sdf_cache")
+
+        key = json.dumps({"vertex_list": [[float(x), float(y)] for x, y in vertex_list], "resolution": resolution, "margin": margin})
+        self.key = hashlib.sha1(key.encode()).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, self.key + ".pt")
+        if os.path.exists(cache_path):
+            table = torch.load(cache_path, map_location="cpu")
+        else:
+            table = self._build_table(vertex_list)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch.save(table, cache_path)
+
+        self.origin = table["origin"].to(device)
+        self.grid_shape = tuple(table["shape"])
+        # (H * W, 3): signed distance, normal_x, normal_y
+        self.table = table["table"].to(device)
+        self._upper = torch.tensor([self.grid_shape[1] - 1, self.grid_shape[0] - 1], dtype=torch.float, device=device)
+
+    def _build_table(self, vertex_list, chunk_size=65536):
+        polygon = PolygonGeometry(vertex_list, device=self.device)
+        lower = polygon.vertices.min(dim=0)[0] - self.margin
+        upper = polygon.vertices.max(dim=0)[0] + self.margin
+        num_x = int(torch.ceil((upper[0] - lower[0]) / self.resolution).item()) + 1
+        num_y = int(torch.ceil((upper[1] - lower[1]) / self.resolution).item()) + 1
+        xs = lower[0] + torch.arange(num_x, device=self.device) * self.resolution
+        ys = lower[1] + torch.arange(num_y, device=self.device) * self.resolution
+        grid_y, grid_x = torch.meshgrid(ys, xs, indexing="ij")
+        points = torch.stack([grid_x.reshape(-1), grid_y.reshape(-1)], dim=1)
+
+        table = torch.empty(points.shape[0], 3, dtype=torch.float, device=self.device)
+        for start in range(0, points.shape[0], chunk_size):
+            chunk = points[start:start + chunk_size]
+            table[start:start + chunk_size, 0] = polygon.signed_distance(chunk)
+            table[start:start + chunk_size, 1:] = polygon.nearest_normal(chunk)
+        return {"origin": lower.cpu(), "shape": (num_y, num_x), "table": table.cpu()}
+
+    def lookup(self, points):
+        """ Bilinear lookup (N, 2) -> (N, 3) of [signed distance, normal_x, normal_y] """
+        uv = (points - self.origin) / self.resolution
+        uv_clamped = torch.minimum(torch.clamp(uv, min=0.), self._upper)
+        cell = torch.minimum(uv_clamped.floor(), self._upper - 1)
+        frac = uv_clamped - cell
+        cell = cell.long()
+        width = self.grid_shape[1]
+        index = cell[:, 1] * width + cell[:, 0]
+
+        fx = frac[:, 0:1]
+        fy = frac[:, 1:2]
+        values = (self.table[index] * (1 - fx) + self.table[index + 1] * fx) * (1 - fy) \
+               + (self.table[index + width] * (1 - fx) + self.table[index + width + 1] * fx) * fy
+
+        # outside the grid, add the distance to the clamped point (always outside the polygon)
+        values[:, 0] += torch.norm(uv - uv_clamped, dim=1) * self.resolution
+        return values
+
+    def signed_distance(self, points):
+        """ (N, 2) -> (N,) """
+        return self.lookup(points)[:, 0]
+
+    def nearest_normal(self, points):
+        """ Interpolated nearest edge normal (N, 2) -> (N, 2), renormalized """
+        normals = self.lookup(points)[:, 1:]
+        return normals / torch.clamp(torch.norm(normals, dim=1, keepdim=True), min=1e-6)
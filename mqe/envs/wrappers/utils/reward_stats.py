@@ -0,0 +1,86 @@
+import torch
+
+class RewardStatistics:
+    """ Device-resident accumulator for the reward components logged by the wrappers.
+
+    add() and record_step() only launch device ops, nothing is copied to the host until pop() /
+    pop_episode_stats() are called by mqe_openrl_wrapper.batch_rewards() (openrl_ws and script) once per log interval.
+    Besides the per-term sums it keeps the return of every env's running episode and, for the
+    episodes finished since the last pop, count / sum / min / max and a fixed-bin histogram.
+    """
+    def __init__(self, names, num_envs, device="cpu", hist_range=(-50., 50.), hist_bins=20):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.num_envs = num_envs
+        self.device = device
+
+        self.sums = torch.zeros(len(self.names), dtype=torch.float, device=device)
+        self.step_count = 0
+
+        # per-env episode returns
+        self.episode_returns = torch.zeros(num_envs, dtype=torch.float, device=device)
+        self.hist_edges = torch.linspace(hist_range[0], hist_range[1], hist_bins + 1, device=device)
+        # first and last bins collect the returns outside hist_range
+        self.hist_counts = torch.zeros(hist_bins + 2, dtype=torch.float, device=device)
+        self.episode_count = torch.zeros((), dtype=torch.float, device=device)
+        self.episode_return_sum = torch.zeros((), dtype=torch.float, device=device)
+        self.episode_return_min = torch.full((), float("inf"), dtype=torch.float, device=device)
+        self.episode_return_max = torch.full((), -float("inf"), dtype=torch.float, device=device)
+
+    def add(self, name, value):
+        """ Accumulate a (0-dim tensor or number) reward component, no host sync """
+        self.sums[self.index[name]] += value
+
+    def record_step(self, reward, dones):
+        """ Accumulate per-env returns and close the episodes of the envs that are done
+
+        Args:
+            reward: (num_envs, num_agents) step reward, agents are averaged
+            dones: (num_envs,) bool
+        """
+        self.step_count += 1
+        self.episode_returns += reward.reshape(self.num_envs, -1).mean(dim=1)
+        if not torch.is_tensor(dones):
+            return
+        done = dones.reshape(self.num_envs).float()
+        # masked updates instead of boolean indexing keep everything on the device
+        bins = torch.bucketize(self.episode_returns, self.hist_edges)
+        self.hist_counts.index_add_(0, bins, done)
+        self.episode_count += done.sum()
+        self.episode_return_sum += (self.episode_returns * done).sum()
+        self.episode_return_min = torch.minimum(self.episode_return_min,
+                                                torch.where(done > 0, self.episode_returns, torch.full_like(self.episode_returns, float("inf"))).min())
+        self.episode_return_max = torch.maximum(self.episode_return_max,
+                                                torch.where(done > 0, self.episode_returns, torch.full_like(self.episode_returns, -float("inf"))).max())
+        self.episode_returns *= 1. - done
+
+    def pop(self):
+        """ Return ({name: sum}, step_count) since the last pop and reset the sums, one host sync """
+        sums = self.sums.cpu().tolist()
+        step_count = self.step_count
+        self.sums.zero_()
+        self.step_count = 0
+        return dict(zip(self.names, sums)), step_count
+
+    def episode_return_histogram(self):
+        """ (edges, counts) of the finished episode returns, counts[0] / counts[-1] are under / overflow """
+        return self.hist_edges.cpu(), self.hist_counts.cpu()
+
+    def pop_episode_stats(self):
+        """ Summary of the episodes finished since the last call, one host sync """
+        count, return_sum, return_min, return_max = torch.stack([self.episode_count, self.episode_return_sum,
+                                                                 self.episode_return_min, self.episode_return_max]).cpu().tolist()
+        stats = {}
+        if count > 0:
+            stats = {
+                "episode_return_mean": return_sum / count,
+                "episode_return_min": return_min,
+                "episode_return_max": return_max,
+                "episode_count": count,
+            }
+        self.hist_counts.zero_()
+        self.episode_count.zero_()
+        self.episode_return_sum.zero_()
+        self.episode_return_min.fill_(float("inf"))
+        self.episode_return_max.fill_(-float("inf"))
+        return stats
@@ -1,60 +1,162 @@
+import math
 import torch
 from time import perf_counter
 
-import treelib
+from mqe.envs.obstacle_field import ObstacleDistanceField
+
+class GridIndex:
+    """ Uniform grid over the workspace for incremental nearest neighbour / radius queries on 2D points.
+
+    Points outside the workspace are kept in the closest border cell, which keeps the ring search exact:
+    a cell k rings away from the query cell only holds points at least (k - 1) * cell_size away.
+    With refine_at set, the cell size is halved (and the points re-binned) whenever the grid holds more
+    than refine_at points per cell on average, so queries stay O(1) while the tree grows (amortized).
+    """
+    def __init__(self, x_lim, y_lim, cell_size, refine_at=None):
+        self.x_lim = x_lim
+        self.y_lim = y_lim
+        self.refine_at = refine_at
+        self.xs = []
+        self.ys = []
+        self._build(cell_size)
+
+    def __len__(self):
+        return len(self.xs)
+
+    def _build(self, cell_size):
+        self.cell_size = cell_size
+        self.num_x = max(int(math.ceil((self.x_lim[1] - self.x_lim[0]) / cell_size)), 1)
+        self.num_y = max(int(math.ceil((self.y_lim[1] - self.y_lim[0]) / cell_size)), 1)
+        self.cells = [[] for _ in range(self.num_x * self.num_y)]
+        for idx, (x, y) in enumerate(zip(self.xs, self.ys)):
+            i, j = self.cell(x, y)
+            self.cells[j * self.num_x + i].append(idx)
+
+    def cell(self, x, y):
+        i = min(max(int((x - self.x_lim[0]) // self.cell_size), 0), self.num_x - 1)
+        j = min(max(int((y - self.y_lim[0]) // self.cell_size), 0), self.num_y - 1)
+        return i, j
+
+    def insert(self, x, y):
+        """ Add a point, returns its index """
+        idx = len(self.xs)
+        self.xs.append(x)
+        self.ys.append(y)
+        i, j = self.cell(x, y)
+        self.cells[j * self.num_x + i].append(idx)
+        if self.refine_at is not None and len(self.xs) > self.refine_at * len(self.cells):
+            self._build(self.cell_size / 2)
+        return idx
+
+    def _ring(self, ci, cj, r):
+        """ Indices of the points in the cells at Chebyshev distance r from (ci, cj) """
+        for j in range(max(cj - r, 0), min(cj + r, self.num_y - 1) + 1):
+            if abs(j - cj) == r:
+                columns = range(max(ci - r, 0), min(ci + r, self.num_x - 1) + 1)
+            else:
+                columns = [i for i in (ci - r, ci + r) if 0 <= i < self.num_x]
+            for i in columns:
+                yield from self.cells[j * self.num_x + i]
+
+    def nearest(self, x, y):
+        """ Index of the closest point (-1 if empty) and the squared distance to it """
+        ci, cj = self.cell(x, y)
+        best, best_d2 = -1, float("inf")
+        for r in range(max(self.num_x, self.num_y)):
+            for idx in self._ring(ci, cj, r):
+                d2 = (self.xs[idx] - x)**2 + (self.ys[idx] - y)**2
+                if d2 < best_d2:
+                    best, best_d2 = idx, d2
+            # the next rings are at least r cells away
+            if best >= 0 and best_d2 <= (r * self.cell_size)**2:
+                break
+        return best, best_d2
+
+    def any_within(self, x, y, radius):
+        """ True if a point is closer than radius """
+        ci, cj = self.cell(x, y)
+        rings = int(math.ceil(radius / self.cell_size)) + 1
+        for r in range(rings + 1):
+            for idx in self._ring(ci, cj, r):
+                if (self.xs[idx] - x)**2 + (self.ys[idx] - y)**2 < radius**2:
+                    return True
+        return False
 
 class KinodynamicRRT:
-    def __init__(self,x_lim, y_lim):
+    """ Single env RRT backed by a GridIndex over the workspace and a flat parent array.
+
+    Nearest neighbour and collision queries only visit the grid cells around the query, so an iteration
+    costs about O(1) for the uniformly spread trees of this task instead of O(n).
+    """
+    def __init__(self, x_lim, y_lim, cell_size=None):
         self.x_lim = x_lim
         self.y_lim = y_lim
-        pass
-    
-    def nearest_neighbor(self, states, x_rand):
-        if not torch.is_tensor(states):
-            states = torch.stack(states)
-        d = torch.norm(states - x_rand, dim=1)
-        x_near_idx = d.argmin()
-        return states[x_near_idx], x_near_idx.item()
-    
+        self.cell_size = cell_size
+
+    def nearest_neighbor(self, x, y):
+        idx, _ = self.index.nearest(x, y)
+        return idx
+
+    def _random_numbers(self, chunk_size=4096):
+        # drawn from torch in chunks, so torch.manual_seed still controls the planner
+        while True:
+            yield from torch.rand(chunk_size).tolist()
+
     def plan(self, start, goal, obstacle_states, action_scale=0.3, goal_sample_prob=0.2, REACH_THERESHOLD=0.1, COLLISION_THERESHOLD=0.1, 
-              visualizer = None, timeout: float = 1.0):
-        states = [start]
-        tree = treelib.Tree()
-        tree.create_node(identifier=0)
+              recorder=None, timeout: float = 1.0, max_nodes=None):
+        """ Returns the list of (2,) states from start to goal, None if no path was found before timeout / max_nodes.
+        Without goal the tree just grows until timeout / max_nodes. The tree is recorded if a TreeRecorder is given.
+        """
+        device = start.device
+        x_min, x_max = self.x_lim
+        y_min, y_max = self.y_lim
+        goal_xy = goal[:2].tolist() if goal is not None else None
+        collision_radius = COLLISION_THERESHOLD + 0.8
+
+        self.index = GridIndex(self.x_lim, self.y_lim, self.cell_size if self.cell_size is not None else action_scale, refine_at=2)
+        self.parents = [-1]
+        self.index.insert(*start[:2].tolist())
+        obstacles = GridIndex(self.x_lim, self.y_lim, collision_radius)
+        for x, y in obstacle_states[:, :2].tolist():
+            obstacles.insert(x, y)
+        rand = self._random_numbers()
+        if recorder is not None:
+            recorder.begin(start, goal, obstacle_states, self.x_lim, self.y_lim)
 
         dt = 0
         t0 = perf_counter()
-        while dt < timeout:
+        while dt < timeout and (max_nodes is None or len(self.index) < max_nodes):
             # sample a state to extend towards, sometimes the goal if given
-            if goal is not None and torch.rand(1) < goal_sample_prob:
-                x_target = goal
+            if goal is not None and next(rand) < goal_sample_prob:
+                x_target, y_target = goal_xy
             else:
-                x_target = torch.tensor([ torch.rand(1)*(self.x_lim[1] - self.x_lim[0]) + self.x_lim[0], 
-                                          torch.rand(1)*(self.y_lim[1] - self.y_lim[0]) + self.y_lim[0],], device="cuda") 
+                x_target = next(rand) * (x_max - x_min) + x_min
+                y_target = next(rand) * (y_max - y_min) + y_min
 
             # nearest state in the tree
-            x_near, x_near_idx = self.nearest_neighbor(states, x_target)
+            x_near_idx = self.nearest_neighbor(x_target, y_target)
+            x_near, y_near = self.index.xs[x_near_idx], self.index.ys[x_near_idx]
 
-            best_action = (x_target - x_near)/(torch.norm(x_target - x_near)+0.01) * action_scale
-            x_next = x_near + best_action
+            scale = action_scale / (math.hypot(x_target - x_near, y_target - y_near) + 0.01)
+            x_next = x_near + (x_target - x_near) * scale
+            y_next = y_near + (y_target - y_near) * scale
 
-            if torch.norm(obstacle_states - x_next, dim=1).min() > COLLISION_THERESHOLD + 0.8:
-            # if self.satisfies_constraints is None or self.satisfies_constraints(x_near, x_next):
-                if visualizer is not None:
-                    visualizer.draw_connect(x_near, x_next)
+            if not obstacles.any_within(x_next, y_next, collision_radius):
+                if recorder is not None:
+                    recorder.add_edge(x_near, y_near, x_next, y_next)
 
                 # add to the tree
-                new_idx = len(states)
-                tree.create_node(identifier=new_idx, parent=x_near_idx)
-                states.append(x_next)
+                new_idx = self.index.insert(x_next, y_next)
+                self.parents.append(x_near_idx)
 
-                if torch.norm(x_next - goal) < REACH_THERESHOLD:
+                if goal is not None and math.hypot(x_next - goal_xy[0], y_next - goal_xy[1]) < REACH_THERESHOLD:
                     dt = perf_counter() - t0
-                    trajectory = self.walk_up_tree(states, tree, x_near_idx)
-                    trajectory.append(x_next)
+                    trajectory = [torch.tensor(state, dtype=goal.dtype, device=device) for state in self.walk_up_tree(new_idx)]
 
-                    if not torch.allclose(trajectory[-1], goal):
-                        trajectory.append(goal)
+                    if not torch.allclose(trajectory[-1], goal[:2]):
+                        trajectory.append(goal[:2])
+                    if recorder is not None:
+                        recorder.end(trajectory)
 
                     print("--------------------------------------")
                     print("             REACH GOAL!              ")
@@ -62,69 +164,132 @@ class KinodynamicRRT:
                     return trajectory
             dt = perf_counter() - t0
 
+        if recorder is not None:
+            recorder.end(None)
         print("--------------------------------------")
         print("           NOT FIND PATH              ")
         print("--------------------------------------")
         return
 
-    def walk_up_tree(self, all_states, tree, idx):
+    def walk_up_tree(self, idx):
+        """ [x, y] states from the root to idx """
         traj_states = []
-        while True:
-            x = all_states[idx]
-            traj_states.append(x)
-
+        while idx >= 0:
+            traj_states.append([self.index.xs[idx], self.index.ys[idx]])
             # go up the tree
-            parent = tree.parent(idx)
-            if parent is None:
-                break
-            else:
-                idx = parent.identifier
+            idx = self.parents[idx]
 
         traj_states.reverse()
         return traj_states
-    
-    
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-
-class TwoDVisualizer:
-    def __init__(self):
-        plt.ion()
-        fig, ax = plt.subplots()
-        self.fig = fig
-        self.ax = ax
-        self.ax.set_aspect('equal')
-
-    def draw_state(self, x, color='k', s=4, alpha=0.2):
-        x = x.cpu().numpy()
-        self.ax.scatter(x[0], x[1], color=color, s=s, alpha=alpha)
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-
-    def draw_connect(self, x_start, x_next):
-        self.draw_state(x_next)
-        self.ax.plot([x_start[0].cpu().numpy(), x_next[0].cpu().numpy()],
-                     [x_start[1].cpu().numpy(), x_next[1].cpu().numpy()], color='gray', linewidth=1, alpha=0.2)
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-
-    def draw_obstacle(self, obs_state, s=4, alpha=0.2):
-        obs_state = obs_state.cpu().numpy()
-        for i in range(obs_state.shape[0]):
-            square = patches.Rectangle((obs_state[i,0]-0.5, obs_state[i,1]-0.5), 1, 1, linewidth=1, edgecolor='black', facecolor='black')
-            self.ax.add_patch(square)
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-
-    def set_bounds(self, x_lim, y_lim):
-        x_min, x_max = x_lim
-        y_min, y_max = y_lim
-        self.ax.set_xlim(x_min, x_max)
-        self.ax.set_ylim(y_min, y_max)
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
-    
-    def clear(self):
-        self.ax.cla()
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
\ No newline at end of file
+
+class BatchedRRT:
+    """ RRT grown for all envs at once (same extension rule as KinodynamicRRT.plan).
+
+    Every env owns a tree in preallocated (num_envs, max_nodes, 2) node and (num_envs, max_nodes) parent
+    index tensors (root parent is -1). Each iteration samples one target per env, finds the nearest node
+    and checks the obstacles for all envs with batched ops. Envs stop growing independently once their
+    tree reaches the goal or is full.
+    """
+    def __init__(self, x_lim, y_lim, max_nodes=4096, device="cpu"):
+        self.x_lim = x_lim
+        self.y_lim = y_lim
+        self.max_nodes = max_nodes
+        self.device = device
+        self.low = torch.tensor([x_lim[0], y_lim[0]], dtype=torch.float, device=device)
+        self.span = torch.tensor([x_lim[1] - x_lim[0], y_lim[1] - y_lim[0]], dtype=torch.float, device=device)
+
+    def plan(self, start, goal, obstacle_states, action_scale=0.3, goal_sample_prob=0.2, REACH_THERESHOLD=0.1, COLLISION_THERESHOLD=0.1,
+             timeout: float = 1.0, recorder=None, field_resolution=0.2):
+        """
+        Args:
+            start, goal: (num_envs, 2)
+            obstacle_states: (num_envs, num_obstacles, 2)
+            recorder: optional TreeRecorder, the trees are copied to it once planning is done
+            field_resolution: cell size of the obstacle distance field used for the collision checks
+        Returns:
+            paths: (num_envs, max_length, 2) start to goal, padded after lengths[i] points
+            lengths: (num_envs,) number of points of each path, 0 if no path was found
+            success: (num_envs,) bool
+        """
+        num_envs = start.shape[0]
+        env_ids = torch.arange(num_envs, device=self.device)
+        start = start[:, :2].float().to(self.device)
+        goal = goal[:, :2].float().to(self.device)
+        obstacle_states = obstacle_states[..., :2].float().to(self.device)
+
+        nodes = torch.zeros(num_envs, self.max_nodes, 2, dtype=torch.float, device=self.device)
+        parents = torch.full((num_envs, self.max_nodes), -1, dtype=torch.long, device=self.device)
+        nodes[:, 0] = start
+        count = torch.ones(num_envs, dtype=torch.long, device=self.device)
+        goal_idx = torch.full((num_envs,), -1, dtype=torch.long, device=self.device)
+        active = torch.ones(num_envs, dtype=torch.bool, device=self.device)
+        node_ids = torch.arange(self.max_nodes, device=self.device)
+        # collision checks are O(1) lookups, whatever the number of obstacles
+        field = ObstacleDistanceField(num_envs, obstacle_states.shape[1], self.x_lim, self.y_lim, resolution=field_resolution,
+                                      margin=action_scale + 1.0, device=self.device)
+        field.rebuild(obstacle_states)
+
+        t0 = perf_counter()
+        iteration = 0
+        while perf_counter() - t0 < timeout and bool(active.any()):
+            # sample a state to extend towards, sometimes the goal
+            x_rand = torch.rand(num_envs, 2, device=self.device) * self.span + self.low
+            use_goal = torch.rand(num_envs, 1, device=self.device) < goal_sample_prob
+            x_target = torch.where(use_goal, goal, x_rand)
+
+            # nearest state in the tree, a tree has at most iteration + 1 nodes
+            num_used = min(iteration + 1, self.max_nodes)
+            d = torch.norm(nodes[:, :num_used] - x_target.unsqueeze(1), dim=2)
+            d = torch.where(node_ids[:num_used].unsqueeze(0) < count.unsqueeze(1), d, torch.full_like(d, float("inf")))
+            x_near_idx = d.argmin(dim=1)
+            x_near = nodes[env_ids, x_near_idx]
+
+            best_action = (x_target - x_near) / (torch.norm(x_target - x_near, dim=1, keepdim=True) + 0.01) * action_scale
+            x_next = x_near + best_action
+
+            add = active
+            if obstacle_states.shape[1] > 0:
+                add = add & (field.distance(x_next, env_ids) > COLLISION_THERESHOLD + 0.8)
+
+            # add to the trees
+            slot = count.clamp(max=self.max_nodes - 1)
+            nodes[env_ids, slot] = torch.where(add.unsqueeze(1), x_next, nodes[env_ids, slot])
+            parents[env_ids, slot] = torch.where(add, x_near_idx, parents[env_ids, slot])
+            count += add.long()
+
+            reached = add & (torch.norm(x_next - goal, dim=1) < REACH_THERESHOLD)
+            goal_idx = torch.where(reached, slot, goal_idx)
+            active &= ~reached & (count < self.max_nodes)
+            iteration += 1
+
+        paths, lengths, success = self.walk_up_trees(nodes, parents, goal_idx, goal)
+        if recorder is not None:
+            recorder.record_trees(start, goal, obstacle_states, nodes, parents, count, paths, lengths, self.x_lim, self.y_lim)
+        return paths, lengths, success
+
+    def walk_up_trees(self, nodes, parents, goal_idx, goal):
+        """ Paths from the roots to goal_idx (the goal is appended if the last node is not on it) """
+        num_envs = nodes.shape[0]
+        env_ids = torch.arange(num_envs, device=self.device)
+        success = goal_idx >= 0
+
+        # node ids from the reached node up to the root, -1 once an env passed its root
+        path_ids = [goal_idx]
+        while bool((path_ids[-1] >= 0).any()):
+            idx = path_ids[-1]
+            path_ids.append(torch.where(idx >= 0, parents[env_ids, idx.clamp(min=0)], idx))
+        path_ids = torch.stack(path_ids[:-1], dim=1) if len(path_ids) > 1 else goal_idx.unsqueeze(1)
+        lengths = (path_ids >= 0).sum(dim=1)
+
+        # reverse every path to go from the root to the goal
+        max_length = path_ids.shape[1]
+        position = lengths.unsqueeze(1) - 1 - torch.arange(max_length, device=self.device).unsqueeze(0)
+        node_idx = path_ids.gather(1, position.clamp(min=0)).clamp(min=0)
+        paths = torch.zeros(num_envs, max_length + 1, 2, dtype=torch.float, device=self.device)
+        paths[:, :max_length] = torch.where((position >= 0).unsqueeze(2), nodes[env_ids.unsqueeze(1), node_idx], paths[:, :max_length])
+
+        last = paths[env_ids, (lengths - 1).clamp(min=0)]
+        append_goal = success & ~torch.isclose(last, goal).all(dim=1)
+        paths[env_ids, lengths] = torch.where(append_goal.unsqueeze(1), goal, paths[env_ids, lengths])
+        lengths = lengths + append_goal.long()
+        return paths, lengths, success
@@ -1,54 +1,131 @@
-from scipy.interpolate import CubicSpline
-import numpy as np
 import torch
 
+def interpolate_trajectory(trajectory, target_points=13, lengths=None):
+    """ Resample a batch of waypoint polylines to target_points points, all envs at once.
+
+    Polylines with fewer points than target_points are resampled uniformly in the waypoint index, the
+    others uniformly in arc length (same rule as the per-env np.interp version it replaces).
+    Args:
+        trajectory: (num_envs, 2 * num_points) interleaved x, y, padded after lengths[i] points
+        lengths: (num_envs,) number of valid points, all num_points if None
+    Returns:
+        (num_envs, 2 * target_points) interleaved x, y on the device of trajectory
+    """
+    num_envs, num_points = trajectory.shape[0], trajectory.shape[1] // 2
+    device = trajectory.device
+    points = trajectory.reshape(num_envs, num_points, 2).float()
+    if lengths is None:
+        lengths = torch.full((num_envs,), num_points, dtype=torch.long, device=device)
+    lengths = lengths.to(device=device, dtype=torch.long)
+    point_ids = torch.arange(num_points, device=device)
+    valid = point_ids.unsqueeze(0) < lengths.unsqueeze(1)
+
+    # curve parameter of every waypoint, index or cumulative arc length
+    segment = torch.norm(points[:, 1:] - points[:, :-1], dim=2)
+    segment = torch.where(valid[:, 1:], segment, torch.zeros_like(segment))
+    arc_length = torch.cat([torch.zeros(num_envs, 1, device=device), torch.cumsum(segment, dim=1)], dim=1)
+    by_index = (lengths < target_points).unsqueeze(1)
+    param = torch.where(by_index, point_ids.float().unsqueeze(0), arc_length)
+    # padding after the last valid point keeps param sorted and is never selected
+    param = torch.where(valid, param, torch.full_like(param, float("inf")))
+    param_end = param.gather(1, (lengths - 1).clamp(min=0).unsqueeze(1))
+    query = torch.linspace(0, 1, target_points, device=device).unsqueeze(0) * param_end
+
+    # piecewise linear interpolation between waypoints i0 and i1
+    i1 = torch.searchsorted(param, query.contiguous(), right=True)
+    i1 = torch.minimum(i1.clamp(min=1), (lengths - 1).clamp(min=0).unsqueeze(1))
+    i0 = (i1 - 1).clamp(min=0)
+    param0 = param.gather(1, i0)
+    span = param.gather(1, i1) - param0
+    weight = torch.where(span > 0, (query - param0) / torch.where(span > 0, span, torch.ones_like(span)), torch.zeros_like(span))
+    weight = weight.clamp(0, 1).unsqueeze(2)
+    p0 = points.gather(1, i0.unsqueeze(2).expand(-1, -1, 2))
+    p1 = points.gather(1, i1.unsqueeze(2).expand(-1, -1, 2))
+    return (p0 + weight * (p1 - p0)).reshape(num_envs, target_points * 2)
+
+def natural_cubic_spline(t, y, t_new):
+    """ Natural cubic spline through (t, y) evaluated at t_new, for a batch of curves sharing the knots.
+
+    The second derivatives at the interior knots are the solution of a tridiagonal system, solved for the
+    whole batch at once (Thomas algorithm, the loop only runs over the knots).
+    Args:
+        t: (n,) increasing knots
+        y: (batch, n, dim) values at the knots
+        t_new: (m,) evaluation points
+    Returns:
+        (batch, m, dim)
+    """
+    n = t.shape[0]
+    h = t[1:] - t[:-1]
+    second_derivative = torch.zeros_like(y)
+    if n > 2:
+        slope = (y[:, 1:] - y[:, :-1]) / h[None, :, None]
+        rhs = 6 * (slope[:, 1:] - slope[:, :-1])
+        diag = 2 * (h[:-1] + h[1:])
+        off_diag = h[1:-1]
+        # forward sweep, the matrix only depends on the knots
+        c = [diag[0]]
+        d = [rhs[:, 0]]
+        for i in range(1, n - 2):
+            w = off_diag[i - 1] / c[i - 1]
+            c.append(diag[i] - w * off_diag[i - 1])
+            d.append(rhs[:, i] - w * d[i - 1])
+        # back substitution
+        m = [d[-1] / c[-1]]
+        for i in range(n - 4, -1, -1):
+            m.insert(0, (d[i] - off_diag[i] * m[0]) / c[i])
+        second_derivative[:, 1:-1] = torch.stack(m, dim=1)
+
+    k = (torch.searchsorted(t, t_new, right=True) - 1).clamp(0, n - 2)
+    hk = h[k][None, :, None]
+    a = (t[k + 1] - t_new)[None, :, None]
+    b = (t_new - t[k])[None, :, None]
+    m0, m1 = second_derivative[:, k], second_derivative[:, k + 1]
+    y0, y1 = y[:, k], y[:, k + 1]
+    return m0 * a**3 / (6 * hk) + m1 * b**3 / (6 * hk) + (y0 / hk - m0 * hk / 6) * a + (y1 / hk - m1 * hk / 6) * b
+
 class TrajectoryPlanner:
-    def __init__(self, num_envs, start_pos, end_target, device='cuda'):
+    def __init__(self, num_envs, start_pos, end_target, device='cpu'):
         self.end_target = end_target
         self.start_pos = start_pos
         self.trajectory_length = 13
         self.fixed_height = 0.15
         self.num_envs = num_envs
         self.device = device
-        self.trajectory = torch.zeros((self.num_envs, self.trajectory_length, 2), device=self.device)
-        
-        for env_id in range(num_envs):
-            start = self.start_pos[env_id].cpu().numpy()
-            end = self.end_target[env_id].cpu().numpy()
-            self.trajectory[env_id, :, :] = self.generate_trajectory(start, end)
+
+        # spline knots and evaluation points
+        self.t_knots = torch.tensor([0, 0.25, 0.5, 0.75, 1], dtype=torch.float, device=self.device)
+        self.t_new = torch.linspace(0, 1, self.trajectory_length, device=self.device)
+
+        self.trajectory = self.generate_trajectory(self.start_pos, self.end_target)
         
         self.next_planning_position = self.trajectory[:, 1]
         self.next_planning_position_idx = torch.ones(num_envs, dtype=torch.int64, device=self.device)
+        self.env_ids = torch.arange(num_envs, device=self.device)
     
-    def generate_trajectory(self, start, end):
+    def sample_control_points(self, start, end):
+        """ start, end: (batch, >=2) -> (batch, 5, 2) knots of the spline """
+        start = start[:, :2].float()
+        end = end[:, :2].float()
         # Generate midpoints with random adjustments
-        mid_point = (start[:2] + end[:2]) / 2 + np.random.uniform(-0.5, 0.5, size=2)
-        quarter_point_1 = (start[:2] + mid_point) / 2 + np.random.uniform(-0.5, 0.5, size=2)
-        quarter_point_2 = (mid_point + end[:2]) / 2 + np.random.uniform(-0.5, 0.5, size=2)
+        mid_point = (start + end) / 2 + torch.rand_like(start) - 0.5
+        quarter_point_1 = (start + mid_point) / 2 + torch.rand_like(start) - 0.5
+        quarter_point_2 = (mid_point + end) / 2 + torch.rand_like(start) - 0.5
+        return torch.stack([start, quarter_point_1, mid_point, quarter_point_2, end], dim=1)
 
-        # Cubic spline interpolation on x and y coordinates
-        t = np.array([0, 0.25, 0.5, 0.75, 1])
-        points_x = np.array([start[0], quarter_point_1[0], mid_point[0], quarter_point_2[0], end[0]])
-        points_y = np.array([start[1], quarter_point_1[1], mid_point[1], quarter_point_2[1], end[1]])
-        cs_x = CubicSpline(t, points_x, bc_type='natural')
-        cs_y = CubicSpline(t, points_y, bc_type='natural')
-        t_new = np.linspace(0, 1, num=self.trajectory_length)
-        left_x = cs_x(t_new)
-        left_y = cs_y(t_new)
-
-        trajectory = np.vstack((left_x, left_y)).T
-
-        return torch.tensor(trajectory, device=self.device)
+    def generate_trajectory(self, start, end):
+        """ Natural cubic spline through start, random mid / quarter points and end for a batch of envs
+        start, end: (batch, >=2) -> (batch, trajectory_length, 2)
+        """
+        control_points = self.sample_control_points(start.to(self.device), end.to(self.device))
+        return natural_cubic_spline(self.t_knots, control_points, self.t_new)
 
     def reset_trajectory(self, env_ids, end_target):
         self.end_target = end_target
-        for env_id in env_ids:
-            start = self.start_pos[env_id].cpu().numpy()
-            end = self.end_target[env_id].cpu().numpy()
-            # Update the trajectory for each specified environment
-            self.trajectory[env_id, :, :] = self.generate_trajectory(start, end)
-            self.next_planning_position[env_ids] = self.trajectory[env_ids, 1]
-            self.next_planning_position_idx[env_ids] = 1
+        # Update the trajectory of all specified environments at once
+        self.trajectory[env_ids] = self.generate_trajectory(self.start_pos[env_ids], self.end_target[env_ids])
+        self.next_planning_position[env_ids] = self.trajectory[env_ids, 1]
+        self.next_planning_position_idx[env_ids] = 1
 
     def get_trajectory(self, episode_length_buf=None):
         return self.trajectory.reshape(self.num_envs, self.trajectory_length * 2)
@@ -61,6 +138,6 @@ class TrajectoryPlanner:
         condition = (distances < 1.3)
         self.next_planning_position_idx[condition] += 1
         self.next_planning_position_idx = torch.clamp(self.next_planning_position_idx, max=self.trajectory_length - 1)
-        self.next_planning_position = new_trajectory[torch.arange(self.num_envs), self.next_planning_position_idx]
+        self.next_planning_position = new_trajectory[self.env_ids, self.next_planning_position_idx]
 
         return self.next_planning_position
\ No newline at end of file
@@ -0,0 +1,119 @@
+import numpy as np
+import torch
+
+def _to_numpy(x):
+    if x is None:
+        return None
+    if torch.is_tensor(x):
+        x = x.detach().cpu().numpy()
+    return np.asarray(x, dtype=np.float32)
+
+class TreeRecorder:
+    """ Headless recorder of RRT planning trees, replaces drawing every edge live.
+
+    During planning the edges are only appended to a flat list (KinodynamicRRT) or copied once from the
+    tree tensors (BatchedRRT), nothing is drawn. render() / render_animation() draw a recorded plan in one
+    batch afterwards. matplotlib is only imported there, with the Agg canvas, so no display is needed.
+    Every recorded plan is a dict of start, goal, obstacles (num_obstacles, 2), edges (num_edges, 2, 2)
+    in insertion order, path (num_points, 2) or None and the workspace limits.
+    """
+    def __init__(self, max_plans=None):
+        self.max_plans = max_plans
+        self.plans = []
+        self._plan = None
+        self._edges = None
+
+    def __len__(self):
+        return len(self.plans)
+
+    @property
+    def full(self):
+        return self.max_plans is not None and len(self.plans) >= self.max_plans
+
+    def clear(self):
+        self.plans = []
+
+    def begin(self, start, goal, obstacle_states, x_lim, y_lim):
+        """ Start recording a single tree, edges are then added with add_edge() """
+        self._plan = {"start": _to_numpy(start)[:2], "goal": None if goal is None else _to_numpy(goal)[:2],
+                      "obstacles": _to_numpy(obstacle_states)[:, :2], "x_lim": tuple(x_lim), "y_lim": tuple(y_lim)}
+        self._edges = []
+
+    def add_edge(self, x0, y0, x1, y1):
+        self._edges.extend((x0, y0, x1, y1))
+
+    def end(self, path=None):
+        """ path: list of (2,) states or (num_points, 2), None if planning failed """
+        if path is not None and isinstance(path, (list, tuple)):
+            path = torch.stack(path) if len(path) > 0 and torch.is_tensor(path[0]) else path
+        self._plan["edges"] = np.asarray(self._edges, dtype=np.float32).reshape(-1, 2, 2)
+        self._plan["path"] = None if path is None else _to_numpy(path).reshape(-1, 2)
+        if not self.full:
+            self.plans.append(self._plan)
+        self._plan = None
+        self._edges = None
+
+    def record_trees(self, start, goal, obstacle_states, nodes, parents, count, paths, lengths, x_lim, y_lim):
+        """ Record the trees of BatchedRRT.plan, (num_envs, max_nodes, 2) nodes and (num_envs, max_nodes)
+        parents with count nodes used per env, as many envs as max_plans allows
+        """
+        num_envs = nodes.shape[0] if self.max_plans is None else min(nodes.shape[0], self.max_plans - len(self.plans))
+        if num_envs <= 0:
+            return
+        start, goal, obstacle_states, nodes, paths = (_to_numpy(x[:num_envs]) for x in (start, goal, obstacle_states, nodes, paths))
+        parents, count, lengths = (x[:num_envs].cpu().numpy() for x in (parents, count, lengths))
+        for i in range(num_envs):
+            children = nodes[i, 1:count[i]]
+            edges = np.stack([nodes[i, parents[i, 1:count[i]]], children], axis=1)
+            self.plans.append({"start": start[i], "goal": goal[i], "obstacles": obstacle_states[i, :, :2],
+                               "x_lim": tuple(x_lim), "y_lim": tuple(y_lim), "edges": edges,
+                               "path": paths[i, :lengths[i]] if lengths[i] > 0 else None})
+
+    def _draw(self, plan, figsize=(6, 6)):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+        from matplotlib.patches import Rectangle
+
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_aspect('equal')
+        ax.set_xlim(*plan["x_lim"])
+        ax.set_ylim(*plan["y_lim"])
+
+        for x, y in plan["obstacles"]:
+            ax.add_patch(Rectangle((x - 0.5, y - 0.5), 1, 1, linewidth=1, edgecolor='black', facecolor='black'))
+        tree = LineCollection(plan["edges"], colors='gray', linewidths=1, alpha=0.2)
+        ax.add_collection(tree)
+        nodes = ax.scatter(plan["edges"][:, 1, 0], plan["edges"][:, 1, 1], color='k', s=4, alpha=0.2)
+        ax.scatter(*plan["start"], color='k', s=20, alpha=1)
+        if plan["goal"] is not None:
+            ax.scatter(*plan["goal"], color='g', s=20, alpha=1)
+        path = None
+        if plan["path"] is not None:
+            path, = ax.plot(plan["path"][:, 0], plan["path"][:, 1], color='r', linewidth=2)
+        return fig, tree, nodes, path
+
+    def render(self, filename, index=-1, dpi=100):
+        """ Draw recorded plan index to an image file (format from the extension, e.g. .png) """
+        fig, _, _, _ = self._draw(self.plans[index])
+        fig.savefig(filename, dpi=dpi)
+
+    def render_animation(self, filename, index=-1, num_frames=60, fps=15, dpi=80):
+        """ Animate the growth of recorded plan index, .gif is written with pillow, other formats with ffmpeg """
+        from matplotlib.animation import FuncAnimation
+
+        plan = self.plans[index]
+        fig, tree, nodes, path = self._draw(plan)
+        num_edges = np.linspace(0, len(plan["edges"]), num_frames).astype(int)
+
+        def update(frame):
+            tree.set_segments(plan["edges"][:num_edges[frame]])
+            nodes.set_offsets(plan["edges"][:num_edges[frame], 1])
+            if path is not None:
+                path.set_visible(frame == num_frames - 1)
+            return tree, nodes
+
+        animation = FuncAnimation(fig, update, frames=num_frames, blit=False)
+        animation.save(filename, writer="pillow" if filename.endswith(".gif") else "ffmpeg", fps=fps, dpi=dpi)
@@ -53,4 +53,16 @@ def torch_rand_sqrt_float(lower, upper, shape, device):
     r = 2*torch.rand(*shape, device=device) - 1
     r = torch.where(r<0., -torch.sqrt(-r), torch.sqrt(r))
     r =  (r + 1.) / 2.
-    return (upper - lower) * r + lower
\ No newline at end of file
+    return (upper - lower) * r + lower
+
+def sanitize_(*tensors, num_envs):
+    """ Replace nan / inf with 0 in place and flag the envs that had any.
+    Every tensor must have num_envs as leading dim (any trailing shape), one isfinite reduction
+    and one nan_to_num_ per tensor instead of separate isnan / isinf masked writes.
+    Returns: (num_envs,) bool
+    """
+    value_exception_buf = torch.zeros(num_envs, dtype=torch.bool, device=tensors[0].device)
+    for tensor in tensors:
+        value_exception_buf |= ~torch.isfinite(tensor.reshape(num_envs, -1)).all(dim=1)
+        torch.nan_to_num_(tensor, nan=0., posinf=0., neginf=0.)
+    return value_exception_buf
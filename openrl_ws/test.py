@@ -113,7 +113,7 @@ args = get_args()
 args.seed = SEED
 print(f"Using seed: {SEED}")
 env, _ = make_env(args, custom_cfg(args))
-net = PPONet(env, device="cuda")  # Create neural network.
+net = PPONet(env, device=args.rl_device)  # Create neural network.
 agent = PPOAgent(net)  # Initialize the agent.
 
 if args.algo == "jrpo" or args.algo == "ppo":
@@ -56,7 +56,7 @@ class mqe_openrl_wrapper(gym.Wrapper):
 
     def step(self, actions, extra_data: Optional[Dict[str, Any]] = None, **kwargs):
         """Step all environments."""
-        actions = torch.from_numpy(0.5 * actions).cuda().clip(-1, 1)
+        actions = torch.from_numpy(0.5 * actions).to(self.env.device).clip(-1, 1)
         
         # target_pos = kwargs.get("target_pos", None)
         # if target_pos is not None:
@@ -84,19 +84,18 @@ class mqe_openrl_wrapper(gym.Wrapper):
         return False
 
     def batch_rewards(self, buffer):
-
-        step_count = self.env.reward_buffer["step_count"]
+        # the only place where the device-side reward statistics are synced to the host
+        reward_sums, step_count = self.env.reward_stats.pop()
         reward_dict = {"average_step_reward": 0}
-        for k in self.env.reward_buffer.keys():
-            if k == "step_count":
-                continue
-            reward_dict[k] = self.env.reward_buffer[k] / (self.num_envs * step_count)
+        for k in reward_sums.keys():
+            reward_dict[k] = reward_sums[k] / (self.num_envs * max(step_count, 1))
             if hasattr(self.env, "single_agent_reward_scale"):
                 reward_dict[k] *= self.env.single_agent_reward_scale
             if "reward" in k or "punishment" in k:
                 reward_dict["average_step_reward"] += reward_dict[k]
-            self.env.reward_buffer[k] = 0
-        self.env.reward_buffer["step_count"] = 0
+        reward_dict.update(self.env.reward_stats.pop_episode_stats())
+        if getattr(self.env, "async_planner", None) is not None:
+            reward_dict.update({"planner/" + k: v for k, v in self.env.async_planner.stats().items()})
         return reward_dict
 
 class MATWrapper(gym.Wrapper):
@@ -54,7 +54,7 @@ class mqe_openrl_wrapper(gym.Wrapper):
 
     def step(self, actions, extra_data: Optional[Dict[str, Any]] = None):
         """Step all environments."""
-        actions = torch.from_numpy(0.5 * actions).cuda().clip(-1, 1)
+        actions = torch.from_numpy(0.5 * actions).to(self.env.device).clip(-1, 1)
 
         obs, reward, termination, info = self.env.step(actions)
 
@@ -76,19 +76,16 @@ class mqe_openrl_wrapper(gym.Wrapper):
         return False
 
     def batch_rewards(self, buffer):
-
-        step_count = self.env.reward_buffer["step count"]
+        # the only place where the device-side reward statistics are synced to the host
+        reward_sums, step_count = self.env.reward_stats.pop()
         reward_dict = {"average step reward": 0}
-        for k in self.env.reward_buffer.keys():
-            if k == "step count":
-                continue
-            reward_dict[k] = self.env.reward_buffer[k] / (self.num_envs * step_count)
+        for k in reward_sums.keys():
+            reward_dict[k] = reward_sums[k] / (self.num_envs * max(step_count, 1))
             if hasattr(self.env, "single_agent_reward_scale"):
                 reward_dict[k] *= self.env.single_agent_reward_scale
             if "reward" in k or "punishment" in k:
                 reward_dict["average step reward"] += reward_dict[k]
-            self.env.reward_buffer[k] = 0
-        self.env.reward_buffer["step count"] = 0
+        reward_dict.update(self.env.reward_stats.pop_episode_stats())
         return reward_dict
 
 class MATWrapper(gym.Wrapper):
@@ -15,7 +15,6 @@ setup(
                       'matplotlib',
                       'gym',
                       'debugpy',
-                      'treelib',
                       'tensorboardX',
                       'pettingzoo',]
 )
\ No newline at end of file
@@ -100,6 +100,7 @@ class Go1PushMidCfg(Go1Cfg):
     # rewards weight setting
     class rewards(Go1Cfg.rewards):
         expanded_ocb_reward = False # if True, the reward will be given based on Circular Arc Interpolation Trajectory
+        ocb_sdf_resolution = None # if set (e.g. 0.01), the OCB normals are read from a cached signed distance grid of this resolution
         class scales:
             target_reward_scale = 0.00325                
             approach_reward_scale = 0.00075